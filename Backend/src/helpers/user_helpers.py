@@ -5,7 +5,10 @@ from datetime import datetime, timezone
 
 from ..models.user_model import User
 
-from ..services.user_notification import create_system_notification
+from ..services.user_notification import create_system_notification_with_db
+from ..services.vehicle_availability_index import availability_index
+from ..services.deadline_scheduler import deadline_scheduler
+from ..services.daily_distance_ledger import daily_distance_ledger
 
 from ..models.ride_model import Ride,RideStatus
 from ..utils.socket_manager import sio
@@ -21,7 +24,7 @@ def cancel_future_rides_for_vehicle(
     current_ride_id: str = None, 
 ):
     db.execute(
-        text("SET session.audit.user_id = :user_id"),
+        text("SELECT set_config('session.audit.user_id', :user_id, false)"),
         {"user_id": str(admin_id) if admin_id else None}
     )
 
@@ -42,7 +45,7 @@ def cancel_future_rides_for_vehicle(
         return {"cancelled": 0, "users": [], "notifications": []}
 
     affected_users = set()
-    notifications_to_emit = []
+    notifications = []
 
     freeze_reason_map = {
         "accident": "תאונה",
@@ -66,22 +69,26 @@ def cancel_future_rides_for_vehicle(
         title = "נסיעה בוטלה"
         message = f"לצערנו הנסיעה שלך בוטלה. {cancellation_reason}"
 
-        notif = create_system_notification(
+        # Written in this session so the rides and their notifications commit together
+        notifications.append(create_system_notification_with_db(
+            db,
             user_id=ride.user_id,
             title=title,
             message=message,
             order_id=ride.id
-        )
-        notifications_to_emit.append({
-            'id': str(notif.id),
-            'user_id': str(notif.user_id),
-            'title': notif.title,
-            'message': notif.message,
-            'notification_type': notif.notification_type.value,
-            'sent_at': notif.sent_at.isoformat(),
-            'order_id': str(ride.id),
-            'seen': False
-        })
+        ))
+
+    db.flush()
+    notifications_to_emit = [{
+        'id': str(notif.id),
+        'user_id': str(notif.user_id),
+        'title': notif.title,
+        'message': notif.message,
+        'notification_type': notif.notification_type.value,
+        'sent_at': notif.sent_at.isoformat(),
+        'order_id': str(notif.order_id),
+        'seen': False
+    } for notif in notifications]
 
     for user_id in affected_users:
         user = db.query(User).filter(User.employee_id == user_id).first()
@@ -90,6 +97,9 @@ def cancel_future_rides_for_vehicle(
             db.add(user)
 
     db.commit()
+    availability_index.sync_rides(rides)
+    deadline_scheduler.sync_rides(rides)
+    daily_distance_ledger.sync_rides(rides)
 
     return {
         "cancelled": len(rides), 
@@ -10,12 +10,25 @@ from fastapi.staticfiles import StaticFiles
 from socketio import ASGIApp
 
 # Utils
-from .utils.audit_log_listener import listen_for_audit_logs
+from .utils.audit_log_listener import audit_listener, start_audit_listener, stop_audit_listener
+from .utils.audit_utils import audit_emit_queue
 from .utils.socket_manager import connect, sio
-from src.utils.scheduler import start_scheduler
+from .utils.socket_pubsub import presence
+from .utils.database import begin_request_scope, end_request_scope
+from .utils.leader_election import leader_election
+from .utils.ride_change_listener import ride_change_listener
+from .utils.schema_upgrades import apply_schema_upgrades
+from .utils.table_versions import TABLE_CHANGES_CHANNEL, bump_all_notified_tables, bump_notified_tables
+from src.utils.scheduler import refresh_usage_rollups_on_leader, scheduler, start_leader_jobs, start_ride_jobstore, stop_leader_jobs
 
 # Services
 from src.services.email_clean_service import EmailService
+from src.services.vehicle_availability_index import availability_index, warm_availability_index
+from src.services.daily_distance_ledger import daily_distance_ledger
+from src.services.city_distances import warm_city_distances
+from src.services.city_gazetteer import warm_city_gazetteer
+from src.services.deadline_scheduler import deadline_scheduler, warm_deadline_scheduler
+from src.services.usage_rollups import USAGE_ROLLUP_DIRTY_CHANNEL
 
 # Schemas
 from src.schemas.vehicle_create_schema import VehicleCreate
@@ -32,7 +45,6 @@ logger = logging.getLogger(__name__)
 
 
 app = FastAPI()
-threading.Thread(target=listen_for_audit_logs, daemon=True).start()
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,7 +60,56 @@ app.include_router(admin_route, prefix="/api", tags=["Admin"])
 app.include_router(inspector_route, prefix="/api", tags=["Inspector"])
 app.include_router(vehicle_route, prefix="/api")
 app.include_router(email_router, prefix="/api", tags=["Emails"])
-start_scheduler()
+
+@app.on_event("startup")
+def warm_caches():
+    apply_schema_upgrades()
+    warm_availability_index()
+    warm_city_distances()
+    warm_city_gazetteer()
+    start_ride_jobstore()
+    presence.heartbeat()
+
+    # Startup hooks run on the server loop; the audit listener lives there
+    audit_listener.bind_loop(asyncio.get_event_loop())
+    audit_emit_queue.bind_loop(asyncio.get_event_loop())
+
+    # Every worker keeps its ride caches in step with the other workers' writes
+    ride_change_listener.on_change(availability_index.apply_changes)
+    ride_change_listener.on_change(daily_distance_ledger.apply_changes)
+    ride_change_listener.on_resync(warm_availability_index)
+    ride_change_listener.on_resync(daily_distance_ledger.clear)
+    # ...and the table versions the analytics cache checks
+    ride_change_listener.on_notify(TABLE_CHANGES_CHANNEL, bump_notified_tables)
+    ride_change_listener.on_resync(bump_all_notified_tables)
+    # The leader's deadline queue follows the same changes (a no-op elsewhere)
+    ride_change_listener.on_change(deadline_scheduler.apply_changes)
+    ride_change_listener.on_notify(TABLE_CHANGES_CHANNEL, deadline_scheduler.apply_table_changes)
+    ride_change_listener.on_resync(warm_deadline_scheduler)
+    # The leader refreshes the usage rollups when rides mark them dirty
+    ride_change_listener.on_notify(USAGE_ROLLUP_DIRTY_CHANNEL, refresh_usage_rollups_on_leader)
+    ride_change_listener.bind_loop(asyncio.get_event_loop())
+    ride_change_listener.start()
+
+    # Scheduled jobs and the audit LISTEN loop run in one worker only
+    leader_election.on_promote(start_leader_jobs)
+    leader_election.on_promote(start_audit_listener)
+    leader_election.on_demote(stop_leader_jobs)
+    leader_election.on_demote(stop_audit_listener)
+    # Pick up ride jobs that other workers added to the shared job store
+    leader_election.on_heartbeat(scheduler.wakeup)
+    leader_election.start()
+
+
+@app.on_event("shutdown")
+def release_leadership():
+    # Closing the lock connection lets another worker take over right away
+    leader_election.stop()
+    ride_change_listener.stop()
+
+@app.on_event("shutdown")
+async def flush_socket_events():
+    await sio.event_buffer.close()
 
 @app.get("/")
 def root():
@@ -56,16 +117,13 @@ def root():
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    response = await call_next(request)
+    scope_token = begin_request_scope()
+    try:
+        response = await call_next(request)
+    finally:
+        end_request_scope(scope_token)
     return response
 
-@sio.on("join")
-async def handle_join(sid, data):
-    user_id = data.get("user_id")
-    if user_id:
-        await sio.enter_room(sid, user_id)
-
-
 
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Integer, JSON, Boolean
+from sqlalchemy import Column, String, DateTime, Integer, JSON, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID 
 from uuid import uuid4
 from datetime import datetime
@@ -12,9 +12,15 @@ class AuditLog(Base):
     entity_type = Column(String, nullable=False)
     entity_id = Column(String, nullable=True)
     change_data = Column(JSON, nullable=True)  
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Part of the key because audit_logs is partitioned by created_at
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
     changed_by = Column(UUID(as_uuid=True), nullable=False) 
     checkbox_value = Column(Boolean, nullable=False)
     inspected_at = Column(DateTime, nullable=False)
     # inspector_id = Column(UUID(as_uuid=True), nullable=True)
-    notes = Column(String, nullable=True)    
\ No newline at end of file
+    notes = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_audit_logs_created_at_id", "created_at", "id"),
+        Index("ix_audit_logs_entity", "entity_type", "entity_id"),
+    )
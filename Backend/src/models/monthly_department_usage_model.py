@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+
+from src.models.base import Base
+
+class MonthlyDepartmentUsage(Base):
+    __tablename__ = 'monthly_department_usage'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    # Department of the riders; NULL for riders without a department
+    department_id = Column(UUID(as_uuid=True), ForeignKey("departments.id", ondelete="CASCADE"), nullable=True)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+
+    total_rides = Column(Integer, default=0)
+    total_km = Column(Float, default=0)
+    usage_hours = Column(Float, default=0)
+    vehicles_used = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('department_id', 'year', 'month', name='unique_monthly_department_usage'),
+    )
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, ForeignKey, TIMESTAMP
+from sqlalchemy import Column, ForeignKey, TIMESTAMP, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -7,6 +7,9 @@ from src.models.base import Base
 
 class NoShowEvent(Base):
     __tablename__ = "no_show_events"
+    __table_args__ = (
+        Index("ix_no_show_events_user_occurred_at", "user_id", "occurred_at"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.employee_id"))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Text, DateTime, Enum, ForeignKey, Boolean
+from sqlalchemy import Column, Text, DateTime, Enum, ForeignKey, Boolean, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from src.models.base import Base
@@ -23,6 +23,17 @@ class Notification(Base):
     vehicle_id = Column(UUID(as_uuid=True), ForeignKey("vehicles.id"), nullable=True)
     relevant_user_id = Column(UUID(as_uuid=True), ForeignKey("users.employee_id"), nullable=True)
     seen = Column(Boolean, nullable=False, default=False)
+    # Set for notifications that must only be sent once (see notify_once)
+    dedupe_key = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "uq_notifications_dedupe_key",
+            "dedupe_key",
+            unique=True,
+            postgresql_where=text("dedupe_key IS NOT NULL"),
+        ),
+    )
 
 
     ride = relationship("Ride", back_populates="notifications", lazy="joined", uselist=False)
@@ -1,7 +1,6 @@
-import pandas as pd
 from datetime import datetime, time, date, timedelta, timezone
 from typing import Optional, List, Dict, Any
-from uuid import UUID
+from uuid import UUID, uuid4
 import calendar
 
 
@@ -28,9 +27,14 @@ from ..helpers.department_helpers import get_or_create_vip_department
 from src.schemas.ride_requirements_schema import RideRequirementOut, RideRequirementUpdate 
 from src.services.ride_requirements import get_latest_requirement,create_requirement, update_requirement
 # Utils
+from ..utils.analytics_cache import analytics_cache
+from ..utils.audit_log_listener import audit_listener
 from ..utils.auth import get_current_user, token_check, role_check
-from ..utils.database import get_db
-from ..utils.socket_manager import sio
+from ..utils.database import async_session_scope, get_db, get_pool_metrics
+from ..utils.leader_election import get_scheduler_metrics
+from ..utils.socket_manager import emit_event, sio
+from ..utils.socket_pubsub import fanout_metrics, presence
+from ..utils.spreadsheet_ingest import SpreadsheetError
 
 
 # Services
@@ -49,11 +53,15 @@ from src.services.admin_rides_service import (
     get_critical_issue_by_id
 )
 from src.services.admin_user_service import create_user_by_admin, get_users_service
-from src.services.audit_service import get_all_audit_logs
+from src.services.audit_service import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, get_all_audit_logs, get_audit_logs_page
 from src.services.license_service import upload_license_file_service, check_expired_licenses
 from src.services.user_data import get_user_by_id, get_all_users
-from ..services.admin_rides_service import get_critical_trip_issues, get_current_month_vehicle_usage, get_vehicle_usage_stats
+from ..services.admin_rides_service import get_critical_trip_issues, get_current_month_vehicle_usage, get_vehicle_usage_stats, get_department_usage_stats
+from ..services.admin_rides_service import get_top_used_vehicles as get_top_used_vehicles_stats
 from ..services.user_notification import send_admin_odometer_notification
+from ..services.deadline_scheduler import deadline_scheduler
+from ..services.mileage_import import ingest_mileage_upload
+from ..services.no_show_service import no_show_counts_per_user, no_show_totals
 from ..services.vehicle_service import (
     archive_vehicle_by_id,
     get_available_vehicles_for_ride_by_id,
@@ -61,7 +69,7 @@ from ..services.vehicle_service import (
 )
 
 # Schemas
-from src.schemas.audit_schema import AuditLogsSchema
+from src.schemas.audit_schema import AuditLogsPageSchema, AuditLogsSchema
 from src.schemas.department_schema import DepartmentCreate, DepartmentUpdate, DepartmentOut
 from src.schemas.order_card_item import OrderCardItem
 from src.schemas.ride_dashboard_item import RideDashboardItem
@@ -325,19 +333,20 @@ async def edit_user_by_id_route(
         raise HTTPException(status_code=500, detail=f"Failed to update user: {str(e)}")
 
     db.refresh(user)
-    await sio.emit('user_block_status_updated', {
+    deadline_scheduler.sync_user(user)
+    await emit_event('user_block_status_updated', {
         "id": str(user.employee_id),
         "is_blocked": user.is_blocked,
         "block_expires_at": user.block_expires_at.isoformat() if user.block_expires_at else None,
         "block_reason": user.block_reason or None
-    })
+    }, user_id=user.employee_id)
 
-    await sio.emit('user_license_updated', {
+    await emit_event('user_license_updated', {
         "id": str(user.employee_id),
         "license_expiry_date": user.license_expiry_date.isoformat() if user.license_expiry_date else None,
         "has_government_license": bool(user.has_government_license),
         "license_file_url": user.license_file_url or ""
-    })
+    }, user_id=user.employee_id)
 
     db.execute(text("SET session.audit.user_id = DEFAULT"))
     return user
@@ -348,44 +357,24 @@ def get_roles():
     return [role.value for role in UserRole]
 
 @router.get("/no-show-events/count")
-def get_no_show_events_count_per_user(db: Session = Depends(get_db)):
-    results = (
-        db.query(
-            User.employee_id,
-            User.username,
-            User.email,
-            User.role,
-            Vehicle.plate_number
-        )
-        .join(NoShowEvent, User.employee_id == NoShowEvent.user_id)
-        .join(Ride, Ride.id == NoShowEvent.ride_id)
-        .join(Vehicle, Vehicle.id == Ride.vehicle_id)
-        .all()
-    )
-
-    user_data = {}
-
-    for row in results:
-        emp_id = row.employee_id
-        if emp_id not in user_data:
-            user_data[emp_id] = {
-                "employee_id": emp_id,
-                "name": row.username,
-                "email": row.email,
-                "role": row.role,
-                "no_show_count": 0,
-                "plate_numbers": set()
+def get_no_show_events_count_per_user(
+    min_count: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db)
+):
+    users = no_show_counts_per_user(db, min_count=min_count)
+    return {
+        "users": [
+            {
+                "employee_id": user["employee_id"],
+                "name": user["username"],
+                "email": user["email"],
+                "role": user["role"],
+                "no_show_count": user["no_show_count"],
+                "plate_numbers": user["plate_numbers"],
             }
-
-        user_data[emp_id]["no_show_count"] += 1
-        user_data[emp_id]["plate_numbers"].add(row.plate_number)
-
-    formatted_users = []
-    for data in user_data.values():
-        data["plate_numbers"] = list(data["plate_numbers"])
-        formatted_users.append(data)
-
-    return {"users": formatted_users}
+            for user in users
+        ]
+    }
 
 
 @router.get("/no-show-events/recent")
@@ -570,11 +559,13 @@ async def send_admin_notification_simple_route(db: Session = Depends(get_db)):
 
     all_notifications = []
 
-    for vehicle in vehicles:
-        notifications = await send_admin_odometer_notification(vehicle.id, vehicle.mileage)
+    # One session for every vehicle instead of one each
+    async with async_session_scope() as async_db:
+        for vehicle in vehicles:
+            notifications = await send_admin_odometer_notification(vehicle.id, vehicle.mileage, async_db)
 
-        if notifications:
-            all_notifications.extend(notifications)
+            if notifications:
+                all_notifications.extend(notifications)
 
     if not all_notifications:
         raise HTTPException(status_code=204, detail="No admins found or odometer below threshold for all vehicles.")
@@ -675,7 +666,7 @@ def vehicle_status_summary(
     db: Session = Depends(get_db),
     type: Optional[str] = Query(None, alias="type")
 ):
-    try:
+    def compute(db: Session) -> list:
         query = db.query(Vehicle.status, func.count(Vehicle.id).label("count"))
 
         if type:
@@ -683,7 +674,12 @@ def vehicle_status_summary(
 
         result = query.group_by(Vehicle.status).all()
 
-        summary = [{"status": row.status.value, "count": row.count} for row in result]
+        return [{"status": row.status.value, "count": row.count} for row in result]
+
+    try:
+        summary = analytics_cache.get_or_compute(
+            "analytics/vehicle-status-summary", {"type": type}, ("vehicles",), compute, db
+        )
         return JSONResponse(content=summary)
 
     except Exception as e:
@@ -691,12 +687,17 @@ def vehicle_status_summary(
 
 @router.get("/analytics/ride-status-summary")
 def ride_status_summary(status: str = None, db: Session = Depends(get_db)):
-    try:
+    def compute(db: Session) -> list:
         query = db.query(Ride.status, func.count(Ride.id).label("count"))
         if status:
             query = query.filter(Ride.status == status)
         result = query.group_by(Ride.status).all()
-        summary = [{"status": row.status.value, "count": row.count} for row in result]
+        return [{"status": row.status.value, "count": row.count} for row in result]
+
+    try:
+        summary = analytics_cache.get_or_compute(
+            "analytics/ride-status-summary", {"status": status}, ("rides",), compute, db
+        )
         return JSONResponse(content=summary)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching ride summary: {str(e)}")
@@ -719,6 +720,38 @@ def get_all_audit_logs_route(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
+@router.get("/audit-logs", response_model=AuditLogsPageSchema)
+def get_audit_logs_page_route(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
+    problematic_only: bool = Query(False, alias="problematicOnly"),
+    entity_type: Optional[str] = None,
+    action: Optional[str] = None,
+    changed_by: Optional[UUID] = None,
+    q: Optional[str] = None,
+    db: Session = Depends(get_db),
+    payload: dict = Depends(token_check)
+):
+    try:
+        return get_audit_logs_page(
+            db,
+            limit=limit,
+            cursor=cursor,
+            from_date=from_date,
+            to_date=to_date,
+            problematic_only=problematic_only,
+            entity_type=entity_type,
+            action=action,
+            changed_by=changed_by,
+            search=q,
+        )
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
 @router.get("/vehicles/usage-stats")
 def vehicle_usage_stats(
     range: str = Query("month"),
@@ -750,30 +783,29 @@ def vehicle_usage_stats(
         raise HTTPException(status_code=500, detail=f"Failed to fetch monthly stats: {str(e)}")
 
 
+@router.get("/departments/usage-stats")
+def department_usage_stats(
+    year: int = Query(..., ge=2000, le=2100),
+    month: int = Query(..., ge=1, le=12),
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    role_check(["admin"], token)
+    try:
+        stats = get_department_usage_stats(db, year, month)
+        return {
+            "year": year,
+            "month": month,
+            "stats": stats
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch department usage stats: {str(e)}")
+
+
 @router.get("/analytics/top-used-vehicles")
 def get_top_used_vehicles(db: Session = Depends(get_db)):
     try:
-        results = (
-            db.query(
-                Vehicle.plate_number,
-                Vehicle.vehicle_model,
-                func.count(Ride.id).label("ride_count")
-            )
-            .join(Ride, Ride.vehicle_id == Vehicle.id)
-            .group_by(Vehicle.plate_number, Vehicle.vehicle_model)
-            .order_by(func.count(Ride.id).desc())
-            .limit(10)
-            .all()
-        )
-
-        return [
-            {
-                "plate_number": r.plate_number,
-                "vehicle_model": r.vehicle_model,
-                "ride_count": r.ride_count
-            }
-            for r in results
-        ]
+        return get_top_used_vehicles_stats(db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"שגיאה בעת טעינת נסיעות לפי רכב: {str(e)}")
 
@@ -822,6 +854,38 @@ def upload_user_license_route(
     return upload_license_file_service(db=db, user_id=user_id, file=file)
 
 
+@router.get("/admin/db-pool-metrics")
+def db_pool_metrics(token: str = Depends(oauth2_scheme)):
+    role_check(["admin"], token)
+    return get_pool_metrics()
+
+
+@router.get("/admin/scheduler-metrics")
+def scheduler_metrics(token: str = Depends(oauth2_scheme)):
+    role_check(["admin"], token)
+    return get_scheduler_metrics()
+
+
+@router.get("/admin/analytics-cache-metrics")
+def analytics_cache_metrics(token: str = Depends(oauth2_scheme)):
+    role_check(["admin"], token)
+    return analytics_cache.snapshot()
+
+
+@router.get("/admin/socket-metrics")
+async def socket_metrics(token: str = Depends(oauth2_scheme)):
+    role_check(["admin"], token)
+    return {
+        "fanout": fanout_metrics.snapshot(),
+        "buffer": sio.event_buffer.snapshot(),
+        "audit_listener": audit_listener.snapshot(),
+        "presence": {
+            **presence.snapshot(),
+            "online_users": len(await presence.online_user_ids()),
+        },
+    }
+
+
 @router.post("/admin/force-expired-license-check")
 def force_license_check(db: Session = Depends(get_db)):
     return check_expired_licenses(db)
@@ -1029,75 +1093,37 @@ def get_no_show_statistics(
     page_size: int = Query(10, ge=1, le=100, description="Page size for pagination"),
     db: Session = Depends(get_db),
 ):
-    
+    def compute(db: Session) -> NoShowStatsResponse:
+        totals = no_show_totals(db, from_date=from_date, to_date=to_date)
+        top_users = no_show_counts_per_user(
+            db,
+            from_date=from_date,
+            to_date=to_date,
+            limit=page_size,
+            offset=(page - 1) * page_size,
+        )
 
-    query = db.query(NoShowEvent)
-    if from_date:
-        query = query.filter(NoShowEvent.occurred_at >= from_date)
-    if to_date:
-        query = query.filter(NoShowEvent.occurred_at <= to_date)
-
-    total_no_show_events = query.count()
-    unique_no_show_users = query.with_entities(NoShowEvent.user_id).distinct().count()
-
-    completed_query = db.query(Ride).filter(
-        Ride.status == "completed",
-        Ride.completion_date != None)
-    if from_date:
-        completed_query = completed_query.filter(Ride.completion_date >= from_date)
-    if to_date:
-        completed_query = completed_query.filter(Ride.completion_date <= to_date)
-
-    completed_rides_count = completed_query.count()
-
-    offset = (page - 1) * page_size
-    top_users_query = (
-    db.query(
-        NoShowEvent.user_id,
-        func.concat(User.first_name, ' ', User.last_name).label("name"),
-        Department.id.label("department_id"),
-        func.count(NoShowEvent.id).label("count"),
-        User.email,
-        User.role,
-        User.employee_id,
-    )
-    .outerjoin(User, User.employee_id == NoShowEvent.user_id)
-    .outerjoin(Department, Department.id == User.department_id)
-    .filter(NoShowEvent.occurred_at >= from_date if from_date else True)
-    .filter(NoShowEvent.occurred_at <= to_date if to_date else True)
-    .group_by(
-        NoShowEvent.user_id,
-        User.first_name,
-        User.last_name,
-        Department.id,
-        User.email,
-        User.role,
-        User.employee_id,
-    )
-    .order_by(desc("count"))
-    .offset(offset)
-    .limit(page_size)
-    .all()
-)
+        top_no_show_users = [
+            TopNoShowUser(
+                user_id=str(user["employee_id"]),
+                name=user["full_name"],
+                department_id=user["department_id"],
+                count=user["no_show_count"],
+                email=user["email"],
+                role=user["role"],
+                employee_id=str(user["employee_id"]),
+            )
+            for user in top_users
+        ]
 
-    top_no_show_users = [
-    TopNoShowUser(
-        user_id=str(row.employee_id),
-        name=row.name,
-        department_id=row.department_id,
-        count=row.count,
-        email=row.email,
-        role=row.role,
-        employee_id=str(row.employee_id),
-    )
-    for row in top_users_query
-]
-
-    return NoShowStatsResponse(
-        total_no_show_events=total_no_show_events,
-        unique_no_show_users=unique_no_show_users,
-        completed_rides_count=completed_rides_count,
-        top_no_show_users=top_no_show_users
+        return NoShowStatsResponse(**totals, top_no_show_users=top_no_show_users)
+
+    return analytics_cache.get_or_compute(
+        "statistics/no-show",
+        {"from_date": from_date, "to_date": to_date, "page": page, "page_size": page_size},
+        ("no_show_events", "users", "departments", "rides"),
+        compute,
+        db,
     )
 
 
@@ -1131,40 +1157,49 @@ def get_ride_start_time_statistics(
             year -= 1
         from_date = date(year, month, 1)
 
-    start_dt = datetime.combine(from_date, time.min)
-    end_dt = datetime.combine(to_date, time.max)
-
-    base_query = db.query(Ride).filter(
-        Ride.start_datetime >= start_dt,
-        Ride.start_datetime <= end_dt,
-    )
-    total_rides = base_query.count()
-
-    hour_col = func.extract("hour", Ride.start_datetime).label("hour")
+    def compute(db: Session) -> RideStartTimeStatsResponse:
+        start_dt = datetime.combine(from_date, time.min)
+        end_dt = datetime.combine(to_date, time.max)
 
-    grouped = (
-        db.query(hour_col, func.count(Ride.id).label("ride_count"))
-        .filter(
+        base_query = db.query(Ride).filter(
             Ride.start_datetime >= start_dt,
             Ride.start_datetime <= end_dt,
         )
-        .group_by(hour_col)
-        .order_by(hour_col)
-        .all()
-    )
+        total_rides = base_query.count()
 
-    counts_by_hour = {int(row.hour): row.ride_count for row in grouped}
+        hour_col = func.extract("hour", Ride.start_datetime).label("hour")
 
-    buckets = [
-        RideStartTimeBucket(hour=h, ride_count=counts_by_hour.get(h, 0))
-        for h in range(24)
-    ]
+        grouped = (
+            db.query(hour_col, func.count(Ride.id).label("ride_count"))
+            .filter(
+                Ride.start_datetime >= start_dt,
+                Ride.start_datetime <= end_dt,
+            )
+            .group_by(hour_col)
+            .order_by(hour_col)
+            .all()
+        )
+
+        counts_by_hour = {int(row.hour): row.ride_count for row in grouped}
+
+        buckets = [
+            RideStartTimeBucket(hour=h, ride_count=counts_by_hour.get(h, 0))
+            for h in range(24)
+        ]
 
-    return RideStartTimeStatsResponse(
-        from_date=from_date,
-        to_date=to_date,
-        total_rides=total_rides,
-        buckets=buckets,
+        return RideStartTimeStatsResponse(
+            from_date=from_date,
+            to_date=to_date,
+            total_rides=total_rides,
+            buckets=buckets,
+        )
+
+    return analytics_cache.get_or_compute(
+        "statistics/ride-start-time",
+        {"from_date": from_date, "to_date": to_date},
+        ("rides",),
+        compute,
+        db,
     )
 
 @router.get("/statistics/purpose-of-travel", response_model=PurposeOfTravelStatsResponse)
@@ -1207,111 +1242,121 @@ def get_purpose_of_travel_statistics(
             detail="from_year/from_month cannot be after to_year/to_month.",
         )
 
-    from_date = date(from_year, from_month, 1)
+    def compute(db: Session) -> PurposeOfTravelStatsResponse:
+        from_date = date(from_year, from_month, 1)
 
-    last_day_of_to_month = calendar.monthrange(to_year, to_month)[1]
-    to_date = date(to_year, to_month, last_day_of_to_month)
+        last_day_of_to_month = calendar.monthrange(to_year, to_month)[1]
+        to_date = date(to_year, to_month, last_day_of_to_month)
 
-    start_dt = datetime.combine(from_date, datetime.min.time())
-    end_dt = datetime.combine(to_date, datetime.max.time())
+        start_dt = datetime.combine(from_date, datetime.min.time())
+        end_dt = datetime.combine(to_date, datetime.max.time())
 
-    month_start = func.date_trunc("month", Ride.start_datetime).label("month_start")
+        month_start = func.date_trunc("month", Ride.start_datetime).label("month_start")
 
-    grouped = (
-        db.query(
-            month_start,
-            Ride.ride_type,
-            func.count(Ride.id).label("count"),
-        )
-        .filter(
-            Ride.start_datetime >= start_dt,
-            Ride.start_datetime <= end_dt,
+        grouped = (
+            db.query(
+                month_start,
+                Ride.ride_type,
+                func.count(Ride.id).label("count"),
+            )
+            .filter(
+                Ride.start_datetime >= start_dt,
+                Ride.start_datetime <= end_dt,
+            )
+            .group_by(month_start, Ride.ride_type)
+            .order_by(month_start)
+            .all()
         )
-        .group_by(month_start, Ride.ride_type)
-        .order_by(month_start)
-        .all()
-    )
 
-    def iter_months(y1: int, m1: int, y2: int, m2: int):
-        y, m = y1, m1
-        while (y < y2) or (y == y2 and m <= m2):
-            yield y, m
-            if m == 12:
-                y += 1
-                m = 1
-            else:
-                m += 1
-
-    months_map = {}
-    for y, m in iter_months(from_year, from_month, to_year, to_month):
-        months_map[(y, m)] = {
-            "administrative": 0,
-            "operational": 0,
-        }
-
-    for row in grouped:
-        dt = row.month_start
-        y = dt.year
-        m = dt.month
-
-        if (y, m) not in months_map:
+        def iter_months(y1: int, m1: int, y2: int, m2: int):
+            y, m = y1, m1
+            while (y < y2) or (y == y2 and m <= m2):
+                yield y, m
+                if m == 12:
+                    y += 1
+                    m = 1
+                else:
+                    m += 1
+
+        months_map = {}
+        for y, m in iter_months(from_year, from_month, to_year, to_month):
             months_map[(y, m)] = {
                 "administrative": 0,
                 "operational": 0,
             }
 
-        ride_type_value = (
-            row.ride_type.value if hasattr(row.ride_type, "value") else str(row.ride_type)
-        )
+        for row in grouped:
+            dt = row.month_start
+            y = dt.year
+            m = dt.month
 
-        if ride_type_value == "administrative":
-            months_map[(y, m)]["administrative"] += row.count
-        elif ride_type_value == "operational":
-            months_map[(y, m)]["operational"] += row.count
-        else:
-            continue
+            if (y, m) not in months_map:
+                months_map[(y, m)] = {
+                    "administrative": 0,
+                    "operational": 0,
+                }
 
-    months_output: List[MonthlyPurposeBreakdown] = []
-    total_rides_all = 0
+            ride_type_value = (
+                row.ride_type.value if hasattr(row.ride_type, "value") else str(row.ride_type)
+            )
 
-    for (y, m) in sorted(months_map.keys()):
-        admin_count = months_map[(y, m)]["administrative"]
-        op_count = months_map[(y, m)]["operational"]
-        total = admin_count + op_count
-        total_rides_all += total
+            if ride_type_value == "administrative":
+                months_map[(y, m)]["administrative"] += row.count
+            elif ride_type_value == "operational":
+                months_map[(y, m)]["operational"] += row.count
+            else:
+                continue
 
-        if total > 0:
-            admin_pct = round(admin_count * 100.0 / total, 1)
-            op_pct = round(op_count * 100.0 / total, 1)
-        else:
-            admin_pct = 0.0
-            op_pct = 0.0
-
-        months_output.append(
-            MonthlyPurposeBreakdown(
-                year=y,
-                month=m,
-                month_label=f"{m}/{y}", 
-                administrative_count=admin_count,
-                operational_count=op_count,
-                total_rides=total,
-                administrative_percentage=admin_pct,
-                operational_percentage=op_pct,
+        months_output: List[MonthlyPurposeBreakdown] = []
+        total_rides_all = 0
+
+        for (y, m) in sorted(months_map.keys()):
+            admin_count = months_map[(y, m)]["administrative"]
+            op_count = months_map[(y, m)]["operational"]
+            total = admin_count + op_count
+            total_rides_all += total
+
+            if total > 0:
+                admin_pct = round(admin_count * 100.0 / total, 1)
+                op_pct = round(op_count * 100.0 / total, 1)
+            else:
+                admin_pct = 0.0
+                op_pct = 0.0
+
+            months_output.append(
+                MonthlyPurposeBreakdown(
+                    year=y,
+                    month=m,
+                    month_label=f"{m}/{y}", 
+                    administrative_count=admin_count,
+                    operational_count=op_count,
+                    total_rides=total,
+                    administrative_percentage=admin_pct,
+                    operational_percentage=op_pct,
+                )
             )
+
+        return PurposeOfTravelStatsResponse(
+            from_year=from_year,
+            from_month=from_month,
+            to_year=to_year,
+            to_month=to_month,
+            total_rides=total_rides_all,
+            months=months_output,
         )
 
-    return PurposeOfTravelStatsResponse(
-        from_year=from_year,
-        from_month=from_month,
-        to_year=to_year,
-        to_month=to_month,
-        total_rides=total_rides_all,
-        months=months_output,
+    return analytics_cache.get_or_compute(
+        "statistics/purpose-of-travel",
+        {"from_year": from_year, "from_month": from_month, "to_year": to_year, "to_month": to_month},
+        ("rides",),
+        compute,
+        db,
     )
 
 @router.post("/admin/vehicles/mileage/upload")
 async def upload_mileage_excel(
     file: UploadFile = File(...),
+    upload_id: Optional[str] = Form(None),
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme),
     payload: dict = Depends(token_check)
@@ -1319,90 +1364,21 @@ async def upload_mileage_excel(
     user_id_from_token = payload.get("user_id") or payload.get("sub")
 
     role_check(["admin"], token)
-    db.execute(text("SET session.audit.user_id = :user_id"), {"user_id": str(user_id_from_token)})
 
+    # Progress is sent to the uploader as upload_progress with this id
+    upload_id = upload_id or str(uuid4())
     try:
-        if not file.filename.lower().endswith(".xlsx"):
-            raise HTTPException(status_code=400, detail="יש להעלות קובץ אקסל בפורמט ‎.xlsx בלבד")
-
-        try:
-            df = pd.read_excel(file.file)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"לא ניתן לקרוא את קובץ האקסל: {e}")
-
-        df.columns = [str(c).strip() for c in df.columns]
-        df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
-
-        required_columns = {"Vehicle ID", "Vehicle Name", "Mileage"}
-        missing_columns = required_columns - set(df.columns)
-
-        if missing_columns:
-            raise HTTPException(
-                status_code=400,
-                detail=f"חסרות עמודות חובה בקובץ האקסל: {', '.join(sorted(missing_columns))}. "
-            )
-
-        success = []
-        errors = []
-
-        for index, row in df.iterrows():
-            row_number = index + 2
-
-            name = str(row.get("Vehicle Name", "")).strip() or "Unknown"
-
-            raw_vehicle_id = row.get("Vehicle ID", None)
-            if raw_vehicle_id is None or (isinstance(raw_vehicle_id, float) and pd.isna(raw_vehicle_id)):
-                errors.append({"row": row_number, "error": "חסר Vehicle ID בשורה", "name": name})
-                continue
-
-            raw_vehicle_id_str = str(raw_vehicle_id).strip()
-            try:
-                vehicle_id = UUID(raw_vehicle_id_str)
-            except Exception:
-                errors.append({"row": row_number, "error": f"Vehicle ID לא תקין: {raw_vehicle_id_str}", "name": name})
-                continue
-
-            raw_mileage = row.get("Mileage", None)
-            if raw_mileage is None or (isinstance(raw_mileage, float) and pd.isna(raw_mileage)):
-                errors.append({"row": row_number, "vehicle_id": str(vehicle_id), "error": "חסר ערך Mileage בשורה", "name": name})
-                continue
-
-            try:
-                mileage_float = float(raw_mileage)
-            except Exception:
-                errors.append({"row": row_number, "vehicle_id": str(vehicle_id), "error": f"ערך Mileage לא מספרי: {raw_mileage}", "name": name})
-                continue
-
-            if mileage_float < 0:
-                errors.append({"row": row_number, "vehicle_id": str(vehicle_id), "error": f"ערך Mileage לא יכול להיות שלילי: {mileage_float}", "name": name})
-                continue
-
-            mileage_int = int(mileage_float)
-
-            vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
-            if not vehicle:
-                errors.append({"row": row_number, "vehicle_id": str(vehicle_id), "error": "Vehicle not found", "name": name})
-                continue
-
-            vehicle.mileage = mileage_int
-            vehicle.mileage_last_updated = datetime.utcnow()
-
-            success.append({
-                "row": row_number,
-                "vehicle_id": str(vehicle_id),
-                "name": name,
-                "new_mileage": mileage_int
-            })
-
-        db.commit()
-
-        return {"updated": success, "errors": errors}
+        success, errors = await ingest_mileage_upload(
+            db, file.file, file.filename or "", user_id_from_token, upload_id
+        )
+    except SpreadsheetError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    finally:
-        db.execute(text("SET session.audit.user_id = DEFAULT"))
+    return {"upload_id": upload_id, "updated": success, "errors": errors}
 
 
-    
 @router.patch("/vehicles/{vehicle_id}/mileage")
 def manual_mileage_edit(
     vehicle_id: UUID = Path(..., description="Vehicle UUID"),
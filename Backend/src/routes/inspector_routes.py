@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.utils.database import get_db
+from src.utils.database import get_db, get_async_db
 from src.utils.auth import get_current_user, role_check
 
 from src.schemas.check_vehicle_schema import VehicleInspectionSchema
@@ -16,7 +17,7 @@ router = APIRouter()
 async def submit_inspection(
     request: Request,
     data: VehicleInspectionSchema,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     token = request.headers.get("Authorization")
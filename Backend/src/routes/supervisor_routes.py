@@ -5,15 +5,16 @@ from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi import status as fastapi_status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from ..models.user_model import User
 
 # Utils
 from ..utils.auth import get_current_user, identity_check, role_check, supervisor_check, token_check
-from ..utils.database import get_db
+from ..utils.database import get_db, get_async_db
 from ..utils.scheduler import schedule_ride_start
-from ..utils.socket_manager import sio
+from ..utils.socket_manager import emit_event
 from ..utils.time_utils import is_time_in_blocked_window
 
 # Services
@@ -61,7 +62,7 @@ def get_department_specific_order_route(department_id: UUID, order_id: UUID, db:
     return order
 
 @router.patch("/orders/{department_id}/{order_id}/update/{status}")
-async def edit_order_status_route(department_id: UUID, order_id: UUID, status: str, db: Session = Depends(get_db),payload: dict = Depends(token_check)):
+async def edit_order_status_route(department_id: UUID, order_id: UUID, status: str, db: AsyncSession = Depends(get_async_db),payload: dict = Depends(token_check)):
     user_id = payload.get("user_id") or payload.get("sub")
     return await edit_order_status(department_id, order_id, status,user_id, db)
 
@@ -71,12 +72,12 @@ async def edit_order_status_route(department_id: UUID, order_id: UUID, status: s
 async def create_order(
     user_id: UUID,
     ride_request: RideCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: str = Depends(oauth2_scheme)
 ):
     role_check(allowed_roles=["supervisor", "admin"], token=token)
     identity_check(user_id=str(user_id), token=token)
-    check_department_assignment(db, user_id)
+    await db.run_sync(lambda session: check_department_assignment(session, user_id))
 
     try:
         new_ride = await create_supervisor_ride(db, user_id, ride_request)
@@ -113,18 +114,10 @@ def freeze_vehicle(request: FreezeVehicleRequest, db: Session = Depends(get_db),
     return freeze_vehicle_service(db, request.vehicle_id, request.reason, user_id)
 
 @router.post("/rides/{ride_id}/start")
-async def start_ride_route(ride_id: UUID, db: Session = Depends(get_db)):
+async def start_ride_route(ride_id: UUID, db: AsyncSession = Depends(get_async_db)):
     try:
+        # start_ride emits the ride and vehicle status updates
         ride, vehicle = await start_ride(db, ride_id)
-       
-        await sio.emit("ride_status_updated", {
-            "ride_id": str(ride.id),
-            "new_status": ride.status.value
-        })
-        await sio.emit("vehicle_status_updated", {
-            "id": str(vehicle.id),
-            "status": vehicle.status.value
-        })
 
         return {
             "message": "Ride started, vehicle marked as in use",
@@ -160,7 +153,7 @@ async def mark_notification_seen(
     notification.seen = True
     db.commit()
 
-    await sio.emit("notification_seen", {"notification_id": str(notification.id), "user_id": str(user_id)})
+    await emit_event("notification_seen", {"notification_id": str(notification.id), "user_id": str(user_id)}, user_id=user_id)
 
     return {"message": "Notification marked as seen"}
 
@@ -180,6 +173,6 @@ async def mark_all_notifications_seen(
     db.commit()
 
     if updated_count > 0:
-        await sio.emit("notifications_marked_seen", {"user_id": str(user_id)})
+        await emit_event("notifications_marked_seen", {"user_id": str(user_id)}, user_id=user_id)
 
     return {"message": f"{updated_count} notifications marked as seen"}
\ No newline at end of file
@@ -11,6 +11,7 @@ from fastapi import status as fastapi_status
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy import text, cast
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, aliased
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 
@@ -24,14 +25,13 @@ from ..schemas.ride_requirements_schema import RideRequirementOut
 from ..services.ride_requirements import get_latest_requirement
 from ..schemas.ride_requirements_confirm import RideRequirementConfirmationIn
 from ..services.ride_requirements_confirmation import create_or_update_confirmation
-from apscheduler.jobstores.base import JobLookupError
 
 # Utils
-from ..utils.database import get_db
+from ..utils.database import get_db, get_async_db
 from ..utils.auth import role_check, identity_check, get_current_user, hash_password
-from ..utils.socket_manager import sio, emit_order_deleted, emit_order_updated
+from ..utils.socket_manager import sio, emit_new_ride_request, emit_order_deleted, emit_order_updated
 from ..utils.socket_utils import convert_decimal
-from ..utils.scheduler import schedule_ride_start, scheduler
+from ..utils.scheduler import cancel_ride_jobs, schedule_ride_start
 from ..utils.time_utils import is_time_in_blocked_window
 
 # Services
@@ -39,14 +39,19 @@ from ..services import register_service, login_service
 from ..services.new_ride_service import check_license_validity, create_ride ,check_department_assignment
 from ..services.user_rides_service import get_future_rides, get_past_rides, get_all_rides, get_ride_by_id, get_archived_rides, cancel_order_in_db
 from ..services.register_service import get_departments
-from ..services.user_notification import get_user_notifications, send_notification_async, create_system_notification, get_supervisor_id, get_user_name
+from ..services.user_notification import get_user_notifications, send_notification_async, create_system_notification, create_system_notification_async, get_supervisor_id, get_user_name
 from ..services.user_edit_ride import patch_order_in_db
 from ..services.user_form import process_completion_form, get_ride_needing_feedback
 from ..services.auth_service import create_reset_token, verify_reset_token
 from ..services.user_data import get_user_department
-from ..services.city_service import get_cities, get_city, calculate_distance
+from ..services.city_distances import city_distances
+from ..services.city_gazetteer import city_gazetteer
+from ..services.route_ordering import order_stops
 from ..services.ride_reminder_service import schedule_ride_reminder_email
 from ..services.email_clean_service import EmailService
+from ..services.vehicle_availability_index import availability_index
+from ..services.deadline_scheduler import deadline_scheduler
+from ..services.daily_distance_ledger import daily_distance_ledger
 
 # Schemas
 from ..schemas.register_schema import UserCreate
@@ -206,18 +211,18 @@ def get_all_orders(user_id: UUID, status: Optional[RideStatus] = Query(None),
 async def create_order(
     user_id: UUID,
     ride_request: RideCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: str = Depends(oauth2_scheme)
 ):
     role_check(allowed_roles=["employee", "admin"], token=token)
     identity_check(user_id=str(user_id), token=token)
-    check_department_assignment(db, user_id)
+    await db.run_sync(lambda session: check_department_assignment(session, user_id))
 
-    check_license_validity(db, user_id, ride_request.start_datetime)
-    update_user_pending_rebook_status(db, user_id)
+    await db.run_sync(lambda session: check_license_validity(session, user_id, ride_request.start_datetime))
+    await db.run_sync(lambda session: update_user_pending_rebook_status(session, user_id))
 
     try:
-        user = db.query(User).filter(User.employee_id == user_id).first()
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
@@ -228,7 +233,7 @@ async def create_order(
             )
 
         rider_id = ride_request.user_id if ride_request.user_id else user_id
-        rider = db.query(User).filter(User.employee_id == rider_id).first()
+        rider = await db.get(User, rider_id)
         
         if not rider:
             raise HTTPException(status_code=404, detail="Rider not found")
@@ -239,25 +244,27 @@ async def create_order(
             db, user_id, ride_request, license_check_passed=license_check_passed
         )
 
-        requester_name = get_user_name(db, user_id)
-        ride_passenger_name = get_user_name(db, new_ride.user_id)
-        department_id = get_user_department(user_id=user_id, db=db)
+        requester_name = await db.run_sync(lambda session: get_user_name(session, user_id))
+        ride_passenger_name = await db.run_sync(lambda session: get_user_name(session, new_ride.user_id))
+        department_id = await db.run_sync(lambda session: get_user_department(user_id=user_id, db=session))
 
         schedule_ride_start(new_ride.id, new_ride.start_datetime)
 
         target_supervisor_id = new_ride.approving_supervisor
 
         if not target_supervisor_id:
-            target_supervisor_id = get_supervisor_id(user_id, db)
+            target_supervisor_id = await db.run_sync(lambda session: get_supervisor_id(user_id, session))
 
         if target_supervisor_id and str(target_supervisor_id) != str(new_ride.user_id):
-            employee_name = get_user_name(db, new_ride.user_id)
+            employee_name = await db.run_sync(lambda session: get_user_name(session, new_ride.user_id))
 
-            supervisor_notification = create_system_notification(
+            supervisor_notification = await create_system_notification_async(
+                db,
                 user_id=target_supervisor_id,
                 title="בקשת נסיעה ממתינה לאישור",
                 message=f"העובד/ת {employee_name} ביקש/ה נסיעה חדשה הדורשת את אישורך.",
-                order_id=new_ride.id
+                order_id=new_ride.id,
+                emit=False
             )
 
             await sio.emit("new_notification", {
@@ -269,12 +276,12 @@ async def create_order(
                 "sent_at": supervisor_notification.sent_at.isoformat(),
                 "order_id": str(supervisor_notification.order_id),
                 "order_status": new_ride.status
-            })
+            }, room=str(supervisor_notification.user_id))
 
-        vehicle = db.query(Vehicle).filter(Vehicle.id == new_ride.vehicle_id).first()
+        vehicle = await db.get(Vehicle, new_ride.vehicle_id)
         vehicle_model = vehicle.vehicle_model if vehicle else None
 
-        await sio.emit("new_ride_request", {
+        await emit_new_ride_request({
             "ride_id": str(new_ride.id),
             "employee_name": ride_passenger_name,
             "requested_vehicle_model": vehicle_model,
@@ -285,12 +292,10 @@ async def create_order(
             "destination": new_ride.destination,
             "submitted_at": new_ride.submitted_at.isoformat(),
             "department_id": str(department_id),
-        })
+        }, user_id=new_ride.user_id)
 
         if new_ride.user_id != user_id:
-            passenger = db.query(User).filter(
-                User.employee_id == new_ride.user_id
-            ).first()
+            passenger = await db.get(User, new_ride.user_id)
 
             is_department_supervisor = (
                 passenger.role == UserRole.supervisor and
@@ -308,11 +313,13 @@ async def create_order(
                     f"והיא ממתינה לאישור."
                 )
 
-            passenger_notification = create_system_notification(
+            passenger_notification = await create_system_notification_async(
+                db,
                 user_id=new_ride.user_id,
                 title="נסיעה הוזמנה עבורך",
                 message=message,
-                order_id=new_ride.id
+                order_id=new_ride.id,
+                emit=False
             )
 
             await sio.emit("new_notification", {
@@ -324,7 +331,7 @@ async def create_order(
                 "sent_at": passenger_notification.sent_at.isoformat(),
                 "order_id": str(passenger_notification.order_id),
                 "order_status": new_ride.status
-            })
+            }, room=str(passenger_notification.user_id))
 
 
         return new_ride
@@ -437,6 +444,9 @@ async def rebook_ride(
     db.execute(text('SET session "session.audit.user_id" = :user_id'), {"user_id": str(user.employee_id)})
     db.commit()
     db.refresh(updated_ride)
+    availability_index.sync_ride(updated_ride)
+    deadline_scheduler.sync_ride(updated_ride)
+    daily_distance_ledger.sync_ride(updated_ride)
 
     target_supervisor_id = updated_ride.approving_supervisor
     if not target_supervisor_id:
@@ -461,7 +471,7 @@ async def rebook_ride(
             "sent_at": supervisor_notification.sent_at.isoformat(),
             "order_id": str(supervisor_notification.order_id),
             "order_status": updated_ride.status.value
-        })
+        }, room=str(supervisor_notification.user_id))
     
         user_notification = create_system_notification(
                 user_id=updated_ride.user_id,
@@ -479,7 +489,7 @@ async def rebook_ride(
                 "sent_at": user_notification.sent_at.isoformat(),
                 "order_id": str(user_notification.order_id),
                 "order_status": updated_ride.status.value
-            })
+            }, room=str(user_notification.user_id))
         
 
     update_user_pending_rebook_status(db, user.employee_id)
@@ -570,7 +580,8 @@ async def patch_order(
 
     await emit_order_updated(
         ride_id=str(updated_order.id),
-        ride_data=order_data
+        ride_data=order_data,
+        user_id=updated_order.user_id
     )
     return {
         "message": "הנסיעה עודכנה בהצלחה",
@@ -604,7 +615,7 @@ async def send_notification_route(
             "notification_type": notification.notification_type.value,
             "sent_at": notification.sent_at.isoformat(),
             "seen": False
-        })
+        }, room=str(notification.user_id))
 
         return {"message": "Notification sent successfully", "notification": notification}
 
@@ -643,7 +654,8 @@ async def delete_order(order_id: UUID, db: Session = Depends(get_db), current_us
             if department_id:
                 await emit_order_deleted(
                     ride_id=str(order_id),
-                    department_id=department_id
+                    department_id=department_id,
+                    user_id=ride.user_id
                 )
 
         if supervisor_id and notif:
@@ -659,12 +671,12 @@ async def delete_order(order_id: UUID, db: Session = Depends(get_db), current_us
 
         db.delete(ride)
         db.commit()
+        availability_index.remove_ride(order_id)
+        deadline_scheduler.remove_ride(order_id)
+        daily_distance_ledger.remove_ride(order_id)
         update_user_pending_rebook_status(db, current_user.employee_id)
 
-        try:
-            scheduler.remove_job(job_id=f"ride-start-{order_id}")
-        except JobLookupError:
-            pass
+        cancel_ride_jobs(order_id)
 
         return {"message": "Order deleted successfully"}
     except Exception as e:
@@ -718,7 +730,7 @@ def read_ride(ride_id: UUID, db: Session = Depends(get_db)):
 @router.post("/api/complete-ride-form", status_code=fastapi_status.HTTP_200_OK)
 async def submit_completion_form(
     form_data: CompletionFormData,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: User = Depends(get_current_user)
 ):
     return await process_completion_form(db, user, form_data)
@@ -848,50 +860,70 @@ def get_distance(
     db: Session = Depends(get_db),
 ):
     try:
-        from_city_obj = get_city(FROM_CITY, db)
-        if not from_city_obj:
+        from_city_id = city_gazetteer.id_for_name(FROM_CITY)
+        if not from_city_id:
             raise HTTPException(status_code=404, detail="From city not found")
 
-        stop_objs = []
-        for stop_id in extra_stops:
-            stop = db.query(City).filter(City.id == stop_id).first()
-            if not stop:
-                raise HTTPException(status_code=404, detail=f"Extra stop not found: {stop_id}")
-            stop_objs.append(stop)
-
-        to_city_obj = db.query(City).filter(City.id == to_city).first()
-        if not to_city_obj:
-            raise HTTPException(status_code=404, detail="Destination city not found")
-
-        route = [from_city_obj] + stop_objs + [to_city_obj]
-
-        total_distance = 0
-        for i in range(len(route) - 1):
-            total_distance += calculate_distance(route[i].id, route[i + 1].id, db)
+        try:
+            total_distance = city_distances.route_distance([from_city_id, *extra_stops, to_city], db)
+        except KeyError as e:
+            missing = e.args[0]
+            if missing == str(to_city):
+                raise HTTPException(status_code=404, detail="Destination city not found")
+            raise HTTPException(status_code=404, detail=f"Extra stop not found: {missing}")
 
         return {"distance_km": total_distance}
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/api/distance/optimal")
+def get_optimal_distance(
+    to_city: str,
+    extra_stops: list[str] = Query(default=[]),
+    db: Session = Depends(get_db),
+):
+    """Like /api/distance, with extra_stops reordered for the shortest route."""
+    from_city_id = city_gazetteer.id_for_name(FROM_CITY)
+    if not from_city_id:
+        raise HTTPException(status_code=404, detail="From city not found")
+
+    try:
+        ordered_stops, total_distance = order_stops(from_city_id, extra_stops, to_city, db)
+    except KeyError as e:
+        missing = e.args[0]
+        if missing == str(to_city):
+            raise HTTPException(status_code=404, detail="Destination city not found")
+        raise HTTPException(status_code=404, detail=f"Extra stop not found: {missing}")
+
+    return {"distance_km": total_distance, "extra_stops": ordered_stops}
         
 @router.get("/api/cities")
-def get_cities_route(db: Session = Depends(get_db)):
-    cities = get_cities(db)
-    return [{"id": str(city.id), "name": city.name} for city in cities]
+def get_cities_route():
+    # Sorted and serialized once per change to the cities table
+    return Response(content=city_gazetteer.cities_json(), media_type="application/json")
+
+@router.get("/api/cities/search")
+def search_cities_route(q: str, limit: int = Query(10, ge=1, le=50)):
+    return city_gazetteer.search(q, limit)
 
 @router.get("/api/city")
-def get_city_route(name:str,db: Session = Depends(get_db)):
-    city = get_city(name,db)
-    return {"id": str(city.id), "name": city.name} 
+def get_city_route(name: str):
+    city_id = city_gazetteer.id_for_name(name)
+    if city_id is None:
+        raise HTTPException(status_code=404, detail=f"City {name} not found")
+    return {"id": str(city_id), "name": city_gazetteer.name_for_id(city_id)}
 
 def get_city_by_id(id: str, db: Session):
     return db.query(City).filter(City.id == id).first()
 
 @router.get("/api/cityname")
-def get_city_name(id: str, db: Session = Depends(get_db)):
-    city = get_city_by_id(id, db)
-    if city is None:
+def get_city_name(id: str):
+    name = city_gazetteer.name_for_id(id)
+    if name is None:
         raise HTTPException(status_code=404, detail=f"City with id {id} not found")
-    return {"id": str(city.id), "name": city.name}
+    return {"id": id, "name": name}
 
 
 @router.get("/api/rides/feedback/check/{user_id}")
@@ -14,11 +14,13 @@ from ..helpers.user_helpers import cancel_future_rides_for_vehicle, cancel_futur
 # Utils
 from ..utils.auth import token_check, get_current_user, role_check
 from ..utils.database import get_db
-from ..utils.socket_manager import sio
+from ..utils.socket_manager import emit_event, sio
 
 # Services
+from ..services.daily_distance_ledger import fits_electric_range
+from ..services.deadline_scheduler import deadline_scheduler
 from ..services.vehicle_service import (
-    get_vehicle_km_driven_on_date,
+    get_km_driven_per_vehicle_on_date,
     get_vehicles_with_optional_status,
     get_available_vehicles_new_ride,
     get_vehicles_for_ride_edit,
@@ -66,11 +68,12 @@ def get_all_vehicles_route(
     electric_low = []
     hybrid = []
     fuel = []
+    km_by_vehicle = get_km_driven_per_vehicle_on_date(db, ride_date or date.today())
 
     for v in vehicles:
         if v.fuel_type == "electric":
-            km_today = get_vehicle_km_driven_on_date(db, v.id, ride_date or date.today())
-            if distance_km + float(km_today) <= 200:
+            km_today = km_by_vehicle.get(v.id, 0)
+            if fits_electric_range(distance_km, km_today):
                 electric.append(v)
             else:
                 electric_low.append(v)
@@ -126,11 +129,12 @@ def get_vehicles_for_ride_edit_route(
             electric_low = []
             hybrid = []
             fuel = []
+            km_by_vehicle = get_km_driven_per_vehicle_on_date(db, ride_date or date.today())
             
             for v in vehicles:
                 if v.fuel_type == "electric":
-                    km_today = get_vehicle_km_driven_on_date(db, v.id, ride_date or date.today())
-                    if distance_km + float(km_today) <= 200:
+                    km_today = km_by_vehicle.get(v.id, 0)
+                    if fits_electric_range(distance_km, km_today):
                         electric.append(v)
                     else:
                         electric_low.append(v)
@@ -177,11 +181,12 @@ def get_vip_vehicles_route(
         return []
 
     electric, hybrid, fuel = [], [], []
+    km_by_vehicle = get_km_driven_per_vehicle_on_date(db, ride_date or date.today())
 
     for v in vehicles:
         if v.fuel_type == "electric":
-            km_today = get_vehicle_km_driven_on_date(db, v.id, ride_date or date.today())
-            if distance_km + float(km_today) <= 200:
+            km_today = km_by_vehicle.get(v.id, 0)
+            if fits_electric_range(distance_km, km_today):
                 electric.append(v)
         elif v.fuel_type == "hybrid":
             hybrid.append(v)
@@ -237,7 +242,7 @@ async def patch_vehicle_status(
     )
     new_status = res["new_status"]
 
-    await sio.emit('vehicle_status_updated', {
+    await emit_event('vehicle_status_updated', {
         "vehicle_id": str(vehicle_id),
         "status": new_status,
         "freeze_reason": res.get("freeze_reason", ""),
@@ -248,13 +253,13 @@ async def patch_vehicle_status(
         for notif_data in res["notifications"]:
             await sio.emit('new_notification', notif_data, room=notif_data['user_id'])
 
-        await sio.emit('reservationCanceledDueToVehicleFreeze', {
+        await emit_event('reservationCanceledDueToVehicleFreeze', {
             "vehicle_id": str(vehicle_id),
             "status": new_status,
             "freeze_reason": res.get("freeze_reason", ""),
             "freeze_details": res.get("freeze_details", ""),
             "affected_users": res.get("users", [])
-        })
+        }, user_id=[str(u) for u in res.get("users", [])])
 
 
     return res
@@ -328,6 +333,7 @@ def create_vehicle(
     db.add(new_vehicle)
     db.commit()
     db.refresh(new_vehicle)
+    deadline_scheduler.sync_vehicle(new_vehicle)
     return new_vehicle
 
 
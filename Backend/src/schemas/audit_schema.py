@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Any,Optional
+from typing import Any,List,Optional
 from datetime import datetime
 from uuid import UUID
 
@@ -12,3 +12,8 @@ class AuditLogsSchema(BaseModel):
     change_data: Any
     created_at: datetime
     changed_by: Optional[UUID]
+
+
+class AuditLogsPageSchema(BaseModel):
+    items: List[AuditLogsSchema]
+    next_cursor: Optional[str] = None
@@ -38,6 +38,8 @@ class RideCreate(BaseModel):
     extended_ride_reason: Optional[str] = None
     target_type: Optional[str] = "self" 
     extra_stops: Optional[List[UUID]] = None 
+    # Store extra_stops in the order that makes the route shortest
+    optimize_stops: Optional[bool] = False
     is_extended_request: Optional[bool] = False
     approving_supervisor: Optional[UUID] = None
     
@@ -23,6 +23,7 @@ class OrderCardItem(BaseModel):
     submitted_at: datetime
     emergency_event: Optional[str] = None 
     extra_stops: Optional[List[UUID]] = None 
+    optimize_stops: Optional[bool] = None
     rejection_reason: Optional[str] = None
     extended_ride_reason: Optional[str] = None
     four_by_four_reason: Optional[str] = None
@@ -17,6 +17,7 @@ class TopNoShowUser(BaseModel):
 class NoShowStatsResponse(BaseModel):
     total_no_show_events: int
     unique_no_show_users: int
+    completed_rides_count: int = 0
     top_no_show_users: List[TopNoShowUser]
 
 
@@ -7,10 +7,15 @@ from sqlalchemy import String, extract, func, and_, or_
 from sqlalchemy.orm import Session
 import pytz
 
+# Services
+from ..services.usage_rollups import hours_between, month_hours, utilisation_percent
+
 # Schemas
 from ..schemas.ride_dashboard_item import RideDashboardItem
 
 # Models
+from ..models.department_model import Department
+from ..models.monthly_department_usage_model import MonthlyDepartmentUsage
 from ..models.monthly_vehicle_usage_model import MonthlyVehicleUsage
 from ..models.ride_model import Ride, RideStatus
 from ..models.user_model import User
@@ -147,53 +152,25 @@ def get_order_by_ride_id(db: Session, ride_id: UUID) -> Optional[RideDashboardIt
 
 
 
-def update_monthly_usage_stats(db: Session, ride: Ride):
-
-    if not ride.end_datetime:
-        ride.end_datetime = datetime.utcnow()
-
-    israel_tz = pytz.timezone("Asia/Jerusalem")
-    start_local = ride.start_datetime.astimezone(israel_tz)
-    end_local = ride.end_datetime.astimezone(israel_tz)
-
-    year = start_local.year
-    month = start_local.month
-
-    duration_hours = (end_local - start_local).total_seconds() / 3600.0
-
-    distance = float(ride.actual_distance_km or 0)
-
-    stats = db.query(MonthlyVehicleUsage).filter_by(
-        vehicle_id=ride.vehicle_id,
-        year=year,
-        month=month
-    ).first()
-
-    if stats:
-        stats.total_rides += 1
-        stats.total_km += distance
-        stats.usage_hours += duration_hours
-    else:
-        stats = MonthlyVehicleUsage(
-            vehicle_id=ride.vehicle_id,
-            year=year,
-            month=month,
-            total_rides=1,
-            total_km=distance,
-            usage_hours=duration_hours
-        )
-        db.add(stats)
+def _usage_row(row, available_hours: float) -> dict:
+    return {
+        "vehicle_id": str(row.vehicle_id),
+        "plate_number": row.plate_number,
+        "vehicle_model": row.vehicle_model,
+        "total_rides": int(row.total_rides or 0),
+        "total_km": float(row.total_km or 0),
+        "percentage_in_use_time": utilisation_percent(row.usage_hours, available_hours),
+    }
 
 
 def get_current_month_vehicle_usage(db: Session) -> List[Dict]:
     tz = pytz.timezone("Asia/Jerusalem")
     now = datetime.now(tz)
+    return get_vehicle_usage_stats(db, now.year, now.month)
+
 
-    current_year = now.year
-    current_month = now.month
-    print('current month',current_month)
-    print('current year',current_year)
-    usage_entries = (
+def get_vehicle_usage_stats(db: Session, year: int, month: int) -> List[dict]:
+    usage_data = (
         db.query(
             MonthlyVehicleUsage.vehicle_id,
             MonthlyVehicleUsage.total_rides,
@@ -204,82 +181,93 @@ def get_current_month_vehicle_usage(db: Session) -> List[Dict]:
         )
         .join(Vehicle, Vehicle.id == MonthlyVehicleUsage.vehicle_id)
         .filter(
-            MonthlyVehicleUsage.year == current_year,
-            MonthlyVehicleUsage.month == current_month
+            MonthlyVehicleUsage.year == year,
+            MonthlyVehicleUsage.month == month
         )
         .all()
     )
 
-    res= [
-        {
-            "vehicle_id": str(entry.vehicle_id),
-            "plate_number": entry.plate_number,
-            "vehicle_model": entry.vehicle_model,
-            "total_rides": entry.total_rides,
-            "total_km": float(entry.total_km),
-            "percentage_in_use_time": round((entry.usage_hours / (24 * 30)) * 100, 1)  # ← based on 30-day month
-        }
-        for entry in usage_entries
-    ]
-    print("res",res)
-    return res
+    available_hours = month_hours(year, month)
+    return [_usage_row(row, available_hours) for row in usage_data]
 
 
-def get_vehicle_usage_stats(db: Session, year: int, month: int) -> List[dict]:
+def get_all_time_vehicle_usage_stats(db: Session) -> List[dict]:
+    first_month = func.min(MonthlyVehicleUsage.year * 12 + MonthlyVehicleUsage.month - 1)
     usage_data = (
         db.query(
             MonthlyVehicleUsage.vehicle_id,
-            MonthlyVehicleUsage.total_rides,
-            MonthlyVehicleUsage.total_km,
-            MonthlyVehicleUsage.usage_hours,
+            func.sum(MonthlyVehicleUsage.total_rides).label("total_rides"),
+            func.sum(MonthlyVehicleUsage.total_km).label("total_km"),
+            func.sum(MonthlyVehicleUsage.usage_hours).label("usage_hours"),
+            first_month.label("first_month"),
             Vehicle.plate_number,
             Vehicle.vehicle_model
         )
         .join(Vehicle, Vehicle.id == MonthlyVehicleUsage.vehicle_id)
-        .filter(
-            MonthlyVehicleUsage.year == year,
-            MonthlyVehicleUsage.month == month
-        )
+        .group_by(MonthlyVehicleUsage.vehicle_id, Vehicle.plate_number, Vehicle.vehicle_model)
         .all()
     )
 
+    # Each vehicle is measured from its first month with usage up to now
+    now = datetime.now(pytz.timezone("Asia/Jerusalem"))
+    current = (now.year, now.month)
     return [
-        {
-            "vehicle_id": str(row.vehicle_id),
-            "plate_number": row.plate_number,
-            "vehicle_model": row.vehicle_model,
-            "total_rides": row.total_rides,
-            "total_km": float(row.total_km),
-            "percentage_in_use_time": round((row.usage_hours / (24 * 30)) * 100, 1)  # assumes 30 days
-        }
+        _usage_row(row, hours_between((row.first_month // 12, row.first_month % 12 + 1), current))
         for row in usage_data
     ]
 
-def get_all_time_vehicle_usage_stats(db: Session) -> List[dict]:
-    usage_data = (
+
+def get_top_used_vehicles(db: Session, limit: int = 10) -> List[dict]:
+    ride_count = func.sum(MonthlyVehicleUsage.total_rides)
+    results = (
         db.query(
-            MonthlyVehicleUsage.vehicle_id,
-            func.sum(MonthlyVehicleUsage.total_rides).label("total_rides"),
-            func.sum(MonthlyVehicleUsage.total_km).label("total_km"),
-            func.sum(MonthlyVehicleUsage.usage_hours).label("usage_hours"),
             Vehicle.plate_number,
-            Vehicle.vehicle_model
+            Vehicle.vehicle_model,
+            ride_count.label("ride_count")
         )
-        .join(Vehicle, Vehicle.id == MonthlyVehicleUsage.vehicle_id)
-        .group_by(MonthlyVehicleUsage.vehicle_id, Vehicle.plate_number, Vehicle.vehicle_model)
+        .join(MonthlyVehicleUsage, MonthlyVehicleUsage.vehicle_id == Vehicle.id)
+        .group_by(Vehicle.id, Vehicle.plate_number, Vehicle.vehicle_model)
+        .order_by(ride_count.desc())
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "plate_number": r.plate_number,
+            "vehicle_model": r.vehicle_model,
+            "ride_count": int(r.ride_count or 0)
+        }
+        for r in results
+    ]
+
+
+def get_department_usage_stats(db: Session, year: int, month: int) -> List[dict]:
+    usage_data = (
+        db.query(MonthlyDepartmentUsage, Department.name)
+        .outerjoin(Department, Department.id == MonthlyDepartmentUsage.department_id)
+        .filter(
+            MonthlyDepartmentUsage.year == year,
+            MonthlyDepartmentUsage.month == month
+        )
+        .order_by(MonthlyDepartmentUsage.total_rides.desc())
         .all()
     )
 
+    available_hours = month_hours(year, month)
     return [
         {
-            "vehicle_id": str(row.vehicle_id),
-            "plate_number": row.plate_number,
-            "vehicle_model": row.vehicle_model,
-            "total_rides": row.total_rides,
-            "total_km": float(row.total_km),
-            "percentage_in_use_time": round((row.usage_hours / (24 * 30 * 12)) * 100, 1)  # ← simple average
+            "department_id": str(usage.department_id) if usage.department_id else None,
+            "department_name": name,
+            "total_rides": usage.total_rides,
+            "total_km": float(usage.total_km or 0),
+            "usage_hours": round(float(usage.usage_hours or 0), 1),
+            "vehicles_used": usage.vehicles_used,
+            # Share of the department's vehicles' time in the month
+            "percentage_in_use_time": utilisation_percent(
+                usage.usage_hours, available_hours * usage.vehicles_used
+            ),
         }
-        for row in usage_data
+        for usage, name in usage_data
     ]
 
 def get_critical_trip_issues(db: Session) -> List[dict]:
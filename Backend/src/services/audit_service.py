@@ -1,17 +1,115 @@
+import base64
+from datetime import datetime, timedelta
+from typing import Optional
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import String, and_, case, cast, func, or_, tuple_
+from sqlalchemy.orm import Session
+
 from ..models.audit_log_model import AuditLog
 from ..models.user_model import User
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from ..schemas.audit_schema import AuditLogsSchema
-import json
+from ..schemas.audit_schema import AuditLogsPageSchema, AuditLogsSchema
 
-def get_all_audit_logs(
-    db: Session,
-    from_date: datetime = None,
-    to_date: datetime = None,
-    problematic_only: bool = False
-) -> list[AuditLogsSchema]:
-    query = db.query(AuditLog)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Table aliases, so importing this module does not configure the mappers
+Actor = User.__table__.alias("actor")
+Rider = User.__table__.alias("rider")
+
+# For rides the log is about the rider: INSERT rows hold the ride, UPDATE
+# rows hold its old and new versions
+_ride_user_id = case(
+    (AuditLog.action == "INSERT", AuditLog.change_data["user_id"].as_string()),
+    else_=func.coalesce(
+        AuditLog.change_data["new"]["user_id"].as_string(),
+        AuditLog.change_data["old"]["user_id"].as_string(),
+    ),
+)
+
+
+def _audit_logs_query(db: Session):
+    # Both names come from the same statement instead of a User query per row
+    return (
+        db.query(
+            AuditLog,
+            Actor.c.first_name.label("actor_first_name"),
+            Actor.c.last_name.label("actor_last_name"),
+            Rider.c.first_name.label("rider_first_name"),
+            Rider.c.last_name.label("rider_last_name"),
+        )
+        .outerjoin(Actor, Actor.c.employee_id == AuditLog.changed_by)
+        .outerjoin(
+            Rider,
+            and_(AuditLog.entity_type == "Ride", cast(Rider.c.employee_id, String) == _ride_user_id),
+        )
+    )
+
+
+def _full_name(log: AuditLog, actor_first, actor_last, rider_first, rider_last) -> str:
+    change_data = log.change_data or {}
+
+    # Extract first and last name from change_data
+    first = change_data.get("first_name") or ""
+    last = change_data.get("last_name") or ""
+
+    # Check nested 'new' or 'old' keys if first_name/last_name are not found
+    if not first and not last:
+        nested_data = change_data.get("new") or change_data.get("old") or {}
+        first = nested_data.get("first_name") or ""
+        last = nested_data.get("last_name") or ""
+
+    # Then the user who made the change, then the rider of a ride
+    if not first and not last:
+        first, last = actor_first or "", actor_last or ""
+    if not first and not last and log.entity_type == "Ride":
+        first, last = rider_first or "", rider_last or ""
+
+    # Construct full_name or fallback to "Unknown"
+    return (first + " " + last).strip() or "Unknown"
+
+
+def _to_schema(row) -> AuditLogsSchema:
+    log = row[0]
+    return AuditLogsSchema(
+        id=log.id,
+        full_name=_full_name(*row),
+        action=log.action,
+        entity_type=log.entity_type,
+        entity_id=log.entity_id,
+        change_data=log.change_data,
+        created_at=log.created_at,
+        changed_by=log.changed_by,
+        checkbox_value=log.checkbox_value,
+        inspected_at=log.inspected_at,
+        notes=log.notes
+    )
+
+
+def encode_cursor(created_at: datetime, log_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{log_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(log_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="סמן עמוד לא תקין")
+
+
+def _apply_filters(
+    query,
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    problematic_only: bool,
+    entity_type: Optional[str] = None,
+    action: Optional[str] = None,
+    changed_by: Optional[UUID] = None,
+    search: Optional[str] = None,
+):
     if not from_date:
         from_date = datetime.utcnow() - timedelta(days=180)
     query = query.filter(AuditLog.created_at >= from_date)
@@ -19,61 +117,63 @@ def get_all_audit_logs(
         query = query.filter(AuditLog.created_at <= to_date)
 
     if problematic_only:
-        query = query.filter(AuditLog.checkbox_value == True)  
-
-    logs = query.all()
-
-    result = []
-    for log in logs:
-        change_data = log.change_data or {}
-        
-        # Extract first and last name from change_data
-        first = change_data.get("first_name") or ""
-        last = change_data.get("last_name") or ""
-        
-        # Check nested 'new' or 'old' keys if first_name/last_name are not found
-        if not first and not last:
-            nested_data = change_data.get("new") or change_data.get("old") or {}
-            first = nested_data.get("first_name") or ""
-            last = nested_data.get("last_name") or ""
-        
-        # If still no name, fetch from the users table using changed_by
-        if not first and not last and log.changed_by:
-            user = db.query(User).filter(User.employee_id == log.changed_by).first()
-            if user:
-                first = user.first_name or ""
-                last = user.last_name or ""
-        
-        # Handle Ride entity type for INSERT and UPDATE actions
-        if not first and not last and log.entity_type == "Ride":
-            user_id = None
-            if log.action == "INSERT":
-                user_id = change_data.get("user_id")
-            elif log.action == "UPDATE":
-                user_id = change_data.get("new", {}).get("user_id") or change_data.get("old", {}).get("user_id")
-            
-            if user_id:
-                user = db.query(User).filter(User.employee_id == user_id).first()
-                if user:
-                    first = user.first_name or ""
-                    last = user.last_name or ""
-        
-        # Construct full_name or fallback to "Unknown"
-        full_name = (first + " " + last).strip() or "Unknown"
-        
-        result.append(AuditLogsSchema(
-            id=log.id,
-            full_name=full_name,
-            action=log.action,
-            entity_type=log.entity_type,
-            entity_id=log.entity_id,
-            change_data=log.change_data,
-            created_at=log.created_at,
-            changed_by=log.changed_by,
-            checkbox_value=log.checkbox_value,
-            inspected_at=log.inspected_at,
-            # inspector_id=log.inspector_id,
-            notes=log.notes
+        query = query.filter(AuditLog.checkbox_value == True)
+    if entity_type:
+        query = query.filter(AuditLog.entity_type == entity_type)
+    if action:
+        query = query.filter(AuditLog.action == action)
+    if changed_by:
+        query = query.filter(AuditLog.changed_by == changed_by)
+    if search:
+        pattern = f"%{search.strip()}%"
+        query = query.filter(or_(
+            AuditLog.entity_id.ilike(pattern),
+            AuditLog.notes.ilike(pattern),
+            cast(AuditLog.change_data, String).ilike(pattern),
+            func.concat(Actor.c.first_name, " ", Actor.c.last_name).ilike(pattern),
+            func.concat(Rider.c.first_name, " ", Rider.c.last_name).ilike(pattern),
         ))
-        
-    return result
\ No newline at end of file
+    return query
+
+
+def get_all_audit_logs(
+    db: Session,
+    from_date: datetime = None,
+    to_date: datetime = None,
+    problematic_only: bool = False
+) -> list[AuditLogsSchema]:
+    query = _apply_filters(_audit_logs_query(db), from_date, to_date, problematic_only)
+    return [_to_schema(row) for row in query.all()]
+
+
+def get_audit_logs_page(
+    db: Session,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
+    problematic_only: bool = False,
+    entity_type: Optional[str] = None,
+    action: Optional[str] = None,
+    changed_by: Optional[UUID] = None,
+    search: Optional[str] = None,
+) -> AuditLogsPageSchema:
+    """Newest first, `limit` logs per page. Pass the returned next_cursor to
+    get the following page; it is None on the last one."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = _apply_filters(
+        _audit_logs_query(db), from_date, to_date, problematic_only,
+        entity_type=entity_type, action=action, changed_by=changed_by, search=search,
+    )
+    if cursor:
+        query = query.filter(tuple_(AuditLog.created_at, AuditLog.id) < decode_cursor(cursor))
+
+    rows = query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return AuditLogsPageSchema(items=[_to_schema(row) for row in rows], next_cursor=next_cursor)
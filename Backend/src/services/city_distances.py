@@ -0,0 +1,111 @@
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+# Utils
+from ..utils.database import SessionLocal, session_scope
+from ..utils.table_versions import table_versions
+
+# Models
+from ..models.city_model import City
+
+
+EARTH_RADIUS_KM = 6371.0
+# Road distance is estimated as the straight line plus this share
+ROUTE_BUFFER = 1.10
+
+
+def pairwise_haversine_km(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Great-circle distance between every pair of points, in km."""
+    lat = np.radians(latitudes)[:, None]
+    lon = np.radians(longitudes)[:, None]
+    dlat = lat.T - lat
+    dlon = lon.T - lon
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class CityDistanceMatrix:
+    """Buffered distances between all cities, built from one query.
+
+    Leg distances are rounded to two decimals like calculate_distance
+    always returned them, so a route is the sum of matrix lookups. The
+    matrix is rebuilt on the next read after a committed write to cities.
+    """
+
+    def __init__(self):
+        self._build_lock = threading.Lock()
+        self.version: Optional[int] = None
+        self.ids: List[str] = []
+        # Replaced together, so readers always see a matching pair
+        self._state = ({}, np.empty((0, 0)))
+        self.builds = 0
+
+    def load(self, db: Session):
+        version = table_versions.get(City.__tablename__)
+        rows = db.execute(select(City.id, City.latitude, City.longitude).order_by(City.id)).all()
+        ids = [str(row.id) for row in rows]
+        latitudes = np.array([float(row.latitude) for row in rows])
+        longitudes = np.array([float(row.longitude) for row in rows])
+        distances = np.round(pairwise_haversine_km(latitudes, longitudes) * ROUTE_BUFFER, 2)
+
+        self.ids = ids
+        self._state = ({city_id: position for position, city_id in enumerate(ids)}, distances)
+        self.version = version
+        self.builds += 1
+
+    def _current_state(self, db: Optional[Session] = None):
+        with self._build_lock:
+            if self.version != table_versions.get(City.__tablename__):
+                if db is not None:
+                    self.load(db)
+                else:
+                    with session_scope() as session:
+                        self.load(session)
+        return self._state
+
+    def _lookup(self, city_ids: Sequence, db: Optional[Session] = None):
+        index, distances = self._current_state(db)
+        positions = []
+        for city_id in city_ids:
+            position = index.get(str(city_id))
+            if position is None:
+                raise KeyError(str(city_id))
+            positions.append(position)
+        return np.array(positions, dtype=np.intp), distances
+
+    def distance(self, city_id1, city_id2, db: Optional[Session] = None) -> float:
+        """Buffered distance in km; raises KeyError for an unknown city."""
+        (first, second), distances = self._lookup([city_id1, city_id2], db)
+        return float(distances[first, second])
+
+    def route_distance(self, city_ids: Sequence, db: Optional[Session] = None) -> float:
+        """Sum of the legs between consecutive cities."""
+        positions, distances = self._lookup(city_ids, db)
+        if len(positions) < 2:
+            return 0.0
+        return round(float(distances[positions[:-1], positions[1:]].sum()), 2)
+
+    def legs(self, city_ids: Sequence, db: Optional[Session] = None) -> np.ndarray:
+        """Distances between the given cities, in their order."""
+        positions, distances = self._lookup(city_ids, db)
+        return distances[np.ix_(positions, positions)]
+
+    def snapshot(self) -> dict:
+        return {"cities": len(self.ids), "builds": self.builds, "version": self.version}
+
+
+city_distances = CityDistanceMatrix()
+
+
+def warm_city_distances():
+    db = SessionLocal()
+    try:
+        city_distances.load(db)
+    except Exception as e:
+        print(f"❌ Failed to build city distance matrix: {e}")
+    finally:
+        db.close()
@@ -0,0 +1,177 @@
+import json
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+# Utils
+from ..utils.database import SessionLocal, session_scope
+from ..utils.table_versions import table_versions
+
+# Models
+from ..models.city_model import City, CityAlias
+
+
+SEARCH_LIMIT = 10
+
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+# Geresh and gershayim are typed several ways
+_QUOTES = str.maketrans({"׳": "'", "’": "'", "`": "'", "״": '"', "”": '"', "“": '"'})
+# Maqaf, hyphens and dashes separate words like a space
+_SEPARATORS = re.compile(r"[־\-‐‑–—_/,.()]+")
+_SPACES = re.compile(r"\s+")
+
+# Ranks of a prefix match, best first
+_NAME_START, _ALIAS_START, _WORD_START = 0, 1, 2
+
+
+def normalize_city_name(name: str) -> str:
+    """Key for comparing city names as typed.
+
+    Strips niqqud, cantillation and other combining marks, folds final
+    letters to their regular form, unifies quotes and word separators and
+    lowercases Latin letters.
+    """
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    folded = stripped.translate(_FINAL_LETTERS).translate(_QUOTES).casefold()
+    return _SPACES.sub(" ", _SEPARATORS.sub(" ", folded)).strip()
+
+
+def _word_starts(key: str) -> List[int]:
+    return [match.start() for match in re.finditer(r"(?<= )\S", key)]
+
+
+class _TrieNode:
+    __slots__ = ("children", "best", "matches")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # city id -> (rank, sort key) while building
+        self.best: Dict[str, Tuple[int, str]] = {}
+        # city ids under this prefix, best first, once built
+        self.matches: Tuple[str, ...] = ()
+
+
+class _Gazetteer:
+    """One immutable build of the lookup tables."""
+
+    def __init__(self, cities: List[Tuple[UUID, str]], aliases: List[Tuple[UUID, str]]):
+        cities = sorted(cities, key=lambda city: city[1])
+        self.names: Dict[str, str] = {str(city_id): name for city_id, name in cities}
+        self.ids: Dict[str, UUID] = {}
+        for city_id, alias in aliases:
+            self.ids.setdefault(normalize_city_name(alias), city_id)
+        # A city's own name wins over another city's alias
+        for city_id, name in cities:
+            self.ids[normalize_city_name(name)] = city_id
+
+        self.cities_json = json.dumps(
+            [{"id": str(city_id), "name": name} for city_id, name in cities], ensure_ascii=False
+        ).encode("utf-8")
+
+        self.root = _TrieNode()
+        for city_id, name in cities:
+            self._index(str(city_id), normalize_city_name(name), name, _NAME_START)
+        for city_id, alias in aliases:
+            if str(city_id) in self.names:
+                self._index(str(city_id), normalize_city_name(alias), self.names[str(city_id)], _ALIAS_START)
+        self._finish(self.root)
+
+    def _insert(self, key: str, city_id: str, rank: int, sort_key: str):
+        node = self.root
+        for ch in key:
+            node = node.children.setdefault(ch, _TrieNode())
+            best = node.best.get(city_id)
+            if best is None or (rank, sort_key) < best:
+                node.best[city_id] = (rank, sort_key)
+
+    def _index(self, city_id: str, key: str, name: str, rank: int):
+        if not key:
+            return
+        self._insert(key, city_id, rank, name)
+        # "אביב" finds "תל אביב-יפו" too, after names that start with it
+        for start in _word_starts(key):
+            self._insert(key[start:], city_id, _WORD_START, name)
+
+    def _finish(self, root: _TrieNode):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node.matches = tuple(sorted(node.best, key=node.best.__getitem__))
+            node.best = {}
+            stack.extend(node.children.values())
+
+    def search(self, prefix: str, limit: int) -> List[dict]:
+        node = self.root
+        for ch in normalize_city_name(prefix):
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return [{"id": city_id, "name": self.names[city_id]} for city_id in node.matches[:limit]]
+
+
+class CityGazetteer:
+    """Cities and their aliases in memory: name <-> id and type-ahead.
+
+    Built with two queries and rebuilt on the next read after a committed
+    write to cities or city_aliases.
+    """
+
+    TABLES = (City.__tablename__, CityAlias.__tablename__)
+
+    def __init__(self):
+        self._build_lock = threading.Lock()
+        self._gazetteer = _Gazetteer([], [])
+        self.version: Optional[Tuple[int, ...]] = None
+        self.builds = 0
+
+    def load(self, db: Session):
+        version = table_versions.get_many(self.TABLES)
+        cities = [tuple(row) for row in db.execute(select(City.id, City.name))]
+        aliases = [tuple(row) for row in db.execute(select(CityAlias.city_id, CityAlias.alias))]
+        self._gazetteer = _Gazetteer(cities, aliases)
+        self.version = version
+        self.builds += 1
+
+    def _current(self) -> _Gazetteer:
+        with self._build_lock:
+            if self.version != table_versions.get_many(self.TABLES):
+                with session_scope() as db:
+                    self.load(db)
+        return self._gazetteer
+
+    def id_for_name(self, name: str) -> Optional[UUID]:
+        """City id for a name or alias, however it is spelled."""
+        return self._current().ids.get(normalize_city_name(name))
+
+    def name_for_id(self, city_id) -> Optional[str]:
+        return self._current().names.get(str(city_id))
+
+    def cities_json(self) -> bytes:
+        """All cities as [{"id", "name"}] sorted by name, already serialized."""
+        return self._current().cities_json
+
+    def search(self, prefix: str, limit: int = SEARCH_LIMIT) -> List[dict]:
+        return self._current().search(prefix, limit)
+
+    def snapshot(self) -> dict:
+        gazetteer = self._gazetteer
+        return {"cities": len(gazetteer.names), "keys": len(gazetteer.ids), "builds": self.builds}
+
+
+city_gazetteer = CityGazetteer()
+
+
+def warm_city_gazetteer():
+    db = SessionLocal()
+    try:
+        city_gazetteer.load(db)
+    except Exception as e:
+        print(f"❌ Failed to load city gazetteer: {e}")
+    finally:
+        db.close()
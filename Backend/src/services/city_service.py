@@ -1,19 +1,15 @@
-from math import radians, sin, cos, sqrt, atan2
 from sqlalchemy.orm import Session
 from ..models.city_model import City , CityAlias
 from sqlalchemy import asc  
+from .city_distances import city_distances
+from .city_gazetteer import city_gazetteer
 
 
-EARTH_RADIUS_KM = 6371.0
-
 def normalize_city_name_to_id(city_name: str, db: Session) -> str:
-    city = db.query(City).filter(City.name == city_name).first()
-    if city:
-        return city.id
-
-    alias = db.query(CityAlias).filter(CityAlias.alias == city_name).first()
-    if alias:
-        return alias.city_id
+    # Names and aliases are resolved in memory, spelling-insensitively
+    city_id = city_gazetteer.id_for_name(city_name)
+    if city_id:
+        return city_id
 
     raise ValueError(f"Unknown city name: '{city_name}'")
 
@@ -24,21 +20,11 @@ def get_coordinates_by_city_id(city_id: str, db: Session):
     return float(city.latitude), float(city.longitude)
 
 def calculate_distance(city_id1: str, city_id2: str, db: Session) -> float:
-    # city_id1 = normalize_city_name_to_id(city_name1, db)
-    # city_id2 = normalize_city_name_to_id(city_name2, db)
-    lat1, lon1 = get_coordinates_by_city_id(city_id1, db)
-    lat2, lon2 = get_coordinates_by_city_id(city_id2, db)
-
-    # Haversine formula
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-
-    a = sin(dlat / 2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-    distance = EARTH_RADIUS_KM * c
-    distance_with_buffer = distance * 1.10
-    return round(distance_with_buffer, 2)
+    # Haversine with a 10% buffer, precomputed for every pair of cities
+    try:
+        return city_distances.distance(city_id1, city_id2, db)
+    except KeyError as e:
+        raise ValueError(f"City with ID {e.args[0]} not found")
 
 def get_cities(db: Session):
     return db.query(City).order_by(asc(City.name)).all()
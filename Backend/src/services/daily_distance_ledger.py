@@ -0,0 +1,175 @@
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+# Models
+from ..models.ride_model import Ride, RideStatus
+
+
+# Rides in these states use up a vehicle's max_daily_distance_km when it
+# is reassigned. The electric-range rule counts every ride of the day
+DAILY_LIMIT_RIDE_STATUSES = {
+    RideStatus.approved,
+    RideStatus.in_progress,
+    RideStatus.completed,
+}
+
+# Electric vehicles are only recommended while the day's total stays within range
+ELECTRIC_DAILY_RANGE_KM = 200
+
+MAX_CACHED_DAYS = 62
+
+
+def _to_status(value) -> Optional[RideStatus]:
+    try:
+        return RideStatus(value)
+    except ValueError:
+        return None
+
+
+class _DayLedger:
+    def __init__(self):
+        self.rides: Dict[UUID, Tuple[UUID, float, Optional[RideStatus]]] = {}
+
+    def add(self, ride_id: UUID, vehicle_id: UUID, km: float, status: Optional[RideStatus]):
+        self.rides[ride_id] = (vehicle_id, km, status)
+
+    def remove(self, ride_id: UUID):
+        self.rides.pop(ride_id, None)
+
+    def totals(
+        self,
+        statuses: Optional[Set[RideStatus]] = None,
+        exclude_ride_id: Optional[UUID] = None,
+    ) -> Dict[UUID, float]:
+        totals: Dict[UUID, float] = {}
+        for ride_id, (vehicle_id, km, status) in self.rides.items():
+            if ride_id == exclude_ride_id or (statuses is not None and status not in statuses):
+                continue
+            totals[vehicle_id] = totals.get(vehicle_id, 0.0) + km
+        return totals
+
+
+class DailyDistanceLedger:
+    """Kilometres driven per vehicle per day, loaded one day at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days: "OrderedDict[date, _DayLedger]" = OrderedDict()
+        self._ride_day: Dict[UUID, date] = {}
+        # Bumped by every sync; a day loaded while rides changed may have
+        # missed the change, so it is used once but not cached
+        self._generation = 0
+
+    def _load_day(self, db: Session, day: date) -> _DayLedger:
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+
+        rows = (
+            db.query(Ride.id, Ride.vehicle_id, func.coalesce(Ride.actual_distance_km, 0), Ride.status)
+            .filter(
+                Ride.vehicle_id.isnot(None),
+                Ride.start_datetime >= day_start,
+                Ride.start_datetime < day_end,
+            )
+            .all()
+        )
+
+        ledger = _DayLedger()
+        for ride_id, vehicle_id, km, status in rows:
+            ledger.add(ride_id, vehicle_id, float(km), _to_status(status))
+        return ledger
+
+    def _get_day(self, db: Session, day: date) -> _DayLedger:
+        with self._lock:
+            ledger = self._days.get(day)
+            if ledger is not None:
+                self._days.move_to_end(day)
+                return ledger
+            generation = self._generation
+
+        ledger = self._load_day(db, day)
+
+        with self._lock:
+            existing = self._days.get(day)
+            if existing is not None:
+                return existing
+            if generation != self._generation:
+                return ledger
+            self._days[day] = ledger
+            for ride_id in ledger.rides:
+                self._ride_day[ride_id] = day
+            while len(self._days) > MAX_CACHED_DAYS:
+                evicted_day, evicted = self._days.popitem(last=False)
+                for ride_id in evicted.rides:
+                    if self._ride_day.get(ride_id) == evicted_day:
+                        del self._ride_day[ride_id]
+            return ledger
+
+    def km_by_vehicle(
+        self,
+        db: Session,
+        day: date,
+        exclude_ride_id: Optional[UUID] = None,
+        statuses: Optional[Set[RideStatus]] = None,
+    ) -> Dict[UUID, float]:
+        """Km per vehicle on rides starting that day, optionally only in `statuses`."""
+        ledger = self._get_day(db, day)
+        with self._lock:
+            return ledger.totals(statuses, exclude_ride_id)
+
+    def km_for_vehicle(self, db: Session, vehicle_id: UUID, day: date) -> float:
+        return self.km_by_vehicle(db, day).get(vehicle_id, 0.0)
+
+    def _forget_locked(self, ride_id: UUID):
+        self._generation += 1
+        day = self._ride_day.pop(ride_id, None)
+        if day is not None and day in self._days:
+            self._days[day].remove(ride_id)
+
+    def sync_ride(self, ride: Ride):
+        """Reflect the current state of a ride (call after commit)."""
+        if ride is None or ride.id is None:
+            return
+        counts = ride.vehicle_id is not None and ride.start_datetime is not None
+        with self._lock:
+            self._forget_locked(ride.id)
+            if not counts:
+                return
+            day = ride.start_datetime.date()
+            ledger = self._days.get(day)
+            if ledger is not None:
+                ledger.add(ride.id, ride.vehicle_id, float(ride.actual_distance_km or 0), _to_status(ride.status))
+                self._ride_day[ride.id] = day
+
+    def sync_rides(self, rides: Iterable[Ride]):
+        for ride in rides:
+            self.sync_ride(ride)
+
+    def remove_ride(self, ride_id: UUID):
+        with self._lock:
+            self._forget_locked(ride_id)
+
+    def apply_changes(self, rides: Iterable[Ride], deleted_ids: Iterable[UUID]):
+        """Rides changed or deleted by any worker (see ride_change_listener)."""
+        self.sync_rides(rides)
+        for ride_id in deleted_ids:
+            self.remove_ride(ride_id)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._days.clear()
+            self._ride_day.clear()
+
+
+daily_distance_ledger = DailyDistanceLedger()
+
+
+def fits_electric_range(distance_km: float, km_today: float) -> bool:
+    return distance_km + float(km_today) <= ELECTRIC_DAILY_RANGE_KM
@@ -0,0 +1,324 @@
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+# Utils
+from ..utils.database import SessionLocal
+from ..utils.time_utils import scheduler_now, to_scheduler_time
+
+# Models
+from ..models.ride_model import Ride, RideStatus
+from ..models.user_model import User
+from ..models.vehicle_model import FreezeReason, Vehicle
+
+
+# Deadline kinds
+NO_SHOW = "no_show"              # approved ride not picked up by start + 2h
+COMPLETE = "complete"            # approved ride reaches end_datetime
+OVERDUE = "overdue"              # in-progress ride not returned by end + 2h
+FEEDBACK = "feedback"            # in-progress ride reaches end_datetime
+STALE = "stale"                  # pending/rejected ride still open at start + 2h
+UNBLOCK = "unblock"              # user block expires
+LEASE_WARNING = "lease_warning"  # 90 days before a vehicle lease ends
+LEASE_EXPIRED = "lease_expired"  # vehicle lease ends
+
+RIDE_KINDS = (NO_SHOW, COMPLETE, OVERDUE, FEEDBACK, STALE)
+
+# These only notify and leave the row as it was, so once fired they are not
+# queued again by a rebuild. The other kinds change the row when handled and
+# simply drop out of the rebuild query.
+NOTIFY_ONLY_KINDS = {OVERDUE, FEEDBACK, LEASE_WARNING}
+
+NO_SHOW_AFTER = timedelta(hours=2)
+OVERDUE_AFTER = timedelta(hours=2)
+STALE_AFTER = timedelta(hours=2)
+LEASE_WARNING_BEFORE = timedelta(days=90)
+
+STALE_RIDE_STATUSES = {
+    RideStatus.pending,
+    RideStatus.rejected,
+    RideStatus.cancelled_vehicle_unavailable,
+}
+
+
+def _to_status(value) -> Optional[RideStatus]:
+    try:
+        return RideStatus(value)
+    except ValueError:
+        return None
+
+
+def ride_deadlines(ride) -> List[Tuple[str, datetime]]:
+    status = _to_status(ride.status)
+    start = to_scheduler_time(ride.start_datetime)
+    end = to_scheduler_time(ride.end_datetime)
+    if getattr(ride, "is_archive", False) or start is None or end is None:
+        return []
+
+    if status == RideStatus.approved:
+        deadlines = [(COMPLETE, end)]
+        if ride.actual_pickup_time is None:
+            deadlines.append((NO_SHOW, start + NO_SHOW_AFTER))
+        return deadlines
+    if status == RideStatus.in_progress:
+        deadlines = [(OVERDUE, end + OVERDUE_AFTER)]
+        if not ride.feedback_submitted:
+            deadlines.append((FEEDBACK, end))
+        return deadlines
+    if status in STALE_RIDE_STATUSES:
+        return [(STALE, start + STALE_AFTER)]
+    return []
+
+
+def vehicle_deadlines(vehicle) -> List[Tuple[str, datetime]]:
+    lease_expiry = to_scheduler_time(vehicle.lease_expiry)
+    if lease_expiry is None or vehicle.freeze_reason == FreezeReason.expired:
+        return []
+    return [
+        (LEASE_WARNING, lease_expiry - LEASE_WARNING_BEFORE),
+        (LEASE_EXPIRED, lease_expiry),
+    ]
+
+
+class DeadlineScheduler:
+    """Priority queue of exact per-ride / per-user / per-vehicle deadlines.
+
+    A single worker thread sleeps until the earliest deadline, then runs the
+    handler registered for each kind that is due. Handlers are the set-based
+    jobs in utils/scheduler.py, so several deadlines falling due together
+    cost one run of their handler.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[datetime, int, str, Hashable]] = []
+        self._entries: Dict[Tuple[str, Hashable], Tuple[datetime, int]] = {}
+        # Notify-only deadlines that already fired
+        self._fired: Set[Tuple[str, Hashable, datetime]] = set()
+        self._handlers: Dict[str, Callable[[], None]] = {}
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self.loaded = False
+
+    def register(self, kind: str, handler: Callable[[], None]):
+        self._handlers[kind] = handler
+
+    def _push_locked(self, kind: str, key: Hashable, due_at: datetime):
+        if (kind, key, due_at) in self._fired:
+            return
+        current = self._entries.get((kind, key))
+        if current is not None and current[0] == due_at:
+            return
+        seq = next(self._seq)
+        self._entries[(kind, key)] = (due_at, seq)
+        heapq.heappush(self._heap, (due_at, seq, kind, key))
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stopped
+
+    def _replace(self, key: Hashable, kinds, deadlines: List[Tuple[str, datetime]]):
+        # Only the scheduler leader runs the queue; other workers' writes
+        # reach it through the ride change listener
+        if not self.running:
+            return
+        wanted = dict(deadlines)
+        with self._cond:
+            for kind in kinds:
+                if kind not in wanted:
+                    # The heap entry becomes stale and is skipped when popped
+                    self._entries.pop((kind, key), None)
+            for kind, due_at in wanted.items():
+                self._push_locked(kind, key, due_at)
+            self._cond.notify()
+
+    def sync_ride(self, ride):
+        """Reflect the current state of a ride (call after commit)."""
+        if ride is None or ride.id is None:
+            return
+        self._replace(ride.id, RIDE_KINDS, ride_deadlines(ride))
+
+    def sync_rides(self, rides):
+        for ride in rides:
+            self.sync_ride(ride)
+
+    def remove_ride(self, ride_id):
+        self._replace(ride_id, RIDE_KINDS, [])
+
+    def sync_user(self, user):
+        deadlines = []
+        if user.is_blocked and user.block_expires_at is not None:
+            deadlines.append((UNBLOCK, to_scheduler_time(user.block_expires_at)))
+        self._replace(user.employee_id, (UNBLOCK,), deadlines)
+
+    def sync_vehicle(self, vehicle):
+        self._replace(vehicle.id, (LEASE_WARNING, LEASE_EXPIRED), vehicle_deadlines(vehicle))
+
+    def apply_changes(self, rides, deleted_ids):
+        """ride_change_listener callback."""
+        self.sync_rides(rides)
+        for ride_id in deleted_ids:
+            self.remove_ride(ride_id)
+
+    def _user_deadlines(self, db: Session) -> List[Tuple[str, Hashable, datetime]]:
+        blocked = (
+            db.query(User.employee_id, User.block_expires_at)
+            .filter(User.is_blocked == True, User.block_expires_at.isnot(None))
+            .all()
+        )
+        return [(UNBLOCK, user_id, to_scheduler_time(expires)) for user_id, expires in blocked]
+
+    def _vehicle_deadlines(self, db: Session) -> List[Tuple[str, Hashable, datetime]]:
+        vehicles = (
+            db.query(Vehicle.id, Vehicle.lease_expiry, Vehicle.freeze_reason)
+            .filter(Vehicle.lease_expiry.isnot(None))
+            .all()
+        )
+        return [
+            (kind, vehicle.id, due_at)
+            for vehicle in vehicles
+            for kind, due_at in vehicle_deadlines(vehicle)
+        ]
+
+    def _reload_kinds(self, kinds, deadlines: List[Tuple[str, Hashable, datetime]]):
+        wanted = {(kind, key): due_at for kind, key, due_at in deadlines}
+        with self._cond:
+            for entry in [entry for entry in self._entries if entry[0] in kinds and entry not in wanted]:
+                del self._entries[entry]
+            for (kind, key), due_at in wanted.items():
+                self._push_locked(kind, key, due_at)
+            self._cond.notify()
+
+    def apply_table_changes(self, tables):
+        """on_notify callback for table_changes: reloads the user or vehicle
+        deadlines when another process wrote those tables."""
+        if not self.running or not {"users", "vehicles"} & set(tables):
+            return
+        with SessionLocal() as db:
+            if "users" in tables:
+                self._reload_kinds((UNBLOCK,), self._user_deadlines(db))
+            if "vehicles" in tables:
+                self._reload_kinds((LEASE_WARNING, LEASE_EXPIRED), self._vehicle_deadlines(db))
+
+    def warm(self, db: Session):
+        deadlines: List[Tuple[str, Hashable, datetime]] = []
+
+        rides = (
+            db.query(
+                Ride.id, Ride.status, Ride.start_datetime, Ride.end_datetime,
+                Ride.actual_pickup_time, Ride.feedback_submitted, Ride.is_archive,
+            )
+            .filter(
+                Ride.status.in_({RideStatus.approved, RideStatus.in_progress} | STALE_RIDE_STATUSES),
+                Ride.is_archive == False,
+            )
+            .all()
+        )
+        for ride in rides:
+            deadlines.extend((kind, ride.id, due_at) for kind, due_at in ride_deadlines(ride))
+
+        deadlines.extend(self._user_deadlines(db))
+        deadlines.extend(self._vehicle_deadlines(db))
+
+        with self._cond:
+            self._heap = []
+            self._entries = {}
+            for kind, key, due_at in deadlines:
+                self._push_locked(kind, key, due_at)
+            self.loaded = True
+            self._cond.notify()
+
+        print(f"⏰ Deadline scheduler loaded: {len(self._entries)} deadlines")
+
+    def _pop_due_locked(self, now: datetime) -> Set[str]:
+        kinds = set()
+        while self._heap and self._heap[0][0] <= now:
+            due_at, seq, kind, key = heapq.heappop(self._heap)
+            if self._entries.get((kind, key)) != (due_at, seq):
+                continue
+            del self._entries[(kind, key)]
+            if kind in NOTIFY_ONLY_KINDS:
+                self._fired.add((kind, key, due_at))
+            kinds.add(kind)
+        return kinds
+
+    def _next_wait_locked(self, now: datetime) -> Optional[float]:
+        # Drop stale entries so an empty queue really sleeps
+        while self._heap:
+            due_at, seq, kind, key = self._heap[0]
+            if self._entries.get((kind, key)) == (due_at, seq):
+                return max((due_at - now).total_seconds(), 0)
+            heapq.heappop(self._heap)
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = scheduler_now()
+                    wait = self._next_wait_locked(now)
+                    if wait == 0:
+                        break
+                    self._cond.wait(timeout=wait)
+                if self._stopped:
+                    return
+                due_kinds = self._pop_due_locked(scheduler_now())
+
+            for kind in due_kinds:
+                handler = self._handlers.get(kind)
+                if handler is None:
+                    continue
+                try:
+                    handler()
+                except Exception as e:
+                    print(f"❌ Deadline handler {kind} failed: {e}")
+
+    def start(self):
+        if self.running:
+            return
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="deadline-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._heap = []
+            self._entries = {}
+            self.loaded = False
+            self._cond.notify()
+
+    def prune_fired(self, older_than: timedelta = timedelta(days=2)):
+        cutoff = scheduler_now() - older_than
+        with self._cond:
+            self._fired = {entry for entry in self._fired if entry[2] >= cutoff}
+
+    def pending(self) -> Dict[str, int]:
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for kind, _ in self._entries:
+                counts[kind] = counts.get(kind, 0) + 1
+            return counts
+
+
+deadline_scheduler = DeadlineScheduler()
+
+
+def warm_deadline_scheduler():
+    if not deadline_scheduler.running:
+        return
+    db = SessionLocal()
+    try:
+        deadline_scheduler.warm(db)
+        deadline_scheduler.prune_fired()
+    except Exception as e:
+        print(f"❌ Failed to warm deadline scheduler: {e}")
+    finally:
+        db.close()
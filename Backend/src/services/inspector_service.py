@@ -4,22 +4,25 @@ import asyncio
 from datetime import datetime, timezone
 from uuid import UUID
 from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from ..models.user_model import User, UserRole
 from ..models.vehicle_inspection_model import VehicleInspection
 from ..schemas.check_vehicle_schema import VehicleInspectionSchema
 from ..services.user_notification import create_system_notification
-from ..utils.socket_manager import sio
+from ..utils.socket_manager import emit_event, sio
 from ..models.ride_model import Ride, RideStatus
 
 from ..models.notification_model import Notification, NotificationType
+from ..services.notification_dispatcher import NotificationDispatcher
 
 
-async def create_inspection(data: VehicleInspectionSchema, db: Session):
+async def create_inspection(data: VehicleInspectionSchema, db: AsyncSession):
     print('inspection data', data)
     try:
         inspection = VehicleInspection(
-            inspection_date=datetime.now(timezone.utc),
+            inspection_date=datetime.utcnow(),
             inspected_by=data.inspected_by,
             vehicle_id=data.vehicle_id,
             clean=data.is_clean,
@@ -30,14 +33,14 @@ async def create_inspection(data: VehicleInspectionSchema, db: Session):
         )
 
         db.add(inspection)
-        db.commit()
-        db.refresh(inspection)
+        await db.commit()
+        await db.refresh(inspection)
 
-        vehicle = db.query(Vehicle).filter(Vehicle.id == data.vehicle_id).first()
+        vehicle = await db.get(Vehicle, data.vehicle_id)
         
        
         if inspection.critical_issue_bool and inspection.issues_found:
-            admins = db.query(User).filter(User.role == UserRole.admin).all()
+            admins = (await db.execute(select(User).where(User.role == UserRole.admin))).scalars().all()
             
             plate_number = vehicle.plate_number if vehicle else "לא ידוע"
             inspection_date_str = inspection.inspection_date.strftime("%d/%m/%Y %H:%M")
@@ -45,39 +48,20 @@ async def create_inspection(data: VehicleInspectionSchema, db: Session):
             title = " בעיה חריגה ברכב"
             message = f"זוהתה בעיה חריגה ברכב {plate_number} בתאריך {inspection_date_str}: {inspection.issues_found}"
             
+            dispatcher = NotificationDispatcher()
             for admin in admins:
-                notification = Notification(
-                    user_id=admin.employee_id,
-                    title=title,
-                    message=message,
-                    vehicle_id=data.vehicle_id,
-                    order_id=None,
-                    notification_type=NotificationType.system,
-                    seen=False
-                )
-                db.add(notification)
-                db.commit()
-                db.refresh(notification)
-                
-                try:
-                    await sio.emit("new_notification", {
-                        "id": str(notification.id),
-                        "user_id": str(notification.user_id),
-                        "title": notification.title,
-                        "message": notification.message,
-                        "notification_type": notification.notification_type.value,
-                        "sent_at": notification.sent_at.isoformat(),
-                        "vehicle_id": str(data.vehicle_id),
-                        "seen": False
-                    })
-                except Exception as socket_error:
-                    print(f"Socket emission failed for admin {admin.employee_id}: {socket_error}")
+                dispatcher.add(admin.employee_id, {
+                    "title": title,
+                    "message": message,
+                    "vehicle_id": data.vehicle_id,
+                })
+            await dispatcher.send_async(db)
         
         if not vehicle or not vehicle.last_user_id:
             print("No last_user_id found for vehicle, skipping notification.")
             
             try:
-                await sio.emit("new_inspection", {
+                await emit_event("new_inspection", {
                     "inspection_id": str(inspection.inspection_id),
                     "inspection_date": inspection.inspection_date.isoformat(),
                     "inspected_by": str(inspection.inspected_by),
@@ -94,15 +78,15 @@ async def create_inspection(data: VehicleInspectionSchema, db: Session):
             return inspection
 
         last_user_id = vehicle.last_user_id
-        last_ride = (
-        db.query(Ride)
-        .filter(
-            Ride.vehicle_id == data.vehicle_id,
-            Ride.user_id == last_user_id
+        last_ride = await db.scalar(
+            select(Ride)
+            .where(
+                Ride.vehicle_id == data.vehicle_id,
+                Ride.user_id == last_user_id
+            )
+            .order_by(Ride.submitted_at.desc())
+            .limit(1)
         )
-        .order_by(Ride.submitted_at.desc())
-        .first()
-    )
 
         if last_user_id:
             issues = []
@@ -136,8 +120,8 @@ async def create_inspection(data: VehicleInspectionSchema, db: Session):
             )
 
             db.add(notification)
-            db.commit()
-            db.refresh(notification)
+            await db.commit()
+            await db.refresh(notification)
             
             try:
                 await sio.emit("new_notification", {
@@ -149,12 +133,12 @@ async def create_inspection(data: VehicleInspectionSchema, db: Session):
                     "sent_at": notification.sent_at.isoformat(),
                     "vehicle_id": str(data.vehicle_id),
                     "seen": False
-                })
+                }, room=str(notification.user_id))
             except Exception as socket_error:
                 print(f"Socket emission failed: {socket_error}")
         
         try:
-            await sio.emit("new_inspection", {
+            await emit_event("new_inspection", {
                 "inspection_id": str(inspection.inspection_id),
                 "inspection_date": inspection.inspection_date.isoformat(),
                 "inspected_by": str(inspection.inspected_by),
@@ -171,6 +155,6 @@ async def create_inspection(data: VehicleInspectionSchema, db: Session):
         return inspection
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Failed on vehicle_id={data.vehicle_id}: {e}")
         raise HTTPException(status_code=500, detail="אירעה שגיאה בעת שמירת בדיקת הרכב.")
\ No newline at end of file
@@ -0,0 +1,210 @@
+from datetime import datetime
+from typing import BinaryIO, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Integer, column, select, text, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.orm import Session
+
+from ..models.vehicle_model import Vehicle
+from ..utils.socket_manager import emit_event
+from ..utils.spreadsheet_ingest import CHUNK_ROWS, RowBatch, iter_row_batches
+
+REQUIRED_COLUMNS = {"Vehicle ID", "Vehicle Name", "Mileage"}
+# Rows per UPDATE ... FROM (VALUES ...) statement
+UPDATE_CHUNK_SIZE = 1000
+
+_UUID_HEX = r"[0-9a-f]{32}"
+
+
+def _row_errors(rows: pd.DataFrame, mask: pd.Series, messages: pd.Series, with_vehicle_id: bool) -> List[dict]:
+    errors = []
+    for row_number, name, vehicle_id, message in zip(
+        rows.loc[mask, "row"], rows.loc[mask, "name"], rows.loc[mask, "vehicle_id"], messages[mask]
+    ):
+        error = {"row": int(row_number), "error": message, "name": name}
+        if with_vehicle_id:
+            error = {"row": int(row_number), "vehicle_id": vehicle_id, "error": message, "name": name}
+        errors.append(error)
+    return errors
+
+
+def _parse_uuids(raw: pd.Series) -> pd.Series:
+    """Canonical UUID strings, NaN where a value is not a UUID."""
+    hex_digits = (
+        raw.astype(str).str.strip().str.lower()
+        .str.replace(r"^urn:uuid:", "", regex=True)
+        .str.replace(r"[{}\-]", "", regex=True)
+    )
+    valid = hex_digits.str.fullmatch(_UUID_HEX)
+    canonical = (
+        hex_digits.str[0:8] + "-" + hex_digits.str[8:12] + "-" + hex_digits.str[12:16]
+        + "-" + hex_digits.str[16:20] + "-" + hex_digits.str[20:32]
+    )
+    return canonical.where(valid)
+
+
+def validate_mileage_frame(
+    df: pd.DataFrame, row_numbers: Optional[Sequence[int]] = None
+) -> Tuple[pd.DataFrame, List[dict]]:
+    """Check every row at once.
+
+    Returns the rows that passed (row, name, vehicle_id, mileage) and an
+    error per rejected row, in the shape the upload endpoint reports.
+    row_numbers are the sheet rows of df, by default 2, 3, ...
+    """
+    rows = pd.DataFrame({
+        "row": np.arange(len(df)) + 2 if row_numbers is None else np.asarray(row_numbers),
+        "name": df["Vehicle Name"].fillna("").astype(str).str.strip().replace("", "Unknown").to_numpy(),
+    })
+    raw_ids = df["Vehicle ID"].reset_index(drop=True)
+    raw_mileage = df["Mileage"].reset_index(drop=True)
+
+    rows["vehicle_id"] = _parse_uuids(raw_ids)
+    numeric = pd.to_numeric(raw_mileage, errors="coerce")
+
+    # The first failing check of a row is the one reported
+    message = pd.Series(np.nan, index=rows.index, dtype=object)
+
+    def reject(mask: pd.Series, text):
+        mask = mask & message.isna()
+        message[mask] = text[mask] if isinstance(text, pd.Series) else text
+        return mask
+
+    missing_id = reject(raw_ids.isna(), "חסר Vehicle ID בשורה")
+    bad_id = reject(rows["vehicle_id"].isna(), "Vehicle ID לא תקין: " + raw_ids.astype(str).str.strip())
+    reject(raw_mileage.isna(), "חסר ערך Mileage בשורה")
+    reject(numeric.isna() | ~np.isfinite(numeric), "ערך Mileage לא מספרי: " + raw_mileage.astype(str))
+    reject(numeric < 0, "ערך Mileage לא יכול להיות שלילי: " + numeric.astype(str))
+
+    failed = message.notna()
+    without_id = missing_id | bad_id
+    errors = _row_errors(rows, failed & without_id, message, with_vehicle_id=False)
+    errors += _row_errors(rows, failed & ~without_id, message, with_vehicle_id=True)
+    errors.sort(key=lambda error: error["row"])
+
+    valid = rows[~failed].copy()
+    valid["mileage"] = np.trunc(numeric[~failed]).astype("int64")
+    return valid, errors
+
+
+def apply_mileage_frame(db: Session, valid: pd.DataFrame) -> Tuple[List[dict], List[dict]]:
+    """Update the vehicles of validated rows; does not commit.
+
+    Readings of the same vehicle are applied in file order, the same way
+    whether they fall in one chunk or several: each must be at least the
+    vehicle's reading before it, so the highest one ends up stored.
+    Vehicles are looked up with one IN query, and the new readings are
+    written with UPDATE ... FROM (VALUES ...) per UPDATE_CHUNK_SIZE rows.
+    """
+    if valid.empty:
+        return [], []
+
+    current = dict(
+        (str(vehicle_id), mileage)
+        for vehicle_id, mileage in db.execute(
+            select(Vehicle.id, Vehicle.mileage).where(Vehicle.id.in_(valid["vehicle_id"].tolist()))
+        )
+    )
+    # A rejected reading is lower than the highest one before it, so the
+    # running maximum of all earlier rows is the reading the vehicle has
+    # when a row is applied
+    earlier = valid.groupby("vehicle_id")["mileage"].cummax().groupby(valid["vehicle_id"]).shift()
+    stored = valid["vehicle_id"].map(current)
+    current_mileage = np.fmax(stored, earlier).where(stored.notna())
+
+    message = pd.Series(np.nan, index=valid.index, dtype=object)
+    not_found = current_mileage.isna()
+    message[not_found] = "Vehicle not found"
+    lower = ~not_found & (valid["mileage"] < current_mileage)
+    message[lower] = (
+        "קריאת הקילומטרים החדשה (" + valid["mileage"].astype(str) + ") אינה יכולה להיות פחות מזו לפניה ("
+        + current_mileage.astype("Int64").astype(str) + ")"
+    )[lower]
+
+    failed = message.notna()
+    errors = _row_errors(valid, failed, message, with_vehicle_id=True)
+    updates = valid[~failed]
+    final = updates.drop_duplicates("vehicle_id", keep="last")
+
+    now = datetime.utcnow()
+    pairs = list(zip(final["vehicle_id"], final["mileage"].astype(int)))
+    for start in range(0, len(pairs), UPDATE_CHUNK_SIZE):
+        data = values(
+            column("id", PG_UUID(as_uuid=False)), column("mileage", Integer), name="data"
+        ).data(pairs[start:start + UPDATE_CHUNK_SIZE])
+        db.execute(
+            update(Vehicle)
+            .where(Vehicle.id == data.c.id)
+            .values(mileage=data.c.mileage, mileage_last_updated=now)
+            .execution_options(synchronize_session=False)
+        )
+
+    success = [
+        {"row": int(row_number), "vehicle_id": vehicle_id, "name": name, "new_mileage": int(mileage)}
+        for row_number, vehicle_id, name, mileage in zip(
+            updates["row"], updates["vehicle_id"], updates["name"], updates["mileage"]
+        )
+    ]
+    return success, errors
+
+
+def import_mileage_frame(
+    db: Session, df: pd.DataFrame, row_numbers: Optional[Sequence[int]] = None
+) -> Tuple[List[dict], List[dict]]:
+    valid, errors = validate_mileage_frame(df, row_numbers)
+    success, apply_errors = apply_mileage_frame(db, valid)
+    errors = sorted(errors + apply_errors, key=lambda error: error["row"])
+    return success, errors
+
+
+def _import_chunk(db: Session, batch: RowBatch, user_id) -> Tuple[List[dict], List[dict]]:
+    try:
+        # Transaction-local, since each chunk may run on another connection
+        db.execute(
+            text("SELECT set_config('session.audit.user_id', :user_id, true)"),
+            {"user_id": str(user_id)},
+        )
+        result = import_mileage_frame(db, batch.frame, batch.row_numbers)
+        db.commit()
+        return result
+    except Exception:
+        db.rollback()
+        raise
+
+
+async def ingest_mileage_upload(
+    db: Session,
+    file: BinaryIO,
+    filename: str,
+    user_id,
+    upload_id: str,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Tuple[List[dict], List[dict]]:
+    """Import a mileage sheet chunk by chunk, committing each chunk.
+
+    The file is read on a worker thread and every chunk is applied in the
+    threadpool; upload_progress is sent to the uploader after each one.
+    """
+    success: List[dict] = []
+    errors: List[dict] = []
+    progress = {"upload_id": upload_id, "rows": 0, "updated": 0, "errors": 0, "done": False}
+
+    async for batch in iter_row_batches(file, filename, REQUIRED_COLUMNS, chunk_rows):
+        try:
+            batch_success, batch_errors = await run_in_threadpool(_import_chunk, db, batch, user_id)
+        except Exception as e:
+            await emit_event("upload_progress", {**progress, "done": True, "failed": True}, user_id=user_id)
+            raise RuntimeError(
+                f"הייבוא נעצר בשורה {batch.first_row_number}; {len(success)} רכבים עודכנו לפני כן: {e}"
+            )
+
+        success += batch_success
+        errors += batch_errors
+        progress.update(rows=progress["rows"] + len(batch.frame), updated=len(success), errors=len(errors))
+        await emit_event("upload_progress", dict(progress), user_id=user_id)
+
+    await emit_event("upload_progress", {**progress, "done": True}, user_id=user_id)
+    return success, errors
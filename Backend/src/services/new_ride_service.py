@@ -1,33 +1,51 @@
 from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import select, text
 from uuid import uuid4, UUID
 from datetime import datetime, timedelta, timezone
 from ..helpers.department_helpers import is_vip_department
 
 from ..schemas.new_ride_schema import RideCreate, RideResponse
 from src.constants import OFFROAD_TYPES
-from ..services.user_notification import create_system_notification, get_supervisor_id, send_admin_odometer_notification
+from ..services.user_notification import create_system_notification, create_system_notification_async, get_supervisor_id, send_admin_odometer_notification
+from ..services.vehicle_availability_index import availability_index
+from ..services.deadline_scheduler import deadline_scheduler
+from ..services.daily_distance_ledger import daily_distance_ledger
+from ..services.route_ordering import order_ride_extra_stops
+from ..services.notification_dispatcher import NotificationDispatcher
 from ..models.ride_model import Ride, RideStatus
 from ..models.user_model import User
 from ..models.vehicle_model import Vehicle
 
-from ..utils.audit_utils import log_action
+from ..utils.audit_utils import log_action, set_audit_user, reset_audit_user
 from ..utils.socket_manager import sio, emit_new_ride_request, emit_ride_status_updated
 
 def is_offroad_vehicle(vehicle_type: str) -> bool:
     return any(keyword.lower() in vehicle_type.lower() for keyword in OFFROAD_TYPES)
 
-async def create_ride(db: Session, user_id: UUID, ride: RideCreate, license_check_passed: bool = False):
-    db.execute(text("SET session.audit.user_id = :user_id"), {"user_id": str(user_id)})
+def ride_route(ride: RideCreate):
+    """The ride's extra stops and estimated distance, reordered if asked to."""
+    if not ride.optimize_stops:
+        return ride.extra_stops or None, ride.estimated_distance_km
+    try:
+        extra_stops, estimated_distance_km = order_ride_extra_stops(
+            ride.start_location, ride.extra_stops, ride.stop, ride.estimated_distance_km
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return extra_stops or None, estimated_distance_km
+
+async def create_ride(db: AsyncSession, user_id: UUID, ride: RideCreate, license_check_passed: bool = False):
+    await set_audit_user(db, user_id)
 
-    vehicle = db.query(Vehicle).filter(Vehicle.id == ride.vehicle_id).first()
+    vehicle = await db.get(Vehicle, ride.vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehicle not found")
     if vehicle.lease_expiry <= datetime.utcnow():
         raise HTTPException(status_code=404, detail="Vehicle is expired")
 
-    user = db.query(User).filter(User.employee_id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -38,8 +56,8 @@ async def create_ride(db: Session, user_id: UUID, ride: RideCreate, license_chec
             detail=f"You are currently blocked from making any ride requests until {user.block_expires_at.strftime('%Y-%m-%d %H:%M:%S')}."
         )
     rider_id = ride.user_id if ride.user_id else user_id
-    rider = db.query(User).filter(User.employee_id == rider_id).first()
-    is_vip = is_vip_department(db, rider_id)
+    rider = await db.get(User, rider_id)
+    is_vip = await db.run_sync(lambda session: is_vip_department(session, rider_id))
     initial_status = RideStatus.approved if is_vip else RideStatus.pending
  
     if not rider:
@@ -81,6 +99,7 @@ async def create_ride(db: Session, user_id: UUID, ride: RideCreate, license_chec
                 detail="נסיעות של 4 ימים ומעלה דורשות הסבר"
             )
 
+    extra_stops, estimated_distance_km = ride_route(ride)
     new_ride = Ride(
         id=uuid4(),
         user_id=rider_id,
@@ -92,32 +111,37 @@ async def create_ride(db: Session, user_id: UUID, ride: RideCreate, license_chec
         start_location=ride.start_location,
         stop=ride.stop,
         destination=ride.destination,
-        estimated_distance_km=ride.estimated_distance_km,
+        estimated_distance_km=estimated_distance_km,
         actual_distance_km=ride.actual_distance_km,
         four_by_four_reason=ride.four_by_four_reason,
         extended_ride_reason=ride.extended_ride_reason,
         status=initial_status, 
         license_check_passed=license_check_passed,  
         submitted_at=datetime.now(timezone.utc),
-        extra_stops=ride.extra_stops or None,
+        extra_stops=extra_stops,
         approving_supervisor=ride.approving_supervisor 
     )
    
 
-    vehicle.mileage += ride.estimated_distance_km
+    vehicle.mileage += estimated_distance_km
 
     db.add(new_ride)
-    db.commit()
-    db.refresh(new_ride)
-    db.refresh(vehicle)
+    await db.commit()
+    await db.refresh(new_ride)
+    await db.refresh(vehicle)
+    availability_index.sync_ride(new_ride)
+    deadline_scheduler.sync_ride(new_ride)
+    daily_distance_ledger.sync_ride(new_ride)
     
     
     if rider_id == user_id and not is_vip:
-        create_system_notification(
+        await create_system_notification_async(
+            db,
             user_id=rider_id,
             title="בקשת נסיעה ממתינה לאישור",
             message="הבקשה שלך לנסיעה נשלחה וממתינה לאישור.",
-            order_id=new_ride.id
+            order_id=new_ride.id,
+            emit=False
         )
         await sio.emit("new_notification", {
         "id": str(uuid4()), 
@@ -130,13 +154,12 @@ async def create_ride(db: Session, user_id: UUID, ride: RideCreate, license_chec
         "order_id": str(new_ride.id),
         "order_status": new_ride.status.value,
         "seen": False
-    })
+    }, room=str(rider_id))
         
 
-    vehicle_info = db.query(
-        Vehicle.vehicle_model,
-        Vehicle.type
-    ).filter(Vehicle.id == ride.vehicle_id).first()
+    vehicle_info = (await db.execute(
+        select(Vehicle.vehicle_model, Vehicle.type).where(Vehicle.id == ride.vehicle_id)
+    )).first()
 
     await emit_new_ride_request({
         'ride_id': str(new_ride.id),
@@ -149,27 +172,29 @@ async def create_ride(db: Session, user_id: UUID, ride: RideCreate, license_chec
         'destination': new_ride.destination,
         'submitted_at': new_ride.submitted_at.isoformat(),
         'department_id': str(rider.department_id),
-    })
+    }, user_id=new_ride.user_id)
 
     if is_vip:
-        admins = db.query(User).filter(User.role == "admin").all()
-        for admin in admins:
-            create_system_notification(
-                user_id=admin.employee_id,
-                title="בקשת נסיעה חדשה ",
-                message = f"העובד/ת {rider.first_name} {rider.last_name} ממחלקת VIP יצר בקשת נסיעה חדשה.",
-            )
+        admin_ids = (await db.execute(select(User.employee_id).where(User.role == "admin"))).scalars().all()
+        dispatcher = NotificationDispatcher()
+        for admin_id in admin_ids:
+            dispatcher.add(admin_id, {
+                "title": "בקשת נסיעה חדשה ",
+                "message": f"העובד/ת {rider.first_name} {rider.last_name} ממחלקת VIP יצר בקשת נסיעה חדשה.",
+            })
+        await dispatcher.send_async(db)
 
     await emit_ride_status_updated(
         ride_id=str(new_ride.id),
         new_status=new_ride.status.value,
-        department_id=str(rider.department_id)
+        department_id=str(rider.department_id),
+        user_id=new_ride.user_id
     )
-    await send_admin_odometer_notification(vehicle.id, vehicle.mileage)
+    await send_admin_odometer_notification(vehicle.id, vehicle.mileage, db)
 
     
 
-    db.execute(text("SET session.audit.user_id = DEFAULT"))
+    await reset_audit_user(db)
 
     ride_response = RideResponse(
         **new_ride.__dict__,
@@ -181,16 +206,16 @@ async def create_ride(db: Session, user_id: UUID, ride: RideCreate, license_chec
 
     return ride_response
     
-async def create_supervisor_ride(db: Session, user_id: UUID, ride: RideCreate):
-    db.execute(text("SET session.audit.user_id = :user_id"), {"user_id": str(user_id)})
+async def create_supervisor_ride(db: AsyncSession, user_id: UUID, ride: RideCreate):
+    await set_audit_user(db, user_id)
 
-    vehicle = db.query(Vehicle).filter(Vehicle.id == ride.vehicle_id).first()
+    vehicle = await db.get(Vehicle, ride.vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehicle not found")
     if vehicle.lease_expiry <= datetime.utcnow():
         raise HTTPException(status_code=404, detail="Vehicle is expired")
 
-    requester = db.query(User).filter(User.employee_id == user_id).first()
+    requester = await db.get(User, user_id)
     if not requester:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -201,7 +226,7 @@ async def create_supervisor_ride(db: Session, user_id: UUID, ride: RideCreate):
             detail=f"You are currently blocked from making any ride requests until {requester.block_expires_at.strftime('%Y-%m-%d %H:%M:%S')}."
         )
     rider_id = ride.user_id if ride.user_id else user_id
-    rider = db.query(User).filter(User.employee_id == rider_id).first()
+    rider = await db.get(User, rider_id)
     if not rider:
         raise HTTPException(status_code=404, detail="Rider not found")
     if rider.is_blocked and rider.block_expires_at and now < rider.block_expires_at:
@@ -239,6 +264,7 @@ async def create_supervisor_ride(db: Session, user_id: UUID, ride: RideCreate):
         )
 
     license_check_passed = bool(getattr(rider, "has_government_license", False))
+    extra_stops, estimated_distance_km = ride_route(ride)
 
     new_ride = Ride(
         id=uuid4(),
@@ -251,21 +277,24 @@ async def create_supervisor_ride(db: Session, user_id: UUID, ride: RideCreate):
         start_location=ride.start_location,
         stop=ride.stop,
         destination=ride.destination,
-        estimated_distance_km=ride.estimated_distance_km,
+        estimated_distance_km=estimated_distance_km,
         actual_distance_km=ride.actual_distance_km,
         four_by_four_reason=ride.four_by_four_reason,
         status=RideStatus.approved,
         license_check_passed=license_check_passed,
         submitted_at=datetime.now(timezone.utc),
-        extra_stops=ride.extra_stops or None
+        extra_stops=extra_stops
     )
 
-    vehicle.mileage += ride.estimated_distance_km
+    vehicle.mileage += estimated_distance_km
 
     db.add(new_ride)
-    db.commit()
-    db.refresh(new_ride)
-    db.refresh(vehicle)
+    await db.commit()
+    await db.refresh(new_ride)
+    await db.refresh(vehicle)
+    availability_index.sync_ride(new_ride)
+    deadline_scheduler.sync_ride(new_ride)
+    daily_distance_ledger.sync_ride(new_ride)
     
     if rider_id != user_id:
         if getattr(requester, "isRaan", True):  
@@ -275,11 +304,13 @@ async def create_supervisor_ride(db: Session, user_id: UUID, ride: RideCreate):
 
         notification_title = "נסיעה הוזמנה עבורך"
 
-        create_system_notification(
+        await create_system_notification_async(
+            db,
             user_id=rider_id,
             title=notification_title,
             message=notification_message,
-            order_id=new_ride.id
+            order_id=new_ride.id,
+            emit=False
         )
 
         await sio.emit("new_notification", {
@@ -295,13 +326,15 @@ async def create_supervisor_ride(db: Session, user_id: UUID, ride: RideCreate):
         }, room=str(rider_id))
 
 
-    await sio.emit("ride_status_updated", {
-        "ride_id": str(new_ride.id),
-        "new_status": new_ride.status.value
-    })
-    await send_admin_odometer_notification(vehicle.id, vehicle.mileage)
+    await emit_ride_status_updated(
+        ride_id=str(new_ride.id),
+        new_status=new_ride.status.value,
+        department_id=rider.department_id,
+        user_id=new_ride.user_id
+    )
+    await send_admin_odometer_notification(vehicle.id, vehicle.mileage, db)
 
-    db.execute(text("SET session.audit.user_id = DEFAULT"))
+    await reset_audit_user(db)
 
     ride_response = RideResponse(
         **new_ride.__dict__,
@@ -0,0 +1,117 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.orm import Session
+
+from ..models.no_show_events import NoShowEvent
+from ..models.ride_model import Ride, RideStatus
+from ..models.user_model import User
+from ..models.vehicle_model import Vehicle
+
+# Users with at least this many no-shows are reported to the admins
+NO_SHOW_ALERT_THRESHOLD = 3
+
+
+def _occurred_between(query, from_date: Optional[datetime], to_date: Optional[datetime]):
+    if from_date:
+        query = query.where(NoShowEvent.occurred_at >= from_date)
+    if to_date:
+        query = query.where(NoShowEvent.occurred_at <= to_date)
+    return query
+
+
+def no_show_counts_per_user(
+    db: Session,
+    min_count: Optional[int] = None,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> List[dict]:
+    """No-shows grouped by user in one query, most first.
+
+    Each row has the user's details, the number of no-shows and the
+    distinct plates of the missed rides. With min_count only users at or
+    above it are returned.
+    """
+    no_show_count = func.count(NoShowEvent.id)
+    # Events whose ride is gone have no plate
+    plate_numbers = func.array_remove(func.array_agg(Vehicle.plate_number.distinct()), literal_column("NULL"))
+    query = (
+        select(
+            NoShowEvent.user_id,
+            User.username,
+            User.first_name,
+            User.last_name,
+            User.email,
+            User.role,
+            User.department_id,
+            no_show_count.label("no_show_count"),
+            plate_numbers.label("plate_numbers"),
+        )
+        .outerjoin(User, User.employee_id == NoShowEvent.user_id)
+        .outerjoin(Ride, Ride.id == NoShowEvent.ride_id)
+        .outerjoin(Vehicle, Vehicle.id == Ride.vehicle_id)
+        .group_by(
+            NoShowEvent.user_id,
+            User.username,
+            User.first_name,
+            User.last_name,
+            User.email,
+            User.role,
+            User.department_id,
+        )
+        .order_by(no_show_count.desc(), NoShowEvent.user_id)
+    )
+    query = _occurred_between(query, from_date, to_date)
+    if min_count is not None:
+        query = query.having(no_show_count >= min_count)
+    if offset:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return [
+        {
+            "employee_id": row.user_id,
+            "username": row.username,
+            "full_name": f"{row.first_name or ''} {row.last_name or ''}".strip(),
+            "email": row.email,
+            "role": row.role,
+            "department_id": row.department_id,
+            "no_show_count": row.no_show_count,
+            "plate_numbers": list(row.plate_numbers or []),
+        }
+        for row in db.execute(query)
+    ]
+
+
+def no_show_totals(db: Session, from_date: Optional[datetime] = None, to_date: Optional[datetime] = None) -> dict:
+    """Event count, distinct users and completed rides in one round trip."""
+    events = _occurred_between(
+        select(
+            func.count(NoShowEvent.id).label("total"),
+            func.count(NoShowEvent.user_id.distinct()).label("users"),
+        ),
+        from_date,
+        to_date,
+    ).subquery()
+
+    completed = select(func.count(Ride.id)).where(
+        Ride.status == RideStatus.completed,
+        Ride.completion_date.isnot(None),
+    )
+    if from_date:
+        completed = completed.where(Ride.completion_date >= from_date)
+    if to_date:
+        completed = completed.where(Ride.completion_date <= to_date)
+
+    row = db.execute(
+        select(events.c.total, events.c.users, completed.scalar_subquery().label("completed"))
+    ).one()
+    return {
+        "total_no_show_events": row.total,
+        "unique_no_show_users": row.users,
+        "completed_rides_count": row.completed,
+    }
@@ -0,0 +1,191 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+# Utils
+from ..utils.socket_manager import sio
+
+# Models
+from ..models.notification_model import Notification, NotificationType
+
+
+# Payload keys that are stored on the notification row; anything else in a
+# payload is only added to the socket event (e.g. plate_number, order_status)
+NOTIFICATION_FIELDS = ("title", "message", "order_id", "vehicle_id", "relevant_user_id", "dedupe_key")
+
+# Rows per INSERT statement, well below the bind parameter limit
+INSERT_CHUNK_SIZE = 1000
+
+
+def _str_or_none(value):
+    return str(value) if value is not None else None
+
+
+def dedupe_key(kind: str, *parts) -> str:
+    """Key for a notification that must only be sent once, e.g.
+    dedupe_key("inactive_vehicle", vehicle_id, admin_id)."""
+    return ":".join([kind, *(str(part) for part in parts)])
+
+
+def _insert_statement(mappings: List[dict]):
+    # Rows whose dedupe_key already exists are skipped by the partial unique
+    # index; RETURNING tells us which rows were actually written
+    return (
+        pg_insert(Notification)
+        .values(mappings)
+        .on_conflict_do_nothing(
+            index_elements=[Notification.dedupe_key],
+            index_where=Notification.dedupe_key.isnot(None),
+        )
+        .returning(Notification.id)
+    )
+
+
+def _chunks(rows: List, size: int = INSERT_CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+class NotificationDispatcher:
+    """Writes and emits notifications for many recipients in one go.
+
+    Collect (recipient_id, payload) pairs with `add`, then call `send` (sync
+    Session) or `send_async` (AsyncSession). Rows are inserted with one
+    INSERT ... ON CONFLICT DO NOTHING, so payloads carrying a `dedupe_key`
+    that was already sent are dropped, and the socket events are grouped per
+    recipient room.
+    """
+
+    def __init__(self, event: str = "new_notification"):
+        self.event = event
+        self._pending: List[Tuple[UUID, dict]] = []
+
+    def add(self, recipient_id: UUID, payload: dict):
+        if recipient_id:
+            self._pending.append((recipient_id, payload))
+
+    def extend(self, pairs: Iterable[Tuple[UUID, dict]]):
+        for recipient_id, payload in pairs:
+            self.add(recipient_id, payload)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _build_rows(self) -> List[Tuple[dict, dict]]:
+        now = datetime.now(timezone.utc)
+        rows = []
+        for recipient_id, payload in self._pending:
+            row = {
+                "id": uuid4(),
+                "user_id": recipient_id,
+                "notification_type": NotificationType.system,
+                "sent_at": now,
+                "seen": False,
+            }
+            for field in NOTIFICATION_FIELDS:
+                row[field] = payload.get(field)
+            extras = {k: v for k, v in payload.items() if k not in NOTIFICATION_FIELDS}
+            rows.append((row, extras))
+        self._pending = []
+        return rows
+
+    @staticmethod
+    def _keep_inserted(rows: List[Tuple[dict, dict]], inserted_ids: set) -> List[Tuple[dict, dict]]:
+        return [(row, extras) for row, extras in rows if row["id"] in inserted_ids]
+
+    def write(self, db: Session, commit: bool = True) -> List[Tuple[dict, dict]]:
+        rows = self._build_rows()
+        if not rows:
+            return []
+
+        inserted_ids = set()
+        for chunk in _chunks(rows):
+            inserted_ids.update(db.execute(_insert_statement([row for row, _ in chunk])).scalars())
+        if commit:
+            db.commit()
+        return self._keep_inserted(rows, inserted_ids)
+
+    async def write_async(self, db: AsyncSession, commit: bool = True) -> List[Tuple[dict, dict]]:
+        rows = self._build_rows()
+        if not rows:
+            return []
+
+        inserted_ids = set()
+        for chunk in _chunks(rows):
+            result = await db.execute(_insert_statement([row for row, _ in chunk]))
+            inserted_ids.update(result.scalars())
+        if commit:
+            await db.commit()
+        return self._keep_inserted(rows, inserted_ids)
+
+    @staticmethod
+    def socket_payload(row: dict, extras: dict) -> dict:
+        payload = {
+            "id": str(row["id"]),
+            "user_id": str(row["user_id"]),
+            "title": row["title"],
+            "message": row["message"],
+            "notification_type": row["notification_type"].value,
+            "sent_at": row["sent_at"].isoformat(),
+            "order_id": _str_or_none(row["order_id"]),
+            "vehicle_id": _str_or_none(row["vehicle_id"]),
+            "relevant_user_id": _str_or_none(row["relevant_user_id"]),
+            "seen": False,
+        }
+        for key, value in extras.items():
+            payload[key] = _str_or_none(value) if isinstance(value, UUID) else value
+        return payload
+
+    @classmethod
+    def payloads_by_room(cls, rows: List[Tuple[dict, dict]]) -> Dict[str, List[dict]]:
+        by_room = defaultdict(list)
+        for row, extras in rows:
+            by_room[str(row["user_id"])].append(cls.socket_payload(row, extras))
+        return by_room
+
+    async def _emit_room(self, room: str, payloads: List[dict]):
+        try:
+            if len(payloads) == 1:
+                await sio.emit(self.event, payloads[0], room=room)
+            else:
+                await sio.emit(f"{self.event}_batch", payloads, room=room)
+        except Exception as e:
+            print(f"❌ Failed to emit {self.event} to room {room}: {e}")
+
+    async def emit(self, rows: List[Tuple[dict, dict]]):
+        by_room = self.payloads_by_room(rows)
+        await asyncio.gather(*(self._emit_room(room, payloads) for room, payloads in by_room.items()))
+
+    async def send(self, db: Session, commit: bool = True) -> List[Tuple[dict, dict]]:
+        rows = self.write(db, commit=commit)
+        await self.emit(rows)
+        return rows
+
+    async def send_async(self, db: AsyncSession, commit: bool = True) -> List[Tuple[dict, dict]]:
+        rows = await self.write_async(db, commit=commit)
+        await self.emit(rows)
+        return rows
+
+
+async def notify_once(db: Session, recipient_id: UUID, key: str, event: str = "new_notification", **payload) -> Optional[dict]:
+    """Send a notification unless one with the same dedupe key exists.
+
+    Returns the emitted payload, or None when it was already sent.
+    """
+    dispatcher = NotificationDispatcher(event=event)
+    dispatcher.add(recipient_id, {**payload, "dedupe_key": key})
+    rows = await dispatcher.send(db)
+    return NotificationDispatcher.socket_payload(*rows[0]) if rows else None
+
+
+async def notify_once_async(db: AsyncSession, recipient_id: UUID, key: str, event: str = "new_notification", **payload) -> Optional[dict]:
+    dispatcher = NotificationDispatcher(event=event)
+    dispatcher.add(recipient_id, {**payload, "dedupe_key": key})
+    rows = await dispatcher.send_async(db)
+    return NotificationDispatcher.socket_payload(*rows[0]) if rows else None
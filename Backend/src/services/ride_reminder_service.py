@@ -10,7 +10,7 @@ from src.models.user_model import User
 from src.models.city_model import City
 from src.models.vehicle_model import Vehicle
 from src.utils.database import SessionLocal
-from src.utils.scheduler import scheduler
+from src.utils.scheduler import RIDE_REMINDER_GRACE_SECONDS, ride_jobstore, scheduler
 
 
 logger = logging.getLogger(__name__)
@@ -37,7 +37,9 @@ def schedule_ride_reminder_email(ride_id: UUID, scheduled_start_time: datetime):
             run_date=reminder_time,
             args=[str(ride_id)],
             id=job_id,
-            replace_existing=True
+            jobstore=ride_jobstore(),
+            replace_existing=True,
+            misfire_grace_time=RIDE_REMINDER_GRACE_SECONDS,
         )
         logger.info(f" Scheduled ride reminder email for ride {ride_id} at {reminder_time}")
     except Exception as e:
@@ -0,0 +1,147 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+# Services
+from .city_distances import city_distances
+
+
+# Up to this many stops the order is exact (Held-Karp, 2^n * n^2 work);
+# above it nearest neighbour improved by 2-opt
+EXACT_MAX_STOPS = 10
+
+
+def _popcounts(n: int) -> np.ndarray:
+    masks = np.arange(1 << n)
+    counts = np.zeros(1 << n, dtype=np.intp)
+    for bit in range(n):
+        counts += (masks >> bit) & 1
+    return counts
+
+
+def _exact_order(legs: np.ndarray) -> List[int]:
+    """Held-Karp over legs, a matrix of [start, *stops, end].
+
+    Subsets are processed one size at a time, each size in a single numpy
+    step. Returns the stops as positions 1..n of legs.
+    """
+    n = legs.shape[0] - 2
+    from_start = legs[0, 1:n + 1]
+    to_end = legs[1:n + 1, n + 1]
+    between = legs[1:n + 1, 1:n + 1]
+
+    size = 1 << n
+    bits = 1 << np.arange(n)
+    # cost[mask, k]: shortest path from start through the stops in mask,
+    # ending at stop k
+    cost = np.full((size, n), np.inf)
+    parent = np.full((size, n), -1, dtype=np.intp)
+    cost[bits, np.arange(n)] = from_start
+
+    masks = np.arange(size)
+    counts = _popcounts(n)
+    for layer in range(1, n):
+        current = masks[counts == layer]
+        candidates = cost[current][:, :, None] + between[None, :, :]
+        best_previous = candidates.argmin(axis=1)
+        best = np.take_along_axis(candidates, best_previous[:, None, :], axis=1)[:, 0, :]
+        rows, stops = np.nonzero((current[:, None] & bits[None, :]) == 0)
+        targets = current[rows] | bits[stops]
+        cost[targets, stops] = best[rows, stops]
+        parent[targets, stops] = best_previous[rows, stops]
+
+    mask = size - 1
+    last = int(np.argmin(cost[mask] + to_end))
+    order = []
+    while last >= 0:
+        order.append(last + 1)
+        last, mask = int(parent[mask, last]), mask ^ (1 << last)
+    order.reverse()
+    return order
+
+
+def _nearest_neighbour(legs: np.ndarray) -> List[int]:
+    n = legs.shape[0] - 2
+    remaining = set(range(1, n + 1))
+    path = [0]
+    while remaining:
+        following = min(remaining, key=lambda stop: legs[path[-1], stop])
+        remaining.remove(following)
+        path.append(following)
+    return path + [n + 1]
+
+
+def _two_opt(legs: np.ndarray, path: List[int]) -> np.ndarray:
+    """Reverse segments while that shortens the path; the ends stay fixed."""
+    path = np.array(path, dtype=np.intp)
+    while True:
+        heads, tails = path[:-1], path[1:]
+        edges = legs[heads, tails]
+        # Reversing path[i+1:j+1] swaps edges i and j for (head_i, head_j)
+        # and (tail_i, tail_j)
+        change = (
+            legs[heads[:, None], heads[None, :]]
+            + legs[tails[:, None], tails[None, :]]
+            - edges[:, None]
+            - edges[None, :]
+        )
+        change = np.triu(change, 1)
+        i, j = np.unravel_index(np.argmin(change), change.shape)
+        if change[i, j] >= -1e-9:
+            return path
+        path[i + 1:j + 1] = path[i + 1:j + 1][::-1].copy()
+
+
+def _path_length(legs: np.ndarray, path: Sequence[int]) -> float:
+    path = np.asarray(path, dtype=np.intp)
+    return float(legs[path[:-1], path[1:]].sum())
+
+
+def _heuristic_order(legs: np.ndarray) -> List[int]:
+    n = legs.shape[0] - 2
+    # Starting from the order as entered too means the result is never
+    # longer than what the user typed
+    paths = [_two_opt(legs, _nearest_neighbour(legs)), _two_opt(legs, list(range(n + 2)))]
+    best = min(paths, key=lambda path: _path_length(legs, path))
+    return [int(stop) for stop in best[1:-1]]
+
+
+def order_stops(
+    start_id,
+    stop_ids: Sequence,
+    end_id,
+    db: Optional[Session] = None,
+) -> Tuple[list, float]:
+    """Order stop_ids to make start -> stops -> end as short as possible.
+
+    Returns the stops in that order (as given, duplicates kept) and the
+    route distance in km, computed the same way as /api/distance. Raises
+    KeyError for an unknown city.
+    """
+    stop_ids = list(stop_ids)
+    legs = city_distances.legs([start_id, *stop_ids, end_id], db)
+    if len(stop_ids) > 1:
+        order = _exact_order(legs) if len(stop_ids) <= EXACT_MAX_STOPS else _heuristic_order(legs)
+        stop_ids = [stop_ids[position - 1] for position in order]
+    return stop_ids, city_distances.route_distance([start_id, *stop_ids, end_id], db)
+
+
+def order_ride_extra_stops(
+    start_location, extra_stops: Optional[Sequence], stop, estimated_distance_km: float
+) -> Tuple[Optional[list], float]:
+    """A ride's extra stops in the order that makes start -> extra stops -> stop shortest.
+
+    Also returns estimated_distance_km for that order. The ride form sends
+    the route in the order typed plus its own additions (e.g. for Tel
+    Aviv); those are kept and the route part is recomputed.
+    """
+    if not extra_stops or len(extra_stops) < 2:
+        return extra_stops, estimated_distance_km
+    try:
+        typed = city_distances.route_distance([start_location, *extra_stops, stop])
+        ordered, shortest = order_stops(start_location, extra_stops, stop)
+    except KeyError as e:
+        raise ValueError(f"City with ID {e.args[0]} not found")
+    additions = max(float(estimated_distance_km or 0) - typed, 0.0)
+    return ordered, round(shortest + additions, 2)
@@ -4,17 +4,21 @@ from typing import List
 from uuid import UUID
 
 from fastapi import HTTPException
-from sqlalchemy import String, func, or_, text, desc
+from sqlalchemy import String, func, or_, select, text, desc
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from ..models.department_model import Department
 
 # Utils
-from ..utils.audit_utils import log_action
-from ..utils.socket_manager import emit_ride_status_updated, sio
+from ..utils.audit_utils import log_action, set_audit_user, reset_audit_user
+from ..utils.socket_manager import emit_event, emit_ride_status_updated, sio
 
 # Services
 from .vehicle_service import update_vehicle_status
+from .vehicle_availability_index import availability_index
+from .deadline_scheduler import deadline_scheduler
+from .daily_distance_ledger import daily_distance_ledger
 
 # Schemas
 from ..schemas.check_vehicle_schema import VehicleInspectionSchema
@@ -122,14 +126,13 @@ def get_department_specific_order(department_id: str, order_id: str, db: Session
     return order_details
 
 
-async def edit_order_status(department_id: str, order_id: str, new_status: str, user_id: UUID, db: Session, rejection_reason: str | None = None) -> bool:
-    db.execute(text("SET session.audit.user_id = :user_id"), {"user_id": str(user_id)})
+async def edit_order_status(department_id: str, order_id: str, new_status: str, user_id: UUID, db: AsyncSession, rejection_reason: str | None = None) -> bool:
+    await set_audit_user(db, user_id)
     
-    order = (
-        db.query(Ride)
+    order = await db.scalar(
+        select(Ride)
         .join(User, User.employee_id == Ride.user_id)
-        .filter(Ride.id == order_id, User.department_id == department_id)
-        .first()
+        .where(Ride.id == order_id, User.department_id == department_id)
     )
 
     if not order:
@@ -138,7 +141,10 @@ async def edit_order_status(department_id: str, order_id: str, new_status: str,
     order.status = new_status
     if new_status.lower() == "rejected":
         order.rejection_reason = rejection_reason
-    db.commit()
+    await db.commit()
+    availability_index.sync_ride(order)
+    deadline_scheduler.sync_ride(order)
+    daily_distance_ledger.sync_ride(order)
 
     hebrew_status_map = {
         "approved": "אושרה",
@@ -157,17 +163,17 @@ async def edit_order_status(department_id: str, order_id: str, new_status: str,
     )
 
     db.add(notification)
-    db.commit()
-    db.refresh(notification)
+    await db.commit()
+    await db.refresh(notification)
 
-    user = db.query(User).filter(User.employee_id == order.user_id).first()
-    vehicle = db.query(Vehicle).filter(Vehicle.id == order.vehicle_id).first()
+    user = await db.get(User, order.user_id)
 
     if user and user.department_id:
         await emit_ride_status_updated(
             ride_id=str(order.id),
             new_status=order.status,
-            department_id=str(user.department_id)
+            department_id=str(user.department_id),
+            user_id=order.user_id
         )
 
     await sio.emit("new_notification", {
@@ -182,7 +188,7 @@ async def edit_order_status(department_id: str, order_id: str, new_status: str,
         "seen": False
     }, room=str(order.user_id))
 
-    db.execute(text("SET session.audit.user_id = DEFAULT"))
+    await reset_audit_user(db)
 
     return order, notification
 
@@ -205,48 +211,54 @@ def get_department_notifications(department_id: UUID, db: Session) -> List[Notif
     return notifications
 
 
-async def start_ride(db: Session, ride_id: UUID):
-    ride = db.query(Ride).filter(Ride.id == ride_id).first()
+async def start_ride(db: AsyncSession, ride_id: UUID):
+    ride = await db.get(Ride, ride_id)
     if not ride:
         raise HTTPException(status_code=404, detail="Ride not found")
 
     if ride.status != RideStatus.approved:
         raise HTTPException(status_code=400, detail="Ride must be approved before starting")
 
-    vehicle = db.query(Vehicle).filter(Vehicle.id == ride.vehicle_id).first()
+    vehicle = await db.get(Vehicle, ride.vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Assigned vehicle not found")
 
     if vehicle.status != VehicleStatus.available:
         raise HTTPException(status_code=400, detail="Vehicle is not available")
 
-    update_vehicle_status(
+    await db.run_sync(lambda session: update_vehicle_status(
         vehicle_id=vehicle.id,
         new_status=VehicleStatus.in_use,
         freeze_reason=None,
         freeze_details=None,
-        db=db,
+        db=session,
         changed_by=ride.user_id
-    )
+    ))
     vehicle.last_used_at = func.now()
 
     ride.actual_pickup_time = datetime.now(timezone.utc)
     ride.status = RideStatus.in_progress
 
-    db.execute(text("SET session.audit.user_id = :user_id"), {"user_id": f"{ride.user_id}"})
-
-    db.commit()
-    db.refresh(ride)
-    db.refresh(vehicle)
-
-    await sio.emit("ride_status_updated", {
-        "ride_id": str(ride.id),
-        "new_status": ride.status.value
-    })
+    await set_audit_user(db, ride.user_id)
+
+    await db.commit()
+    await db.refresh(ride)
+    await db.refresh(vehicle)
+    availability_index.sync_ride(ride)
+    deadline_scheduler.sync_ride(ride)
+    daily_distance_ledger.sync_ride(ride)
+
+    rider = await db.get(User, ride.user_id)
+    await emit_ride_status_updated(
+        ride_id=str(ride.id),
+        new_status=ride.status.value,
+        department_id=rider.department_id if rider else None,
+        user_id=ride.user_id
+    )
 
-    await sio.emit("vehicle_status_updated", {
-        "ride_id": str(vehicle.id),
-        "new_status": vehicle.status.value
+    await emit_event("vehicle_status_updated", {
+        "id": str(vehicle.id),
+        "status": vehicle.status.value
     })
 
     return ride, vehicle
@@ -0,0 +1,220 @@
+import argparse
+import calendar
+from datetime import datetime
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+# Utils
+from ..utils.database import engine
+from ..utils.leader_election import advisory_key
+
+# Only completed rides count as usage; a ride belongs to the month it starts in
+#
+# Ride writes go through the rides_usage_rollup trigger, which records the
+# (vehicle, month) keys a change touches in usage_rollup_dirty. refresh_dirty
+# recomputes just those keys from rides, so every path that completes or edits
+# a ride (the completion form, auto-completion, admin edits) is covered and a
+# refresh can run any number of times without counting a ride twice.
+# Inserting keys NOTIFYs USAGE_ROLLUP_DIRTY_CHANNEL, which wakes the leader.
+#
+# SKIP LOCKED hands each refresh its own vehicle keys, but the department rows
+# are rebuilt per month, so a refresh or backfill first takes a transaction
+# advisory lock on every month it touches (in order, so two runs can't
+# deadlock) and overlapping runs queue instead of colliding on the unique key.
+
+REFRESH_BATCH_SIZE = 500
+USAGE_ROLLUP_DIRTY_CHANNEL = "usage_rollup_dirty"
+
+Month = Tuple[int, int]
+
+
+def month_hours(year: int, month: int) -> int:
+    return calendar.monthrange(year, month)[1] * 24
+
+
+def _months(first: Month, last: Month) -> List[Month]:
+    months = []
+    year, month = first
+    while (year, month) <= last:
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def hours_between(first: Month, last: Month) -> int:
+    """Hours in the months from first to last, both included."""
+    return sum(month_hours(year, month) for year, month in _months(first, last))
+
+
+def utilisation_percent(usage_hours: float, available_hours: float) -> float:
+    if not available_hours:
+        return 0.0
+    return round((float(usage_hours or 0) / available_hours) * 100, 1)
+
+
+_DELETE_VEHICLE_KEYS = text("""
+    DELETE FROM monthly_vehicle_usage m
+    USING unnest(CAST(:vehicle_ids AS uuid[]), CAST(:years AS int[]), CAST(:months AS int[]))
+        AS k(vehicle_id, year, month)
+    WHERE m.vehicle_id = k.vehicle_id AND m.year = k.year AND m.month = k.month
+""")
+
+_INSERT_VEHICLE_KEYS = text("""
+    INSERT INTO monthly_vehicle_usage (id, vehicle_id, year, month, total_rides, total_km, usage_hours)
+    SELECT gen_random_uuid(), k.vehicle_id, k.year, k.month,
+           count(*),
+           COALESCE(sum(r.actual_distance_km), 0),
+           COALESCE(sum(extract(epoch FROM r.end_datetime - r.start_datetime)), 0) / 3600.0
+    FROM unnest(CAST(:vehicle_ids AS uuid[]), CAST(:years AS int[]), CAST(:months AS int[]))
+        AS k(vehicle_id, year, month)
+    JOIN rides r
+      ON r.vehicle_id = k.vehicle_id
+     AND r.status = 'completed'
+     AND r.start_datetime >= make_date(k.year, k.month, 1)
+     AND r.start_datetime < make_date(k.year, k.month, 1) + interval '1 month'
+    JOIN vehicles v ON v.id = k.vehicle_id
+    GROUP BY k.vehicle_id, k.year, k.month
+""")
+
+_DELETE_DEPARTMENT_MONTHS = text("""
+    DELETE FROM monthly_department_usage d
+    USING unnest(CAST(:years AS int[]), CAST(:months AS int[])) AS k(year, month)
+    WHERE d.year = k.year AND d.month = k.month
+""")
+
+_INSERT_DEPARTMENT_MONTHS = text("""
+    INSERT INTO monthly_department_usage
+        (id, department_id, year, month, total_rides, total_km, usage_hours, vehicles_used)
+    SELECT gen_random_uuid(), u.department_id, k.year, k.month,
+           count(*),
+           COALESCE(sum(r.actual_distance_km), 0),
+           COALESCE(sum(extract(epoch FROM r.end_datetime - r.start_datetime)), 0) / 3600.0,
+           count(DISTINCT r.vehicle_id)
+    FROM unnest(CAST(:years AS int[]), CAST(:months AS int[])) AS k(year, month)
+    JOIN rides r
+      ON r.status = 'completed'
+     AND r.start_datetime >= make_date(k.year, k.month, 1)
+     AND r.start_datetime < make_date(k.year, k.month, 1) + interval '1 month'
+    JOIN users u ON u.employee_id = r.user_id
+    GROUP BY u.department_id, k.year, k.month
+""")
+
+_INSERT_VEHICLE_MONTH = text("""
+    INSERT INTO monthly_vehicle_usage (id, vehicle_id, year, month, total_rides, total_km, usage_hours)
+    SELECT gen_random_uuid(), r.vehicle_id, :year, :month,
+           count(*),
+           COALESCE(sum(r.actual_distance_km), 0),
+           COALESCE(sum(extract(epoch FROM r.end_datetime - r.start_datetime)), 0) / 3600.0
+    FROM rides r
+    JOIN vehicles v ON v.id = r.vehicle_id
+    WHERE r.status = 'completed'
+      AND r.start_datetime >= make_date(:year, :month, 1)
+      AND r.start_datetime < make_date(:year, :month, 1) + interval '1 month'
+    GROUP BY r.vehicle_id
+""")
+
+
+def _lock_months(conn, months: Iterable[Month]):
+    for year, month in sorted(months):
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"),
+            {"key": advisory_key(f"vehicle-desk:usage-rollup:{year}-{month:02d}")},
+        )
+
+
+def _refresh_keys(conn, keys: Iterable[Tuple[str, int, int]]):
+    keys = list(keys)
+    if not keys:
+        return
+    months: Set[Month] = {(year, month) for _, year, month in keys}
+    _lock_months(conn, months)
+
+    vehicle_params = {
+        "vehicle_ids": [str(vehicle_id) for vehicle_id, _, _ in keys],
+        "years": [year for _, year, _ in keys],
+        "months": [month for _, _, month in keys],
+    }
+    conn.execute(_DELETE_VEHICLE_KEYS, vehicle_params)
+    conn.execute(_INSERT_VEHICLE_KEYS, vehicle_params)
+
+    # A department's month is cheap to rebuild whole, and a ride moving
+    # between vehicles or riders may change several departments at once
+    month_params = {"years": [year for year, _ in months], "months": [month for _, month in months]}
+    conn.execute(_DELETE_DEPARTMENT_MONTHS, month_params)
+    conn.execute(_INSERT_DEPARTMENT_MONTHS, month_params)
+
+
+def refresh_dirty(batch_size: int = REFRESH_BATCH_SIZE) -> int:
+    """Recompute the rollup rows of rides changed since the last refresh."""
+    refreshed = 0
+    while True:
+        with engine.begin() as conn:
+            keys = conn.execute(
+                text("""
+                    DELETE FROM usage_rollup_dirty
+                    WHERE (vehicle_id, year, month) IN (
+                        SELECT vehicle_id, year, month FROM usage_rollup_dirty
+                        LIMIT :limit FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING vehicle_id, year, month
+                """),
+                {"limit": batch_size},
+            ).all()
+            _refresh_keys(conn, keys)
+        refreshed += len(keys)
+        if len(keys) < batch_size:
+            return refreshed
+
+
+def backfill(first: Optional[Month] = None, last: Optional[Month] = None) -> int:
+    """Rebuild the rollups from rides, one month per transaction."""
+    with engine.connect() as conn:
+        bounds = conn.execute(text(
+            "SELECT min(start_datetime), max(start_datetime) FROM rides WHERE status = 'completed'"
+        )).one()
+    if bounds[0] is None:
+        print("📊 No completed rides to roll up")
+        return 0
+
+    first = first or (bounds[0].year, bounds[0].month)
+    last = last or (bounds[1].year, bounds[1].month)
+    months = _months(first, last)
+    for year, month in months:
+        params = {"years": [year], "months": [month]}
+        with engine.begin() as conn:
+            _lock_months(conn, [(year, month)])
+            conn.execute(
+                text("DELETE FROM monthly_vehicle_usage WHERE year = :year AND month = :month"),
+                {"year": year, "month": month},
+            )
+            conn.execute(_INSERT_VEHICLE_MONTH, {"year": year, "month": month})
+            conn.execute(_DELETE_DEPARTMENT_MONTHS, params)
+            conn.execute(_INSERT_DEPARTMENT_MONTHS, params)
+        print(f"📊 Rolled up usage for {year}-{month:02d}")
+    return len(months)
+
+
+def run_refresh_usage_rollups():
+    try:
+        refresh_dirty()
+    except Exception as e:
+        print(f"❌ Failed to refresh usage rollups: {e}")
+
+
+def _parse_month(value: str) -> Month:
+    parsed = datetime.strptime(value, "%Y-%m")
+    return parsed.year, parsed.month
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the monthly usage rollups from rides")
+    parser.add_argument("command", choices=["backfill", "refresh"])
+    parser.add_argument("--from", dest="first", type=_parse_month, help="first month, YYYY-MM")
+    parser.add_argument("--to", dest="last", type=_parse_month, help="last month, YYYY-MM")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        backfill(args.first, args.last)
+    else:
+        print(f"📊 Refreshed {refresh_dirty()} usage rollup keys")
@@ -11,6 +11,11 @@ from ..models.vehicle_model import Vehicle
 from ..schemas.order_card_item import OrderCardItem
 from ..schemas.user_response_schema import UserUpdate
 from ..helpers.department_helpers import is_vip_department
+from ..services.vehicle_availability_index import availability_index
+from ..services.deadline_scheduler import deadline_scheduler
+from ..services.daily_distance_ledger import daily_distance_ledger
+from ..services.route_ordering import order_ride_extra_stops
+from ..utils.socket_manager import emit_event
 from datetime import datetime, timezone
 
 async def patch_order_in_db(
@@ -40,6 +45,7 @@ async def patch_order_in_db(
     original_status = order.status
 
     data = patch_data.dict(exclude_unset=True)
+    optimize_stops = data.pop("optimize_stops", False)
 
 
     if "start_datetime" in data and data["start_datetime"]:
@@ -58,6 +64,14 @@ async def patch_order_in_db(
 
     for key, value in data.items():
         setattr(order, key, value)
+
+    if optimize_stops:
+        try:
+            order.extra_stops, order.estimated_distance_km = order_ride_extra_stops(
+                order.start_location, order.extra_stops, order.stop, order.estimated_distance_km
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
     def _status_value(s):
         return s.value if hasattr(s, "value") else str(s)
@@ -123,12 +137,15 @@ async def patch_order_in_db(
     db.commit()
     
     if "status" in data and new_status == "completed" and old_status != "completed":
-        await sio.emit("vehicle_mileage_updated", {
+        await emit_event("vehicle_mileage_updated", {
             "vehicle_id": str(order.vehicle_id),
             "new_mileage": vehicle.mileage if vehicle else None
         })
 
     db.refresh(order)
+    availability_index.sync_ride(order)
+    deadline_scheduler.sync_ride(order)
+    daily_distance_ledger.sync_ride(order)
 
 
     if (
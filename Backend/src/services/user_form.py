@@ -3,7 +3,8 @@ from datetime import datetime, timezone
 import asyncio
 import os
 from dotenv import load_dotenv
-from sqlalchemy import text
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
 
@@ -16,11 +17,14 @@ from ..models.vehicle_model import Vehicle, VehicleStatus,FreezeReason
 
 from ..schemas.form_schema import CompletionFormData
 
-from ..utils.socket_manager import sio
+from ..utils.audit_utils import set_audit_user
+from ..utils.socket_manager import emit_event, emit_ride_status_updated
 from .user_notification import create_system_notification_with_db, get_user_name
 
-from ..services.admin_rides_service import update_monthly_usage_stats
 from ..services.user_notification import emit_new_notification
+from ..services.vehicle_availability_index import availability_index
+from ..services.deadline_scheduler import deadline_scheduler
+from ..services.daily_distance_ledger import daily_distance_ledger
 
 load_dotenv() 
 BOOKIT_URL = os.getenv("BOOKIT_FRONTEND_URL", "http://localhost:4200")
@@ -185,12 +189,14 @@ def mark_feedback_submitted(db: Session, ride_id: str):
 #     return {"message": "Completion form processed successfully."}
 
 
-async def process_completion_form(db: Session, user: User, form_data: CompletionFormData):
+async def process_completion_form(db: AsyncSession, user: User, form_data: CompletionFormData):
     try:
-        ride = db.query(Ride).filter_by(
-            id=form_data.ride_id,
-            user_id=user.employee_id
-        ).first()
+        ride = await db.scalar(
+            select(Ride).where(
+                Ride.id == form_data.ride_id,
+                Ride.user_id == user.employee_id
+            )
+        )
 
         if not ride:
             raise HTTPException(
@@ -198,24 +204,23 @@ async def process_completion_form(db: Session, user: User, form_data: Completion
                 detail="Ride not found"
             )
 
-        db.execute(
-            text("SET session.audit.user_id = :user_id"),
-            {"user_id": str(user.employee_id)}
-        )
+        await set_audit_user(db, user.employee_id)
 
-        supervisors = db.query(User).filter_by(
-            department_id=user.department_id,
-            role=UserRole.supervisor
-        ).all()
+        supervisors = (await db.execute(
+            select(User).where(
+                User.department_id == user.department_id,
+                User.role == UserRole.supervisor
+            )
+        )).scalars().all()
 
         if form_data.emergency_event:
             ride.emergency_event = form_data.emergency_event
 
         ride.status = RideStatus.completed
-        ride.completion_date = datetime.now(timezone.utc)
-        update_monthly_usage_stats(db=db, ride=ride)
+        ride.completion_date = datetime.utcnow()
+        # Monthly usage is rolled up from the completed ride by the rides trigger
 
-        vehicle = db.query(Vehicle).filter_by(id=ride.vehicle_id).first()
+        vehicle = await db.get(Vehicle, ride.vehicle_id)
         if not vehicle:
             raise HTTPException(404, "Vehicle not found")
 
@@ -249,28 +254,37 @@ async def process_completion_form(db: Session, user: User, form_data: Completion
 
         ride.feedback_submitted = True
 
-        db.commit()
+        await db.commit()
+        availability_index.sync_ride(ride)
+        deadline_scheduler.sync_ride(ride)
+        daily_distance_ledger.sync_ride(ride)
         cancelled_result = None
 
         if vehicle_becomes_frozen:
-            cancelled_result =  cancel_future_rides_for_vehicle(vehicle.id, db,user.employee_id,ride.id)
+            cancelled_result = await db.run_sync(
+                lambda session: cancel_future_rides_for_vehicle(vehicle.id, session, user.employee_id, ride.id)
+            )
         if cancelled_result is None:
             cancelled_result = {"cancelled": [], "users": []}
 
-            await sio.emit('reservationCanceledDueToVehicleFreeze', {
+        affected_users = [str(u) for u in cancelled_result["users"]]
+        if affected_users:
+            await emit_event('reservationCanceledDueToVehicleFreeze', {
                 "vehicle_id": str(vehicle.id),
                 "cancelled_rides": cancelled_result["cancelled"],
-                "affected_users": [str(u) for u in cancelled_result["users"]],
+                "affected_users": affected_users,
                 "status": vehicle.status,
                 "freeze_reason": vehicle.freeze_reason or ""
-            })
+            }, user_id=affected_users)
 
-        await sio.emit('ride_status_updated', {
-            "ride_id": str(ride.id),
-            "new_status": ride.status.value,
-        })
+        await emit_ride_status_updated(
+            ride_id=str(ride.id),
+            new_status=ride.status.value,
+            department_id=user.department_id,
+            user_id=ride.user_id
+        )
 
-        await sio.emit('vehicle_status_updated', {
+        await emit_event('vehicle_status_updated', {
             "vehicle_id": str(vehicle.id),
             "status": vehicle.status.value,
         })
@@ -286,7 +300,7 @@ async def process_completion_form(db: Session, user: User, form_data: Completion
         return response
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Failed to process completion form, rolling back: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -3,6 +3,8 @@ from datetime import datetime, timedelta, timezone
 from uuid import UUID
 
 from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from ..models.department_model import Department
@@ -11,7 +13,8 @@ from ..models.ride_model import Ride, RideStatus
 from ..models.user_model import User
 from ..models.vehicle_model import Vehicle
 from ..schemas.notification_schema import NotificationOut
-from ..utils.database import SessionLocal
+from ..services.notification_dispatcher import NotificationDispatcher, dedupe_key
+from ..utils.database import SessionLocal, async_session_scope, get_request_session
 from ..utils.socket_manager import sio
 
 def get_user_notifications(db: Session, user_id: UUID):
@@ -67,6 +70,18 @@ async def send_notification_async(
 
 
 def create_system_notification(user_id, title, message, order_id=None,vehicle_id=None,relevant_user_id=None):
+    # Inside a request the row joins the request's session and is written by
+    # its next commit; elsewhere it gets a session of its own, so this commit
+    # never commits a caller's unfinished transaction
+    request_db = get_request_session()
+    if request_db is not None:
+        notif = create_system_notification_with_db(
+            request_db, user_id, title, message, order_id=order_id, vehicle_id=vehicle_id
+        )
+        notif.relevant_user_id = relevant_user_id
+        request_db.flush()
+        return notif
+
     db = SessionLocal()
     try:
         notif = Notification(
@@ -120,58 +135,82 @@ def create_system_notification_with_db(db: Session, user_id, title, message, ord
     db.add(notif)
     return notif
 
-async def send_admin_odometer_notification(vehicle_id: UUID, mileage: float):
-    db = SessionLocal()
+async def create_system_notification_async(
+    db: AsyncSession,
+    user_id,
+    title,
+    message,
+    order_id=None,
+    vehicle_id=None,
+    relevant_user_id=None,
+    emit: bool = True,
+):
+    notif = Notification(
+        user_id=user_id,
+        notification_type=NotificationType.system,
+        title=title,
+        message=message,
+        sent_at=datetime.now(timezone.utc),
+        order_id=order_id,
+        vehicle_id=vehicle_id,
+        relevant_user_id=relevant_user_id
+    )
+    db.add(notif)
+    await db.commit()
+    await db.refresh(notif)
+
+    if emit:
+        await sio.emit("new_notification", {
+            "id": str(notif.id),
+            "title": notif.title,
+            "message": notif.message,
+            "notification_type": notif.notification_type.value,
+            "sent_at": notif.sent_at.isoformat(),
+            "order_id": str(notif.order_id) if notif.order_id else None,
+            "vehicle_id": str(notif.vehicle_id) if notif.vehicle_id else None,
+            "relevant_user_id": str(notif.relevant_user_id) if notif.relevant_user_id else None,
+            "seen": False
+        }, room=str(user_id))
+
+    return notif
+
+
+async def send_admin_odometer_notification(vehicle_id: UUID, mileage: float, db: AsyncSession = None):
+    if db is None:
+        async with async_session_scope() as session:
+            return await send_admin_odometer_notification(vehicle_id, mileage, session)
+
     try:
-        admins = db.query(User).filter(User.role == 'admin').all()
-        if not admins or mileage < 10000:
+        if mileage < 10000:
+            return None
+
+        admin_ids = (await db.execute(select(User.employee_id).where(User.role == 'admin'))).scalars().all()
+        if not admin_ids:
             return None
 
         plate_number = None
         if vehicle_id:
-            plate_number = (
-                db.query(Vehicle.plate_number)
-                .filter(Vehicle.id == vehicle_id)
-                .scalar()
+            plate_number = await db.scalar(
+                select(Vehicle.plate_number).where(Vehicle.id == vehicle_id)
             )
 
-        notifications = []
-        for admin in admins:
-            exists_admin = db.query(Notification).filter(
-                Notification.user_id == admin.employee_id,
-                Notification.vehicle_id == vehicle_id,
-                Notification.title == "Vehicle Odometer Update"
-            ).first()
-            if not exists_admin:
-                notif = Notification(
-                    user_id=admin.employee_id,
-                    notification_type=NotificationType.system,
-                    title="Vehicle Odometer Update",
-                    message = f"הרכב {plate_number} עבר את מכסת הקילומטראז' של 10,000 ק״מ",
-                    sent_at=datetime.now(timezone.utc),
-                    vehicle_id=vehicle_id
-                )
-                db.add(notif)
-                notifications.append(notif)
+        dispatcher = NotificationDispatcher()
+        for admin_id in admin_ids:
+            dispatcher.add(admin_id, {
+                "title": "Vehicle Odometer Update",
+                "message": f"הרכב {plate_number} עבר את מכסת הקילומטראז' של 10,000 ק״מ",
+                "vehicle_id": vehicle_id,
+                "dedupe_key": dedupe_key("odometer", vehicle_id, admin_id)
+            })
+        rows = await dispatcher.write_async(db)
 
-        db.commit()
+        for room, payloads in NotificationDispatcher.payloads_by_room(rows).items():
+            await sio.emit("new_odometer_notification", {"updated_notifications": payloads}, room=room)
 
-        if notifications:
-            for notif in notifications:
-                await sio.emit(
-                    "new_odometer_notification",
-                    {"updated_notifications": [notif.to_dict()]},
-                    room=str(notif.user_id)
-                )
-
-        return notifications
+        return rows
     except Exception as e:
+        await db.rollback()
         print(f"Exception in send_admin_odometer_notification: {e}")
-    finally:
-        db.close()
-
-
-
 
 
 
@@ -14,6 +14,9 @@ from src.schemas.ride_status_enum import RideStatusEnum
 
 from ..utils.audit_utils import log_action
 from ..utils.auth import get_current_user
+from ..services.vehicle_availability_index import availability_index
+from ..services.deadline_scheduler import deadline_scheduler
+from ..services.daily_distance_ledger import daily_distance_ledger
 
 
 
@@ -138,6 +141,9 @@ async def update_ride_status(
     ride.status = new_status
     db.commit()
     db.refresh(ride)
+    availability_index.sync_ride(ride)
+    deadline_scheduler.sync_ride(ride)
+    daily_distance_ledger.sync_ride(ride)
 
     if rider and rider.department_id:
         await emit_ride_status_updated(
@@ -161,7 +167,8 @@ async def update_ride_status(
                 'destination': ride.destination,
                 'submitted_at': ride.submitted_at.isoformat() if ride.submitted_at else None,
                 'department_id': str(rider.department_id)
-            }
+            },
+            user_id=ride.user_id
         )
 
     db.execute(text("SET session.audit.user_id = DEFAULT"))
@@ -228,18 +235,22 @@ def get_archived_rides(user_id: UUID, db: Session) -> List[RideSchema]:
 
 
 def cancel_order_in_db(order_id: UUID, db: Session):
-    db.execute(text("SET session.audit.user_id = :user_id"), {"user_id": str(order.user_id)})
     order = db.query(Ride).filter(Ride.id == order_id).first()
 
     if not order:
         raise HTTPException(status_code=404, detail="הנסיעה לא נמצאה")
 
+    db.execute(text("SET session.audit.user_id = :user_id"), {"user_id": str(order.user_id)})
+
     if order.status == "cancelled":
         raise HTTPException(status_code=400, detail="הנסיעה כבר בוטלה")
 
     order.status = "cancelled"
     db.commit()
     db.refresh(order)
+    availability_index.sync_ride(order)
+    deadline_scheduler.sync_ride(order)
+    daily_distance_ledger.sync_ride(order)
     return order
 
 
@@ -0,0 +1,227 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+# Utils
+from ..utils.database import SessionLocal
+from ..utils.time_utils import to_scheduler_time
+
+# Models
+from ..models.ride_model import Ride, RideStatus
+
+
+# Rides in these states hold the vehicle for their time window
+ACTIVE_RIDE_STATUSES = {
+    RideStatus.pending,
+    RideStatus.approved,
+    RideStatus.in_progress,
+}
+
+# A vehicle must be back this long before its next reservation starts
+RETURN_BUFFER = timedelta(hours=2)
+
+
+def _to_status(value) -> Optional[RideStatus]:
+    try:
+        return RideStatus(value)
+    except ValueError:
+        return None
+
+
+class _VehicleTimeline:
+    """Reservations of one vehicle sorted by start time.
+
+    `max_end[i]` is the latest end among the first i+1 reservations, so
+    "does anything overlap [t1, t2)" is a bisect on the starts plus one
+    lookup, and only real candidates are scanned after that.
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[datetime, datetime, UUID, RideStatus]] = []
+        self.starts: List[datetime] = []
+        self.max_end: List[datetime] = []
+
+    def _rebuild(self):
+        self.starts = [entry[0] for entry in self.entries]
+        self.max_end = []
+        latest = None
+        for entry in self.entries:
+            latest = entry[1] if latest is None or entry[1] > latest else latest
+            self.max_end.append(latest)
+
+    def add(self, start: datetime, end: datetime, ride_id: UUID, status: RideStatus):
+        insort(self.entries, (start, end, ride_id, status), key=lambda e: e[0])
+        self._rebuild()
+
+    def remove(self, ride_id: UUID) -> bool:
+        kept = [entry for entry in self.entries if entry[2] != ride_id]
+        if len(kept) == len(self.entries):
+            return False
+        self.entries = kept
+        self._rebuild()
+        return True
+
+    def has_overlap(
+        self,
+        start: datetime,
+        end: datetime,
+        exclude_ride_id: Optional[UUID] = None,
+        statuses: Optional[Set[RideStatus]] = None,
+    ) -> bool:
+        i = bisect_left(self.starts, end) - 1
+        while i >= 0 and self.max_end[i] > start:
+            entry_start, entry_end, ride_id, status = self.entries[i]
+            if (
+                entry_end > start
+                and ride_id != exclude_ride_id
+                and (statuses is None or status in statuses)
+            ):
+                return True
+            i -= 1
+        return False
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class VehicleAvailabilityIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timelines: Dict[UUID, _VehicleTimeline] = {}
+        self._ride_vehicle: Dict[UUID, UUID] = {}
+        self.loaded = False
+
+    def warm(self, db: Session):
+        rows = (
+            db.query(Ride.id, Ride.vehicle_id, Ride.start_datetime, Ride.end_datetime, Ride.status)
+            .filter(
+                Ride.status.in_(ACTIVE_RIDE_STATUSES),
+                Ride.vehicle_id.isnot(None),
+                Ride.is_archive == False,
+            )
+            .all()
+        )
+
+        timelines: Dict[UUID, _VehicleTimeline] = {}
+        ride_vehicle: Dict[UUID, UUID] = {}
+        for ride_id, vehicle_id, start, end, status in rows:
+            if not start or not end:
+                continue
+            timeline = timelines.setdefault(vehicle_id, _VehicleTimeline())
+            timeline.entries.append((start, end, ride_id, _to_status(status)))
+            ride_vehicle[ride_id] = vehicle_id
+
+        for timeline in timelines.values():
+            timeline.entries.sort(key=lambda e: e[0])
+            timeline._rebuild()
+
+        with self._lock:
+            self._timelines = timelines
+            self._ride_vehicle = ride_vehicle
+            self.loaded = True
+
+        print(f"🚗 Availability index loaded: {len(ride_vehicle)} reservations on {len(timelines)} vehicles")
+
+    def ensure_loaded(self, db: Session):
+        if not self.loaded:
+            self.warm(db)
+
+    def _remove_locked(self, ride_id: UUID):
+        vehicle_id = self._ride_vehicle.pop(ride_id, None)
+        if vehicle_id is None:
+            return
+        timeline = self._timelines.get(vehicle_id)
+        if timeline is not None:
+            timeline.remove(ride_id)
+            if not len(timeline):
+                del self._timelines[vehicle_id]
+
+    def sync_ride(self, ride: Ride):
+        """Reflect the current state of a ride (call after commit)."""
+        if ride is None or ride.id is None:
+            return
+        status = _to_status(ride.status)
+        keep = (
+            status in ACTIVE_RIDE_STATUSES
+            and ride.vehicle_id is not None
+            and not ride.is_archive
+            and ride.start_datetime is not None
+            and ride.end_datetime is not None
+        )
+        with self._lock:
+            self._remove_locked(ride.id)
+            if keep:
+                timeline = self._timelines.setdefault(ride.vehicle_id, _VehicleTimeline())
+                timeline.add(ride.start_datetime, ride.end_datetime, ride.id, status)
+                self._ride_vehicle[ride.id] = ride.vehicle_id
+
+    def sync_rides(self, rides: Iterable[Ride]):
+        for ride in rides:
+            self.sync_ride(ride)
+
+    def remove_ride(self, ride_id: UUID):
+        with self._lock:
+            self._remove_locked(ride_id)
+
+    def apply_changes(self, rides: Iterable[Ride], deleted_ids: Iterable[UUID]):
+        """Rides changed or deleted by any worker (see ride_change_listener)."""
+        self.sync_rides(rides)
+        for ride_id in deleted_ids:
+            self.remove_ride(ride_id)
+
+    def remove_vehicle(self, vehicle_id: UUID):
+        with self._lock:
+            timeline = self._timelines.pop(vehicle_id, None)
+            if timeline is not None:
+                for entry in timeline.entries:
+                    self._ride_vehicle.pop(entry[2], None)
+
+    def is_free(
+        self,
+        vehicle_id: UUID,
+        start_time: datetime,
+        end_time: datetime,
+        exclude_ride_id: Optional[UUID] = None,
+        statuses: Optional[Set[RideStatus]] = None,
+        with_buffer: bool = True,
+    ) -> bool:
+        start_time = to_scheduler_time(start_time)
+        end_time = to_scheduler_time(end_time)
+        if with_buffer:
+            end_time = end_time + RETURN_BUFFER
+        with self._lock:
+            timeline = self._timelines.get(vehicle_id)
+            if timeline is None:
+                return True
+            return not timeline.has_overlap(start_time, end_time, exclude_ride_id, statuses)
+
+    def free_vehicles(
+        self,
+        vehicles: Iterable,
+        start_time: datetime,
+        end_time: datetime,
+        exclude_ride_id: Optional[UUID] = None,
+        statuses: Optional[Set[RideStatus]] = None,
+        with_buffer: bool = True,
+    ) -> List:
+        return [
+            v for v in vehicles
+            if self.is_free(v.id, start_time, end_time, exclude_ride_id, statuses, with_buffer)
+        ]
+
+
+availability_index = VehicleAvailabilityIndex()
+
+
+def warm_availability_index():
+    db = SessionLocal()
+    try:
+        availability_index.warm(db)
+    except Exception as e:
+        print(f"❌ Failed to warm availability index: {e}")
+    finally:
+        db.close()
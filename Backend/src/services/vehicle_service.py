@@ -5,7 +5,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from sqlalchemy.types import String
 from datetime import datetime, timezone, date, timedelta
-from typing import Optional, List, Dict, Union
+from typing import Optional, List, Dict, Set, Union
 from uuid import UUID
 from sqlalchemy import or_
 
@@ -27,10 +27,13 @@ from ..models.notification_model import Notification, NotificationType
 
 # Utils
 from ..utils.audit_utils import log_action
-from src.utils.database import SessionLocal
+from src.utils.database import session_scope
 
 # Services
-from ..services.user_notification import create_system_notification
+from ..services.user_notification import create_system_notification_with_db
+from ..services.vehicle_availability_index import availability_index
+from ..services.deadline_scheduler import deadline_scheduler
+from ..services.daily_distance_ledger import DAILY_LIMIT_RIDE_STATUSES, daily_distance_ledger, fits_electric_range
 
 # Schemas
 from ..schemas.check_vehicle_schema import VehicleInspectionSchema
@@ -48,16 +51,16 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
 def get_vehicle_km_driven_on_date(db: Session, vehicle_id: int, day: date) -> float:
-    start = datetime.combine(day, datetime.min.time())
-    end = datetime.combine(day, datetime.max.time())
+    return daily_distance_ledger.km_for_vehicle(db, vehicle_id, day)
 
-    rides = db.query(Ride).filter(
-        Ride.vehicle_id == vehicle_id,
-        Ride.start_datetime >= start,
-        Ride.start_datetime <= end
-    ).all()
-    print("rides:",rides)
-    return sum(r.actual_distance_km or 0 for r in rides)
+
+def get_km_driven_per_vehicle_on_date(
+    db: Session,
+    day: date,
+    exclude_ride_id: Optional[UUID] = None,
+    statuses: Optional[Set[RideStatus]] = None,
+) -> Dict[UUID, float]:
+    return daily_distance_ledger.km_by_vehicle(db, day, exclude_ride_id, statuses)
 
 
 
@@ -112,33 +115,10 @@ def get_available_vehicles_new_ride(
             )
         )
 
-    if start_time and end_time:
-        end_time_with_buffer = end_time + timedelta(hours=2)
-
-        overlapping_rides = (
-    db.query(Ride.vehicle_id)
-    .filter(
-        Ride.status.in_([
-            RideStatus.pending,
-            RideStatus.approved,
-            RideStatus.in_progress
-        ]),
-        or_(
-            and_(Ride.start_datetime <= start_time,
-                 Ride.end_datetime > start_time),
-
-            and_(Ride.start_datetime < end_time_with_buffer,
-                 Ride.end_datetime >= end_time_with_buffer),
-
-            and_(Ride.start_datetime >= start_time,
-                 Ride.end_datetime <= end_time_with_buffer)
-        )
-    )
-    .subquery()
-)
-
-        query = query.filter(~Vehicle.id.in_(overlapping_rides))
     cars=query.all()
+    if start_time and end_time:
+        availability_index.ensure_loaded(db)
+        cars = availability_index.free_vehicles(cars, start_time, end_time)
     return cars
 
 def get_vehicles_for_ride_edit(
@@ -182,28 +162,18 @@ def get_vehicles_for_ride_edit(
                 Vehicle.department_id == None
             )
         )
+    vehicles = query.all()
+    exclude_uuid = None
+    if exclude_ride_id:
+        try:
+            exclude_uuid = UUID(exclude_ride_id) if isinstance(exclude_ride_id, str) else exclude_ride_id
+        except Exception as e:
+            print(f"Error excluding ride from conflicts: {e}")
     if start_time and end_time:
-        end_time_with_buffer = end_time + timedelta(hours=2)
-        overlapping_rides_query = db.query(Ride.vehicle_id).filter(
-            or_(
-                and_(Ride.start_datetime <= start_time, Ride.end_datetime > start_time),
-                and_(Ride.start_datetime < end_time_with_buffer, Ride.end_datetime >= end_time_with_buffer),
-                and_(Ride.start_datetime >= start_time, Ride.end_datetime <= end_time_with_buffer)
-            )
+        availability_index.ensure_loaded(db)
+        vehicles = availability_index.free_vehicles(
+            vehicles, start_time, end_time, exclude_ride_id=exclude_uuid
         )
-        if exclude_ride_id:
-            try:
-                ride_uuid = UUID(exclude_ride_id) if isinstance(exclude_ride_id, str) else exclude_ride_id
-                overlapping_rides_query = overlapping_rides_query.filter(
-                    Ride.id != ride_uuid
-                )
-            except Exception as e:
-                print(f"Error excluding ride from conflicts: {e}")
-        
-        overlapping_rides = overlapping_rides_query.subquery()
-        query = query.filter(~Vehicle.id.in_(overlapping_rides))
-    
-    vehicles = query.all()
     if original_vehicle and original_vehicle_id:
         is_available = (
             original_vehicle.status == VehicleStatus.available and
@@ -223,25 +193,9 @@ def get_vehicles_for_ride_edit(
         is_not_conflicting = True
         if start_time and end_time:
             try:
-                end_time_with_buffer = end_time + timedelta(hours=2)
-                conflicting_ride_query = db.query(Ride).filter(
-                    Ride.vehicle_id == original_vehicle_id,
-                    or_(
-                        and_(Ride.start_datetime <= start_time, Ride.end_datetime > start_time),
-                        and_(Ride.start_datetime < end_time_with_buffer, Ride.end_datetime >= end_time_with_buffer),
-                        and_(Ride.start_datetime >= start_time, Ride.end_datetime <= end_time_with_buffer)
-                    )
+                is_not_conflicting = availability_index.is_free(
+                    original_vehicle_id, start_time, end_time, exclude_ride_id=exclude_uuid
                 )
-                if exclude_ride_id:
-                    try:
-                        ride_uuid = UUID(exclude_ride_id) if isinstance(exclude_ride_id, str) else exclude_ride_id
-                        conflicting_ride_query = conflicting_ride_query.filter(
-                            Ride.id != ride_uuid
-                        )
-                    except:
-                        pass
-                conflicting_ride = conflicting_ride_query.first()
-                is_not_conflicting = conflicting_ride is None
             except Exception as e:
                 print(f"Error checking conflicts for original vehicle: {e}")
                 is_not_conflicting = False
@@ -259,14 +213,13 @@ def get_vehicles_for_ride_edit(
     electric_low = []
     hybrid = []
     fuel = []
+    km_by_vehicle = get_km_driven_per_vehicle_on_date(db, ride_date or date.today())
     
     for v in vehicles:
         try:
             if v.fuel_type == "electric":
-                km_today = get_vehicle_km_driven_on_date(
-                    db, v.id, ride_date or date.today()
-                )
-                if distance_km + float(km_today) <= 200:
+                km_today = km_by_vehicle.get(v.id, 0)
+                if fits_electric_range(distance_km, km_today):
                     electric.append(v)
                 else:
                     electric_low.append(v)
@@ -325,20 +278,12 @@ def get_vip_vehicles_for_ride(
     if type:
         query = query.filter(func.lower(Vehicle.type) == type.lower())
 
+    vehicles = query.all()
     if start_time and end_time:
-        end_time_with_buffer = end_time + timedelta(hours=2)
-
-        overlapping_rides = db.query(Ride.vehicle_id).filter(
-            or_(
-                and_(Ride.start_datetime <= start_time, Ride.end_datetime > start_time),
-                and_(Ride.start_datetime < end_time_with_buffer, Ride.end_datetime >= end_time_with_buffer),
-                and_(Ride.start_datetime >= start_time, Ride.end_datetime <= end_time_with_buffer)
-            )
-        ).subquery()
+        availability_index.ensure_loaded(db)
+        vehicles = availability_index.free_vehicles(vehicles, start_time, end_time)
 
-        query = query.filter(~Vehicle.id.in_(overlapping_rides))
-
-    return query.all()
+    return vehicles
 
 
 
@@ -367,7 +312,8 @@ def update_vehicle_status(
     changed_by: UUID, 
     notes: Optional[str] = None
 ):
-    db.execute(text("SET session.audit.user_id = :user_id"), {"user_id": str(changed_by)})
+    # set_config() instead of SET so this also runs under AsyncSession.run_sync (asyncpg)
+    db.execute(text("SELECT set_config('session.audit.user_id', :user_id, false)"), {"user_id": str(changed_by)})
     vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehicle not found")
@@ -426,6 +372,7 @@ def update_vehicle_status(
                 cancellation_reason += f": {freeze_details}"
 
             affected_users = set()
+            notifications = []
 
             for ride in affected_rides:
                 ride.status = RideStatus.cancelled_vehicle_unavailable
@@ -436,13 +383,17 @@ def update_vehicle_status(
                 title = "נסיעה בוטלה"
                 message = f"לצערנו הנסיעה שלך בוטלה. {cancellation_reason}"
                 
-                notif = create_system_notification(
+                # Same transaction as the freeze: committed or rolled back together
+                notifications.append((ride, create_system_notification_with_db(
+                    db,
                     user_id=ride.user_id,
                     title=title,
                     message=message,
                     order_id=ride.id
-                )
-                
+                )))
+
+            db.flush()
+            for ride, notif in notifications:
                 notifications_to_emit.append({
                     'id': str(notif.id),
                     'user_id': str(notif.user_id),
@@ -462,6 +413,10 @@ def update_vehicle_status(
 
         db.commit()
         db.refresh(vehicle)
+        if new_status == VehicleStatus.frozen:
+            availability_index.sync_rides(affected_rides)
+            deadline_scheduler.sync_rides(affected_rides)
+            daily_distance_ledger.sync_rides(affected_rides)
 
     except SQLAlchemyError as e:
         db.rollback()
@@ -497,26 +452,10 @@ def get_available_vehicles_for_ride_by_id(db: Session, ride_id: UUID, user_depar
     end_datetime = ride.end_datetime
     ride_distance = ride.estimated_distance_km
 
-    conflicting_vehicles_subquery = (
-        db.query(Ride.vehicle_id)
-        .filter(
-            Ride.status.in_(["approved", "in_progress"]),
-            Ride.id != ride_id,
-            or_(
-                and_(Ride.start_datetime <= start_datetime, Ride.end_datetime > start_datetime),
-                and_(Ride.start_datetime < end_datetime, Ride.end_datetime >= end_datetime),
-                and_(Ride.start_datetime >= start_datetime, Ride.end_datetime <= end_datetime),
-                and_(Ride.start_datetime <= start_datetime, Ride.end_datetime >= end_datetime),
-            )
-        )
-        .subquery()
-    )
-
     candidate_vehicles = (
         db.query(Vehicle).filter(
             Vehicle.status == "available",
             Vehicle.is_archived == False,
-            ~Vehicle.id.in_(select(conflicting_vehicles_subquery.c.vehicle_id))
         )
     )
     if user_department_id:
@@ -526,9 +465,18 @@ def get_available_vehicles_for_ride_by_id(db: Session, ride_id: UUID, user_depar
                 Vehicle.department_id == user_department_id
             )
         )
-    candidate_vehicles = candidate_vehicles.all()
-    today_start = datetime.combine(start_datetime.date(), datetime.min.time())
-    today_end = today_start + timedelta(days=1)
+    availability_index.ensure_loaded(db)
+    candidate_vehicles = availability_index.free_vehicles(
+        candidate_vehicles.all(),
+        start_datetime,
+        end_datetime,
+        exclude_ride_id=ride_id,
+        statuses={RideStatus.approved, RideStatus.in_progress},
+        with_buffer=False,
+    )
+    km_by_vehicle = get_km_driven_per_vehicle_on_date(
+        db, start_datetime.date(), exclude_ride_id=ride_id, statuses=DAILY_LIMIT_RIDE_STATUSES
+    )
 
     available_vehicles = []
     for vehicle in candidate_vehicles:
@@ -536,15 +484,9 @@ def get_available_vehicles_for_ride_by_id(db: Session, ride_id: UUID, user_depar
             available_vehicles.append(vehicle)
             continue
 
-        used_distance = db.query(func.coalesce(func.sum(Ride.actual_distance_km), 0)).filter(
-            Ride.vehicle_id == vehicle.id,
-            Ride.id != ride_id,
-            Ride.start_datetime >= today_start,
-            Ride.start_datetime < today_end,
-            Ride.status.in_(["approved", "in_progress", "completed"]) 
-        ).scalar()
+        used_distance = km_by_vehicle.get(vehicle.id, 0)
 
-        if (vehicle.max_daily_distance_km - used_distance) >= ride_distance:
+        if (float(vehicle.max_daily_distance_km) - used_distance) >= float(ride_distance or 0):
             available_vehicles.append(vehicle)
 
     return [VehicleOut.from_orm(vehicle) for vehicle in available_vehicles]
@@ -666,13 +608,15 @@ def get_available_vehicles_by_type_and_time(
 
 
 async def delete_vehicle(vehicle_id: UUID, db: Session, user_id: UUID):
-    db: Session = SessionLocal()
     try:
         vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
         if not vehicle:
             return {"error": "Vehicle not found"}
 
-        db.query(AuditLog).filter(AuditLog.entity_id == str(vehicle_id)).delete()
+        db.query(AuditLog).filter(
+            AuditLog.entity_type == "Vehicle",
+            AuditLog.entity_id == str(vehicle_id),
+        ).delete(synchronize_session=False)
 
         db.query(MonthlyVehicleUsage).filter(MonthlyVehicleUsage.vehicle_id == vehicle_id).delete()
         db.query(Notification).filter(Notification.vehicle_id == vehicle_id).delete()
@@ -688,6 +632,8 @@ async def delete_vehicle(vehicle_id: UUID, db: Session, user_id: UUID):
         db.delete(vehicle)
         db.execute(text("SET session.audit.user_id = :user_id"), {"user_id": str(user_id)})
         db.commit()
+        availability_index.remove_vehicle(vehicle_id)
+        daily_distance_ledger.sync_rides(rides)
 
         return {"message": "Vehicle and all related data deleted successfully."}
 
@@ -695,14 +641,11 @@ async def delete_vehicle(vehicle_id: UUID, db: Session, user_id: UUID):
         db.rollback()
         print(f"Exception in delete_vehicle: {e}")
         return {"error": str(e)}
-    finally:
-        db.close()
 
 
 
 async def get_inactive_vehicles():
-    db: Session = SessionLocal()
-    try:
+    with session_scope() as db:
         now = datetime.now(timezone.utc)
         one_week_ago = now - timedelta(days=7)
 
@@ -728,9 +671,6 @@ async def get_inactive_vehicles():
             return
         else :
             return inactive_vehicles
-        
-    finally:
-        db.close()
 
 def archive_vehicle_by_id(vehicle_id: UUID, db: Session, user_id: UUID) -> Vehicle:
     vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
@@ -758,27 +698,16 @@ def archive_vehicle_by_id(vehicle_id: UUID, db: Session, user_id: UUID) -> Vehic
 
     vehicle.is_archived = True
     vehicle.archived_at = datetime.utcnow()
-    db.commit()
-
-    db.execute(
-        text("""
-            INSERT INTO audit_logs (
-                action, entity_type, entity_id, change_data,
-                changed_by, checkbox_value, inspected_at, notes
-            ) VALUES (
-                :action, :entity_type, :entity_id, :change_data,
-                :changed_by, FALSE, now(), :notes
-            )
-        """),
-        {
-            "action": "ARCHIVE",
-            "entity_type": "Vehicle",
-            "entity_id": str(vehicle.id),
-            "change_data": '{"archived": true}',
-            "changed_by": str(user_id),
-            "notes": "Vehicle archived manually by admin"
-        }
+    log_action(
+        db,
+        action="ARCHIVE",
+        entity_type="Vehicle",
+        entity_id=vehicle.id,
+        change_data={"archived": True},
+        changed_by=user_id,
+        notes="Vehicle archived manually by admin",
     )
+    db.commit()
 
     db.execute(text("SET session.audit.user_id = DEFAULT"))
     return vehicle
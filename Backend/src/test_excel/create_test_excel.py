@@ -1,16 +1,52 @@
-import pandas as pd
-from uuid import uuid4
+import argparse
+import csv
 import os
+import random
+from uuid import uuid4
+
+from openpyxl import Workbook
+
+COLUMNS = ["Vehicle ID", "Vehicle Name", "Mileage"]
+
+EXAMPLE_ROWS = [
+    ("4b9d7552-7b52-4756-8fad-2afd33528a63", "Honda Insight", 11142),
+    ("9574b46e-b223-4e97-b4e5-7c8d9f16b4a1", "Nissan Leaf", 7500),
+]
+
+
+def generated_rows(count: int):
+    # Random ids are reported as "Vehicle not found"; for a real import
+    # export the fleet's ids instead
+    for index in range(count):
+        yield str(uuid4()), f"Vehicle {index + 1}", random.randint(1000, 300000)
+
+
+def write_xlsx(path: str, rows):
+    # write_only streams rows to disk instead of building the sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(COLUMNS)
+    for row in rows:
+        sheet.append(list(row))
+    workbook.save(path)
+
+
+def write_csv(path: str, rows):
+    with open(path, "w", newline="", encoding="utf-8-sig") as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create a mileage upload file")
+    parser.add_argument("--rows", type=int, default=0, help="generate this many rows instead of the example")
+    parser.add_argument("--format", choices=["xlsx", "csv"], default="xlsx")
+    args = parser.parse_args()
 
-data = {
-    "Vehicle ID": [
-        "4b9d7552-7b52-4756-8fad-2afd33528a63",
-        "9574b46e-b223-4e97-b4e5-7c8d9f16b4a1",
-    ],
-    "Vehicle Name": ["Honda Insight", "Nissan Leaf"],
-    "Mileage": [11142, 7500],
-}
-
-df = pd.DataFrame(data)
-file_path = os.path.join("test_excel", "example_mileage_upload.xlsx")
-df.to_excel(file_path, index=False)
+    rows = generated_rows(args.rows) if args.rows else EXAMPLE_ROWS
+    file_path = os.path.join("test_excel", f"example_mileage_upload.{args.format}")
+    if args.format == "csv":
+        write_csv(file_path, rows)
+    else:
+        write_xlsx(file_path, rows)
@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from uuid import UUID
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from ..utils.database import SessionLocal
+from ..utils.table_versions import table_versions
+
+load_dotenv()
+
+# A result is served as is for TTL_SECONDS. Until STALE_SECONDS it is still
+# served, but the request also starts a refresh in the background; after
+# that the request waits for a fresh result. A write to one of its tables
+# ends both windows at once
+TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "60"))
+STALE_SECONDS = float(os.getenv("ANALYTICS_CACHE_STALE_SECONDS", "300"))
+MAX_ENTRIES = 512
+REFRESH_WORKERS = 2
+
+CacheKey = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+
+def _normalize(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def cache_key(endpoint: str, params: Dict[str, Any]) -> CacheKey:
+    return endpoint, tuple(sorted((name, _normalize(value)) for name, value in params.items()))
+
+
+class _Entry:
+    __slots__ = ("value", "tables", "versions", "computed_at")
+
+    def __init__(self, value, tables: Tuple[str, ...], versions: Tuple[int, ...], computed_at: float):
+        self.value = value
+        self.tables = tables
+        self.versions = versions
+        self.computed_at = computed_at
+
+
+class AnalyticsCache:
+    """Results of the admin statistics endpoints, keyed by endpoint and params.
+
+    Every entry names the tables it was computed from. A committed write to
+    one of them, from any worker, bumps that table's version (see
+    table_versions), and the next read recomputes the entry. Entries that
+    only outlived the TTL are served while one background refresh per key
+    recomputes them.
+    """
+
+    def __init__(self, ttl: float = TTL_SECONDS, stale: float = STALE_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._refreshing: set = set()
+        self._executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="analytics-cache")
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def _store(self, key: CacheKey, value, tables: Tuple[str, ...], versions: Tuple[int, ...], started_at: float):
+        with self._lock:
+            current = self._entries.get(key)
+            # A slower computation must not replace a newer result
+            if current is not None and current.computed_at > started_at:
+                return
+            self._entries[key] = _Entry(value, tables, versions, started_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _compute(self, key: CacheKey, tables: Tuple[str, ...], compute: Callable[[Session], Any], db: Session):
+        versions = table_versions.get_many(tables)
+        started_at = time.monotonic()
+        value = compute(db)
+        self._store(key, value, tables, versions, started_at)
+        return value
+
+    def _refresh(self, key: CacheKey, tables: Tuple[str, ...], compute: Callable[[Session], Any]):
+        try:
+            with SessionLocal() as db:
+                self._compute(key, tables, compute, db)
+            self.refreshes += 1
+        except Exception as e:
+            self.refresh_errors += 1
+            print(f"❌ Failed to refresh analytics cache for {key[0]}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_compute(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        tables: Iterable[str],
+        compute: Callable[[Session], Any],
+        db: Session,
+    ):
+        """Return the cached result, computing it with compute(db) when needed.
+
+        Background refreshes open their own session, so compute must only
+        use the session it is given.
+        """
+        key = cache_key(endpoint, params)
+        tables = tuple(sorted(tables))
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            # An entry whose tables were written since is never served
+            if entry is not None and entry.versions == table_versions.get_many(tables):
+                age = now - entry.computed_at
+                if age <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                if age <= self.stale:
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._executor.submit(self._refresh, key, tables, compute)
+                    return entry.value
+            self.misses += 1
+
+        return self._compute(key, tables, compute, db)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshing": len(self._refreshing),
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "table_version_bumps": table_versions.bumps,
+            }
+
+
+analytics_cache = AnalyticsCache()
+
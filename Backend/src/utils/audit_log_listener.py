@@ -1,59 +1,243 @@
-import os
-from dotenv import load_dotenv
-import psycopg2
-import select
-import json
-from .socket_manager import sio
 import asyncio
+import json
+import os
 import threading
-from ..models.user_model import User 
-from ..utils.database import SessionLocal  
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID
+
+from dotenv import load_dotenv
+
+from .socket_manager import emit_event
 
 load_dotenv()
 
-def listen_for_audit_logs():
-    db_url = os.environ["DATABASE_URL"]
-    conn = psycopg2.connect(db_url)
-    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-    cur = conn.cursor()
-    cur.execute("LISTEN audit_log_channel;")
-
-    # Create and set a new event loop for this thread
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    threading.Thread(target=loop.run_forever, daemon=True).start()
-
-    while True:
-        if select.select([conn], [], [], 5) == ([], [], []):
-            continue
-        conn.poll()
-        while conn.notifies:
+AUDIT_CHANNEL = "audit_log_channel"
+NAME_CACHE_SIZE = 5000
+# Notifications handled together: one name lookup and one burst of emits,
+# which the socket buffer sends as a few batched frames
+MAX_BATCH_SIZE = 500
+
+
+class UserNameCache:
+    """LRU of employee_id -> full name, shared by the audit listener."""
+
+    def __init__(self, max_size: int = NAME_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._names: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_many(self, user_ids: Iterable[str]) -> Dict[str, str]:
+        found = {}
+        with self._lock:
+            for user_id in user_ids:
+                name = self._names.get(user_id)
+                if name is None:
+                    self.misses += 1
+                    continue
+                self._names.move_to_end(user_id)
+                self.hits += 1
+                found[user_id] = name
+        return found
+
+    def put_many(self, names: Dict[str, str]):
+        with self._lock:
+            for user_id, name in names.items():
+                self._names[user_id] = name
+                self._names.move_to_end(user_id)
+            while len(self._names) > self.max_size:
+                self._names.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            if self._names.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._names),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+user_names = UserNameCache()
+
+
+def _valid_uuid(value) -> Optional[str]:
+    try:
+        return str(UUID(str(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+def _change_data(payload: dict) -> dict:
+    change_data = payload.get("change_data") or {}
+    if isinstance(change_data, str):
+        try:
+            change_data = json.loads(change_data)
+        except ValueError:
+            return {}
+    return change_data if isinstance(change_data, dict) else {}
+
+
+def _actor_id(payload: dict) -> Optional[str]:
+    return _valid_uuid(payload.get("user_id") or payload.get("changed_by"))
+
+
+def enrich_payload(payload: dict, names: Dict[str, str]) -> dict:
+    user_id = _actor_id(payload)
+    if user_id and user_id in names:
+        payload["full_name"] = names[user_id]
+        payload["changed_by"] = user_id
+        return payload
+
+    # Try to get name from change_data for user INSERTs
+    change_data = _change_data(payload)
+    first_name = change_data.get("first_name", "")
+    last_name = change_data.get("last_name", "")
+    payload["full_name"] = f"{first_name} {last_name}".strip() if (first_name or last_name) else ""
+    # Set changed_by to entity_id if missing
+    if not payload.get("changed_by"):
+        payload["changed_by"] = payload.get("entity_id", "")
+    return payload
+
+
+class AuditLogListener:
+    """LISTEN consumer for audit_log_channel running on the server's loop.
+
+    Notifications are drained in batches: user UPDATE/DELETE rows evict the
+    cached name first, the remaining unknown names are fetched with one
+    query, and every log is emitted as audit_log_updated.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.batches = 0
+        self.name_queries = 0
+        self.errors = 0
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _fetch_names(self, conn, user_ids: List[str]) -> Dict[str, str]:
+        cached = user_names.get_many(user_ids)
+        missing = [user_id for user_id in user_ids if user_id not in cached]
+        if missing:
+            self.name_queries += 1
+            rows = await conn.fetch(
+                "SELECT employee_id, first_name, last_name FROM users WHERE employee_id = ANY($1::uuid[])",
+                missing,
+            )
+            fetched = {str(row["employee_id"]): f"{row['first_name']} {row['last_name']}" for row in rows}
+            user_names.put_many(fetched)
+            cached.update(fetched)
+        return cached
+
+    async def _handle_batch(self, conn, raw_payloads: List[str]):
+        payloads = []
+        for raw in raw_payloads:
             try:
-                notify = conn.notifies.pop(0)
-                payload = json.loads(notify.payload)
-                user_id = payload.get("user_id") or payload.get("changed_by")
-                db = SessionLocal()
-                user = None
+                payloads.append(json.loads(raw))
+            except ValueError as e:
+                self.errors += 1
+                print("Error emitting audit log:", e)
+
+        for payload in payloads:
+            if payload.get("entity_type") == "User" and payload.get("action") in ("UPDATE", "DELETE"):
+                user_id = _valid_uuid(payload.get("entity_id"))
                 if user_id:
-                    user = db.query(User).filter(User.employee_id == user_id).first()
-                if user:
-                    payload["full_name"] = f"{user.first_name} {user.last_name}"
-                    payload["changed_by"] = str(user.employee_id)
-                else:
-                    # Try to get name from change_data for user INSERTs
-                    change_data = payload.get("change_data", {})
-                    if isinstance(change_data, str):
-                        change_data = json.loads(change_data)
-                    first_name = change_data.get("first_name", "")
-                    last_name = change_data.get("last_name", "")
-                    if first_name or last_name:
-                        payload["full_name"] = f"{first_name} {last_name}".strip()
-                    else:
-                        payload["full_name"] = ""
-                    # Set changed_by to entity_id if missing
-                    if not payload.get("changed_by"):
-                        payload["changed_by"] = payload.get("entity_id", "")
-                db.close()
-                asyncio.run_coroutine_threadsafe(sio.emit("audit_log_updated", payload), loop)
+                    user_names.invalidate(user_id)
+
+        user_ids = list(dict.fromkeys(filter(None, (_actor_id(payload) for payload in payloads))))
+        names = await self._fetch_names(conn, user_ids) if user_ids else {}
+
+        for payload in payloads:
+            await emit_event("audit_log_updated", enrich_payload(payload, names))
+        self.batches += 1
+
+    async def listen(self):
+        import asyncpg
+
+        while True:
+            conn = None
+            try:
+                queue: asyncio.Queue = asyncio.Queue()
+                conn = await asyncpg.connect(os.environ["DATABASE_URL"])
+                await conn.add_listener(AUDIT_CHANNEL, lambda *args: queue.put_nowait(args[-1]))
+                print("👂 Listening for audit logs")
+                while True:
+                    batch = [await queue.get()]
+                    while len(batch) < MAX_BATCH_SIZE and not queue.empty():
+                        batch.append(queue.get_nowait())
+                    self.received += len(batch)
+                    await self._handle_batch(conn, batch)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                print("Error emitting audit log:", e)
\ No newline at end of file
+                self.errors += 1
+                print(f"❌ Audit log listener failed, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                if conn is not None:
+                    try:
+                        await conn.close()
+                    except Exception:
+                        pass
+
+    def _start(self):
+        if not self.running:
+            self._task = self.loop.create_task(self.listen())
+
+    def _stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def start(self):
+        # Leader callbacks run on the election thread, so hop to the loop
+        if self.loop is None or self.loop.is_closed():
+            print("❌ Audit log listener has no event loop to run on")
+            return
+        self.loop.call_soon_threadsafe(self._start)
+
+    def stop(self):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._stop)
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.running,
+            "received": self.received,
+            "batches": self.batches,
+            "name_queries": self.name_queries,
+            "errors": self.errors,
+            "name_cache": user_names.snapshot(),
+        }
+
+
+audit_listener = AuditLogListener()
+
+
+def start_audit_listener():
+    """Start the LISTEN consumer; only the scheduler leader runs it."""
+    audit_listener.start()
+
+
+def stop_audit_listener():
+    audit_listener.stop()
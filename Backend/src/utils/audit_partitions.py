@@ -0,0 +1,229 @@
+import gzip
+import json
+import os
+import re
+from datetime import date, datetime
+from typing import List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from ..utils.database import engine
+
+load_dotenv()
+
+# audit_logs is range partitioned by created_at, one partition per month
+# (see the audit_logs_partitioned schema upgrade)
+PARTITION_PREFIX = "audit_logs_"
+PARTITION_NAME = re.compile(r"^audit_logs_(\d{4})_(\d{2})$")
+# Catches rows outside every monthly partition
+DEFAULT_PARTITION = "audit_logs_default"
+MONTHS_AHEAD = 2
+
+# Partitions whose month ended more than this many months ago are dropped
+RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "12"))
+# When set, partitions are exported here before they are dropped
+ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "")
+# "jsonl" (gzip compressed) or "parquet" (needs pyarrow)
+ARCHIVE_FORMAT = os.getenv("AUDIT_ARCHIVE_FORMAT", "jsonl")
+ARCHIVE_BATCH_SIZE = 5000
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y_%m}"
+
+
+def audit_partitions(conn) -> List[Tuple[str, date]]:
+    """Monthly partitions of audit_logs as (name, first day of month)."""
+    names = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_logs'::regclass
+    """)).scalars()
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def is_partitioned(conn) -> bool:
+    return bool(conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('audit_logs'))"
+    )).scalar())
+
+
+def _stranded_months(conn, existing: Set[date], before: Optional[date] = None) -> Set[date]:
+    """Months without a partition that have rows in audit_logs_default."""
+    months = conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', created_at)::date FROM \"{DEFAULT_PARTITION}\" "
+        "WHERE created_at IS NOT NULL"
+    )).scalars()
+    return {month for month in months if month not in existing and (before is None or month < before)}
+
+
+def _create_partition(conn, month: date, adopt_default_rows: bool):
+    name = partition_name(month)
+    bounds = {"start": month, "end": _add_months(month, 1)}
+    create = text(
+        f'CREATE TABLE "{name}" PARTITION OF audit_logs '
+        f"FOR VALUES FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+    )
+    if not adopt_default_rows:
+        conn.execute(create)
+        print(f"🗂️ Created audit log partition {name}")
+        return
+
+    # Postgres refuses a partition whose range already has rows in the
+    # default partition, so the default is detached while they move over
+    conn.execute(text(f'ALTER TABLE audit_logs DETACH PARTITION "{DEFAULT_PARTITION}"'))
+    conn.execute(create)
+    moved = conn.execute(
+        text(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" '
+            "WHERE created_at >= :start AND created_at < :end RETURNING *) "
+            "INSERT INTO audit_logs SELECT * FROM moved"
+        ),
+        bounds,
+    ).rowcount
+    conn.execute(text(f'ALTER TABLE audit_logs ATTACH PARTITION "{DEFAULT_PARTITION}" DEFAULT'))
+    print(f"⚠️ Audit log partition {name} was missing: created it and moved {moved} rows out of {DEFAULT_PARTITION}")
+
+
+def _partition_default_rows(conn, existing: Set[date], before: Optional[date] = None) -> Set[date]:
+    """Create the partitions that rows stranded in audit_logs_default need."""
+    if not _stranded_months(conn, existing, before):
+        return set()
+    # Taken before reading the default partition again, so no new row can
+    # land in it while the partitions are created
+    conn.execute(text("LOCK TABLE audit_logs IN SHARE ROW EXCLUSIVE MODE"))
+    stranded = _stranded_months(conn, existing, before)
+    for month in sorted(stranded):
+        _create_partition(conn, month, adopt_default_rows=True)
+    return stranded
+
+
+def ensure_audit_partitions(months_ahead: int = MONTHS_AHEAD, today: Optional[date] = None):
+    """Create the partitions for this month and the next few.
+
+    Rows that landed in audit_logs_default while maintenance lagged get a
+    partition for their month too, so retention can retire them.
+    """
+    current = _month_start(today or datetime.utcnow())
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return
+        existing = {month for _, month in audit_partitions(conn)}
+        existing |= _partition_default_rows(conn, existing)
+        for offset in range(months_ahead + 1):
+            month = _add_months(current, offset)
+            if month not in existing:
+                _create_partition(conn, month, adopt_default_rows=False)
+
+
+def _archive_path(name: str) -> str:
+    extension = "parquet" if ARCHIVE_FORMAT == "parquet" else "jsonl.gz"
+    return os.path.join(ARCHIVE_DIR, f"{name}.{extension}")
+
+
+def _stream_rows(conn, name: str):
+    result = conn.execute(
+        text(f'SELECT * FROM "{name}" ORDER BY created_at, id')
+        .execution_options(stream_results=True, max_row_buffer=ARCHIVE_BATCH_SIZE)
+    )
+    for partition in result.mappings().partitions(ARCHIVE_BATCH_SIZE):
+        yield [dict(row) for row in partition]
+
+
+def _write_jsonl(conn, name: str, path: str) -> int:
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8") as archive:
+        for rows in _stream_rows(conn, name):
+            for row in rows:
+                archive.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+            count += len(rows)
+    return count
+
+
+def _write_parquet(conn, name: str, path: str) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    count = 0
+    writer = None
+    try:
+        for rows in _stream_rows(conn, name):
+            for row in rows:
+                # JSON and UUID columns are stored as text
+                row["change_data"] = json.dumps(row["change_data"], default=str) if row["change_data"] is not None else None
+                row["changed_by"] = str(row["changed_by"]) if row["changed_by"] is not None else None
+            table = pa.Table.from_pylist(rows)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+            writer.write_table(table.cast(writer.schema))
+            count += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def archive_partition(conn, name: str) -> Optional[str]:
+    """Export a partition to ARCHIVE_DIR; returns the file written."""
+    if not ARCHIVE_DIR:
+        return None
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = _archive_path(name)
+    partial = f"{path}.partial"
+    if ARCHIVE_FORMAT == "parquet":
+        count = _write_parquet(conn, name, partial)
+    else:
+        count = _write_jsonl(conn, name, partial)
+    # Only a finished export gets its final name
+    os.replace(partial, path)
+    print(f"📦 Archived {count} audit log rows from {name} to {path}")
+    return path
+
+
+def enforce_audit_retention(retention_months: int = RETENTION_MONTHS, today: Optional[date] = None) -> List[str]:
+    """Archive (if configured) and drop partitions older than the window.
+
+    Dropping a partition is a catalog change, unlike a DELETE it leaves no
+    dead rows behind and does not lock the rest of the table. Old rows in
+    audit_logs_default are first moved into partitions of their own.
+    """
+    oldest_kept = _add_months(_month_start(today or datetime.utcnow()), -retention_months)
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        _partition_default_rows(conn, {month for _, month in audit_partitions(conn)}, before=oldest_kept)
+        expired = [name for name, month in audit_partitions(conn) if month < oldest_kept]
+
+    dropped = []
+    for name in expired:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE audit_logs DETACH PARTITION "{name}"'))
+                archive_partition(conn, name)
+                conn.execute(text(f'DROP TABLE "{name}"'))
+            dropped.append(name)
+            print(f"🗑️ Dropped audit log partition {name}")
+        except Exception as e:
+            print(f"❌ Failed to retire audit log partition {name}: {e}")
+    return dropped
+
+
+def maintain_audit_partitions():
+    ensure_audit_partitions()
+    enforce_audit_retention()
@@ -1,8 +1,80 @@
-from datetime import datetime
+import asyncio
+import threading
+from collections import deque
+from datetime import date, datetime
+from typing import Deque, Iterable, List, Optional
+from uuid import UUID
+
+from sqlalchemy import event, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import Optional
-import json
+
+from ..models.audit_log_model import AuditLog
+
+# Rows written in the current transaction, emitted once it commits
+_PENDING_KEY = "audit_rows_pending_emit"
+
+
+def _audit_row(
+    action,
+    entity_type,
+    entity_id,
+    change_data,
+    changed_by,
+    checkbox_value: Optional[bool] = False,
+    inspected_at: Optional[datetime] = None,
+    notes: Optional[str] = None
+) -> dict:
+    return {
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": str(entity_id) if entity_id is not None else None,
+        "change_data": change_data,
+        "changed_by": changed_by,
+        "checkbox_value": bool(checkbox_value),
+        # Use current time if inspected_at not provided
+        "inspected_at": inspected_at if inspected_at is not None else datetime.utcnow(),
+        "notes": notes,
+    }
+
+
+def _insert_statement(entries: Iterable[dict]):
+    audit_logs = AuditLog.__table__
+    return insert(audit_logs).values([_audit_row(**entry) for entry in entries]).returning(*audit_logs.c)
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def _remember_for_emit(session: Session, rows) -> List[dict]:
+    logs = [{key: _serialize(value) for key, value in row._mapping.items()} for row in rows]
+    session.info.setdefault(_PENDING_KEY, []).extend(logs)
+    return logs
+
+
+def log_actions(db: Session, entries: List[dict]) -> List[dict]:
+    """Write several audit rows with one INSERT ... RETURNING.
+
+    Each entry takes the keyword arguments of log_action. The rows are
+    emitted as audit_log_updated after the surrounding transaction commits.
+    """
+    if not entries:
+        return []
+    rows = db.execute(_insert_statement(entries)).fetchall()
+    return _remember_for_emit(db, rows)
+
+
+async def log_actions_async(db: AsyncSession, entries: List[dict]) -> List[dict]:
+    if not entries:
+        return []
+    result = await db.execute(_insert_statement(entries))
+    return _remember_for_emit(db.sync_session, result.fetchall())
+
 
 def log_action(
     db,
@@ -14,51 +86,95 @@ def log_action(
     checkbox_value: Optional[bool] = False,
     inspected_at: Optional[datetime] = None,
     notes: Optional[str] = None
-    ):
-    # Use current time if inspected_at not provided
-    final_inspected_at = inspected_at if inspected_at is not None else datetime.utcnow()
-
-    from ..utils.socket_manager import sio  # Import your Socket.IO manager
-
-    db.execute(
-        text("""
-            INSERT INTO audit_logs (
-                action, entity_type, entity_id, change_data, changed_by,
-                checkbox_value, inspected_at, notes
-            )
-            VALUES (
-                :action, :entity_type, :entity_id, :change_data, :changed_by,
-                :checkbox_value, :inspected_at, :notes
-            )
-        """),
-        {
-            "action": action,
-            "entity_type": entity_type,
-            "entity_id": str(entity_id) if entity_id is not None else None,
-            "change_data": json.dumps(change_data) if change_data is not None else None,
-            "changed_by": str(changed_by) if changed_by is not None else None,
-            "checkbox_value": checkbox_value,
-            "inspected_at": final_inspected_at,
-            "notes": notes
-        }
-    )
+    ) -> dict:
+    return log_actions(db, [{
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "change_data": change_data,
+        "changed_by": changed_by,
+        "checkbox_value": checkbox_value,
+        "inspected_at": inspected_at,
+        "notes": notes,
+    }])[0]
+
+
+class AuditEmitQueue:
+    """Hands committed audit rows to the server's event loop.
 
+    Commits happen on request threads, scheduler threads and the loop
+    itself; rows are collected here and emitted together by one task on
+    the loop, where the socket buffer packs them into batched frames.
+    """
 
-    # Fetch the latest audit log entry (assuming 'id' is auto-increment)
-    audit_log = db.execute(
-        text("SELECT * FROM audit_logs ORDER BY id DESC LIMIT 1")
-    ).fetchone()
-    
-    # Emit socket event for real-time updates
-    import asyncio
-    if audit_log:
-        log_dict = dict(audit_log)
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._rows: Deque[dict] = deque()
+        self._scheduled = False
+        self.emitted = 0
+        self.dropped = 0
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def _target_loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        if self.loop is not None and not self.loop.is_closed():
+            return self.loop
         try:
-            asyncio.create_task(
-                sio.emit("audit_log_updated", log_dict)
-            )
+            return asyncio.get_running_loop()
         except RuntimeError:
-            loop = asyncio.get_event_loop()
-            loop.create_task(
-                sio.emit("audit_log_updated", log_dict)
-            )
\ No newline at end of file
+            return None
+
+    def put(self, rows: List[dict]):
+        loop = self._target_loop()
+        if loop is None:
+            self.dropped += len(rows)
+            return
+        with self._lock:
+            self._rows.extend(rows)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        loop.call_soon_threadsafe(lambda: loop.create_task(self._drain()))
+
+    async def _drain(self):
+        from ..utils.socket_manager import emit_event
+
+        with self._lock:
+            rows = list(self._rows)
+            self._rows.clear()
+            self._scheduled = False
+        for row in rows:
+            try:
+                await emit_event("audit_log_updated", row)
+                self.emitted += 1
+            except Exception as e:
+                print(f"❌ Failed to emit audit log {row.get('id')}: {e}")
+
+
+audit_emit_queue = AuditEmitQueue()
+
+
+@event.listens_for(Session, "after_commit")
+def _emit_committed_audit_rows(session):
+    rows = session.info.pop(_PENDING_KEY, None)
+    if rows:
+        audit_emit_queue.put(rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_audit_rows(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+async def set_audit_user(db, user_id):
+    # asyncpg cannot bind parameters in SET, so go through set_config()
+    await db.execute(
+        text("SELECT set_config('session.audit.user_id', :user_id, false)"),
+        {"user_id": str(user_id)}
+    )
+
+
+async def reset_audit_user(db):
+    await db.execute(text("SET session.audit.user_id = DEFAULT"))
@@ -1,8 +1,14 @@
-
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import ArgumentError, SQLAlchemyError, TimeoutError as PoolTimeoutError
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Optional
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import logging
 from ..models.base import Base
@@ -13,16 +19,257 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connections_created = 0
+            self.timeouts = 0
+            self.waits = 0
+            self.in_use = 0
+            self.max_in_use = 0
+            self.total_wait_ms = 0.0
+            self.max_wait_ms = 0.0
+
+    def record_wait(self, wait_ms: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.waits += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def record_checkin(self):
+        with self._lock:
+            self.checkins += 1
+            self.in_use = max(self.in_use - 1, 0)
+
+    def record_connect(self):
+        with self._lock:
+            self.connections_created += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "connections_created": self.connections_created,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait_ms / self.waits, 3) if self.waits else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 3),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to get a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record_wait(0, timed_out=True)
+            raise
+        pool_metrics.record_wait((time.perf_counter() - started) * 1000)
+        return record
+
+
+def create_db_engine(
+    url: Optional[str] = None,
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None,
+    pool_timeout: Optional[int] = None,
+    pool_recycle: Optional[int] = None,
+    pool_pre_ping: Optional[bool] = None,
+    statement_timeout_ms: Optional[int] = None,
+    echo: Optional[bool] = None,
+):
+    url = url or DATABASE_URL
+    if not url:
+        raise ArgumentError("DATABASE_URL is not set")
+    statement_timeout_ms = (
+        statement_timeout_ms if statement_timeout_ms is not None
+        else _env_int("DB_STATEMENT_TIMEOUT_MS", 30000)
+    )
+
+    connect_args = {}
+    if statement_timeout_ms and url.startswith("postgresql"):
+        connect_args["options"] = f"-c statement_timeout={statement_timeout_ms}"
+
+    db_engine = create_engine(
+        url,
+        echo=echo if echo is not None else _env_bool("DB_ECHO", False),
+        poolclass=TimedQueuePool,
+        pool_size=pool_size if pool_size is not None else _env_int("DB_POOL_SIZE", 10),
+        max_overflow=max_overflow if max_overflow is not None else _env_int("DB_MAX_OVERFLOW", 20),
+        pool_timeout=pool_timeout if pool_timeout is not None else _env_int("DB_POOL_TIMEOUT", 30),
+        pool_recycle=pool_recycle if pool_recycle is not None else _env_int("DB_POOL_RECYCLE", 1800),
+        pool_pre_ping=pool_pre_ping if pool_pre_ping is not None else _env_bool("DB_POOL_PRE_PING", True),
+        connect_args=connect_args,
+    )
+
+    event.listen(db_engine, "connect", lambda dbapi_conn, record: pool_metrics.record_connect())
+    event.listen(db_engine, "checkout", lambda dbapi_conn, record, proxy: pool_metrics.record_checkout())
+    event.listen(db_engine, "checkin", lambda dbapi_conn, record: pool_metrics.record_checkin())
+
+    return db_engine
+
+
 try:
-    logger.info(f"Connecting to database at {DATABASE_URL}")
-    engine = create_engine(DATABASE_URL, echo=True)
+    logger.info("Connecting to database")
+    engine = create_db_engine()
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     logger.info("Database connection established successfully")
 except SQLAlchemyError as e:
+    engine = None
+    SessionLocal = None
     logger.error(f"Database connection error: {e}")
 
+
+def _async_database_url(url: str) -> str:
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+def create_async_db_engine(url: Optional[str] = None, statement_timeout_ms: Optional[int] = None, echo: Optional[bool] = None):
+    url = url or DATABASE_URL
+    if not url:
+        raise ArgumentError("DATABASE_URL is not set")
+    statement_timeout_ms = (
+        statement_timeout_ms if statement_timeout_ms is not None
+        else _env_int("DB_STATEMENT_TIMEOUT_MS", 30000)
+    )
+    connect_args = {}
+    if statement_timeout_ms:
+        connect_args["server_settings"] = {"statement_timeout": str(statement_timeout_ms)}
+
+    return create_async_engine(
+        _async_database_url(url),
+        echo=echo if echo is not None else _env_bool("DB_ECHO", False),
+        pool_size=_env_int("DB_ASYNC_POOL_SIZE", 10),
+        max_overflow=_env_int("DB_ASYNC_MAX_OVERFLOW", 20),
+        pool_timeout=_env_int("DB_POOL_TIMEOUT", 30),
+        pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
+        pool_pre_ping=_env_bool("DB_POOL_PRE_PING", True),
+        connect_args=connect_args,
+    )
+
+
+try:
+    async_engine = create_async_db_engine()
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+except (SQLAlchemyError, ImportError) as e:
+    async_engine = None
+    AsyncSessionLocal = None
+    logger.error(f"Async database engine unavailable: {e}")
+
+
+def get_pool_metrics() -> dict:
+    metrics = pool_metrics.snapshot()
+    metrics.update({
+        "pool_size": engine.pool.size(),
+        "checked_out": engine.pool.checkedout(),
+        "overflow": engine.pool.overflow(),
+        "status": engine.pool.status(),
+    })
+    return metrics
+
+
+# Request-scoped session: the HTTP middleware opens a scope per request and
+# get_db / get_async_db register their session there, so helpers called from
+# the request can reuse it through session_scope() / async_session_scope()
+# instead of opening a second connection.
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_db_scope", default=None)
+
+
+def begin_request_scope():
+    return _request_scope.set({})
+
+
+def end_request_scope(token):
+    _request_scope.reset(token)
+
+
+def get_request_session() -> Optional[Session]:
+    scope = _request_scope.get()
+    return scope.get("db") if scope else None
+
+
+def get_request_async_session() -> Optional[AsyncSession]:
+    scope = _request_scope.get()
+    return scope.get("async_db") if scope else None
+
+
+@contextmanager
+def session_scope():
+    """The request's session when there is one, otherwise a new one.
+
+    A borrowed session is the caller's open transaction: helpers may add and
+    flush but must not commit or roll it back. Helpers that commit their own
+    work need their own SessionLocal().
+    """
+    db = get_request_session()
+    if db is not None:
+        yield db
+        return
+
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@asynccontextmanager
+async def async_session_scope():
+    """Like session_scope, for AsyncSession."""
+    db = get_request_async_session()
+    if db is not None:
+        yield db
+        return
+
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def get_db():
     db = SessionLocal()
+    scope = _request_scope.get()
+    owns_scope = scope is not None and "db" not in scope
+    if owns_scope:
+        scope["db"] = db
     try:
         yield db
     except SQLAlchemyError as e:
@@ -30,4 +277,25 @@ def get_db():
         db.rollback()
         raise
     finally:
+        if owns_scope:
+            scope.pop("db", None)
         db.close()
+
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database engine is not configured (is asyncpg installed?)")
+    scope = _request_scope.get()
+    async with AsyncSessionLocal() as db:
+        owns_scope = scope is not None and "async_db" not in scope
+        if owns_scope:
+            scope["async_db"] = db
+        try:
+            yield db
+        except SQLAlchemyError as e:
+            logger.error(f"Async database session error: {e}")
+            await db.rollback()
+            raise
+        finally:
+            if owns_scope:
+                scope.pop("async_db", None)
@@ -0,0 +1,250 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LEADER_LOCK_NAME = "vehicle-desk:scheduler-leader"
+HEARTBEAT_SECONDS = 5
+
+
+def advisory_key(name: str) -> int:
+    # Python's hash() differs between processes, so derive a stable bigint
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class JobLockMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, dict] = {}
+
+    def _job(self, name: str) -> dict:
+        return self._jobs.setdefault(name, {
+            "runs": 0,
+            "skipped": 0,
+            "failures": 0,
+            "total_ms": 0.0,
+            "last_ms": 0.0,
+            "last_run_at": None,
+        })
+
+    def record_run(self, name: str, duration_ms: float, failed: bool = False):
+        with self._lock:
+            job = self._job(name)
+            job["runs"] += 1
+            job["total_ms"] += duration_ms
+            job["last_ms"] = duration_ms
+            job["last_run_at"] = datetime.now(timezone.utc).isoformat()
+            if failed:
+                job["failures"] += 1
+
+    def record_skip(self, name: str):
+        with self._lock:
+            self._job(name)["skipped"] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                name: {
+                    "runs": job["runs"],
+                    "skipped": job["skipped"],
+                    "failures": job["failures"],
+                    "avg_ms": round(job["total_ms"] / job["runs"], 3) if job["runs"] else 0.0,
+                    "last_ms": round(job["last_ms"], 3),
+                    "last_run_at": job["last_run_at"],
+                }
+                for name, job in self._jobs.items()
+            }
+
+
+job_lock_metrics = JobLockMetrics()
+
+
+_running_jobs: Dict[str, threading.Lock] = {}
+_running_jobs_lock = threading.Lock()
+
+
+def _job_lock(name: str) -> threading.Lock:
+    with _running_jobs_lock:
+        return _running_jobs.setdefault(name, threading.Lock())
+
+
+def run_exclusive(name: str, func: Callable, *args, **kwargs):
+    """Run func only in the leader, and only once at a time per `name`.
+
+    The leader already holds the session-level leader lock, so no other
+    process runs jobs; this skips the call when this process is not (or is
+    no longer) the leader or the same job is still running here. No
+    database connection is held while func runs.
+    """
+    job_lock = _job_lock(name)
+    if not leader_election.is_leader or not job_lock.acquire(blocking=False):
+        job_lock_metrics.record_skip(name)
+        return None
+
+    started = time.perf_counter()
+    failed = False
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        job_lock.release()
+        job_lock_metrics.record_run(name, (time.perf_counter() - started) * 1000, failed)
+
+
+def exclusive(func: Callable, name: Optional[str] = None) -> Callable:
+    name = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return run_exclusive(name, func, *args, **kwargs)
+
+    return wrapper
+
+
+class LeaderElection:
+    """Elects one process to run the background jobs.
+
+    Every worker tries to take a session-level advisory lock on its own
+    connection. The holder is the leader until its connection drops (the
+    process exits or the database goes away), at which point Postgres
+    releases the lock and another worker takes it on its next attempt.
+    """
+
+    def __init__(self, name: str = LEADER_LOCK_NAME, interval: float = HEARTBEAT_SECONDS):
+        self.key = advisory_key(name)
+        self.interval = interval
+        self.is_leader = False
+        self._conn = None
+        self._on_promote: List[Callable[[], None]] = []
+        self._on_demote: List[Callable[[], None]] = []
+        self._on_heartbeat: List[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.leader_since: Optional[str] = None
+        self.promotions = 0
+        self.demotions = 0
+        self.last_heartbeat: Optional[str] = None
+        self.last_error: Optional[str] = None
+
+    def on_promote(self, callback: Callable[[], None]):
+        self._on_promote.append(callback)
+
+    def on_demote(self, callback: Callable[[], None]):
+        self._on_demote.append(callback)
+
+    def on_heartbeat(self, callback: Callable[[], None]):
+        """Called on every heartbeat while this process is the leader."""
+        self._on_heartbeat.append(callback)
+
+    def _run_callbacks(self, callbacks, label: str):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"❌ Leader {label} callback {getattr(callback, '__name__', callback)} failed: {e}")
+
+    def _connect(self):
+        conn = psycopg2.connect(os.environ["DATABASE_URL"])
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _promote(self):
+        with self._lock:
+            self.is_leader = True
+            self.promotions += 1
+            self.leader_since = datetime.now(timezone.utc).isoformat()
+        print(f"👑 Process {os.getpid()} is now the scheduler leader")
+        self._run_callbacks(self._on_promote, "promote")
+
+    def _demote(self):
+        with self._lock:
+            if not self.is_leader:
+                return
+            self.is_leader = False
+            self.demotions += 1
+            self.leader_since = None
+        print(f"⚠️ Process {os.getpid()} lost scheduler leadership")
+        self._run_callbacks(self._on_demote, "demote")
+
+    def _tick(self):
+        if self._conn is None:
+            self._conn = self._connect()
+        with self._conn.cursor() as cur:
+            if self.is_leader:
+                # The lock lives as long as this connection; a working
+                # connection means we still hold it
+                cur.execute("SELECT 1")
+            else:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (self.key,))
+                if cur.fetchone()[0]:
+                    self._promote()
+        self.last_heartbeat = datetime.now(timezone.utc).isoformat()
+        if self.is_leader:
+            self._run_callbacks(self._on_heartbeat, "heartbeat")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._tick()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Leader election heartbeat failed: {e}")
+                self._close()
+                self._demote()
+            self._stop.wait(self.interval)
+
+        self._demote()
+        self._close()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "is_leader": self.is_leader,
+                "leader_since": self.leader_since,
+                "promotions": self.promotions,
+                "demotions": self.demotions,
+                "last_heartbeat": self.last_heartbeat,
+                "last_error": self.last_error,
+            }
+
+
+leader_election = LeaderElection()
+
+
+def get_scheduler_metrics() -> dict:
+    return {
+        "leader": leader_election.snapshot(),
+        "jobs": job_lock_metrics.snapshot(),
+    }
@@ -0,0 +1,163 @@
+import asyncio
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+from dotenv import load_dotenv
+
+from ..utils.database import SessionLocal
+from ..models.ride_model import Ride
+
+load_dotenv()
+
+# NOTIFYed by the rides_change_notify trigger (see schema_upgrades) with the
+# id of every ride whose vehicle, time window, status or distance changed
+RIDE_CHANGES_CHANNEL = "ride_changes"
+MAX_BATCH_SIZE = 500
+
+ChangeCallback = Callable[[List[Ride], Set[UUID]], None]
+
+
+def _ride_ids(payloads: Iterable[str]) -> Set[UUID]:
+    ride_ids = set()
+    for payload in payloads:
+        try:
+            ride_ids.add(UUID(payload))
+        except (TypeError, ValueError):
+            pass
+    return ride_ids
+
+
+class RideChangeListener:
+    """LISTEN consumer for ride_changes, run by every worker.
+
+    The in-memory ride caches of a worker only see its own writes. This
+    reloads every ride another worker (or a job, or psql) changed, in one
+    query per batch, and hands them to the caches. Notifications sent while
+    disconnected are lost, so after every (re)connect the caches resync
+    from scratch.
+
+    Callbacks registered with on_notify for other channels share the
+    connection; each runs once per batch that holds a NOTIFY on its channel,
+    with the set of payloads received.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._on_change: List[ChangeCallback] = []
+        self._on_resync: List[Callable[[], None]] = []
+        self._on_notify: Dict[str, List[Callable[[Set[str]], None]]] = {}
+        self.received = 0
+        self.batches = 0
+        self.resyncs = 0
+        self.errors = 0
+
+    def on_change(self, callback: ChangeCallback):
+        """callback(rides, deleted_ids) with the rides' current rows."""
+        self._on_change.append(callback)
+
+    def on_resync(self, callback: Callable[[], None]):
+        self._on_resync.append(callback)
+
+    def on_notify(self, channel: str, callback: Callable[[Set[str]], None]):
+        self._on_notify.setdefault(channel, []).append(callback)
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _resync(self):
+        for callback in self._on_resync:
+            callback()
+        self.resyncs += 1
+
+    def _apply(self, ride_ids: Set[UUID]):
+        with SessionLocal() as db:
+            rides = db.query(Ride).filter(Ride.id.in_(ride_ids)).all()
+            deleted = ride_ids - {ride.id for ride in rides}
+            for callback in self._on_change:
+                callback(rides, deleted)
+        self.batches += 1
+
+    def _notified(self, payloads: Dict[str, Set[str]]):
+        for channel, channel_payloads in payloads.items():
+            for callback in self._on_notify.get(channel, []):
+                try:
+                    callback(channel_payloads)
+                except Exception as e:
+                    print(f"❌ {channel} callback {getattr(callback, '__name__', callback)} failed: {e}")
+
+    async def listen(self):
+        import asyncpg
+
+        loop = asyncio.get_running_loop()
+        while True:
+            conn = None
+            try:
+                queue: asyncio.Queue = asyncio.Queue()
+                conn = await asyncpg.connect(os.environ["DATABASE_URL"])
+                for channel in (RIDE_CHANGES_CHANNEL, *self._on_notify):
+                    await conn.add_listener(channel, lambda _conn, _pid, channel, payload: queue.put_nowait((channel, payload)))
+                await loop.run_in_executor(None, self._resync)
+                print("👂 Listening for ride changes")
+                while True:
+                    batch = [await queue.get()]
+                    while len(batch) < MAX_BATCH_SIZE and not queue.empty():
+                        batch.append(queue.get_nowait())
+                    self.received += len(batch)
+                    ride_ids = _ride_ids(payload for channel, payload in batch if channel == RIDE_CHANGES_CHANNEL)
+                    if ride_ids:
+                        await loop.run_in_executor(None, self._apply, ride_ids)
+                    payloads: Dict[str, Set[str]] = {}
+                    for channel, payload in batch:
+                        if channel != RIDE_CHANGES_CHANNEL:
+                            payloads.setdefault(channel, set()).add(payload)
+                    if payloads:
+                        await loop.run_in_executor(None, self._notified, payloads)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Ride change listener failed, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                if conn is not None:
+                    try:
+                        await conn.close()
+                    except Exception:
+                        pass
+
+    def _start(self):
+        if not self.running:
+            self._task = self.loop.create_task(self.listen())
+
+    def _stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def start(self):
+        if self.loop is None or self.loop.is_closed():
+            print("❌ Ride change listener has no event loop to run on")
+            return
+        self.loop.call_soon_threadsafe(self._start)
+
+    def stop(self):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._stop)
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.running,
+            "received": self.received,
+            "batches": self.batches,
+            "resyncs": self.resyncs,
+            "errors": self.errors,
+        }
+
+
+ride_change_listener = RideChangeListener()
@@ -8,6 +8,7 @@ from datetime import datetime, time, timezone, timedelta, date
 import pytz
 from ..models.ride_requirements_confirmation import RideRequirementConfirmation
 from apscheduler.jobstores.base import JobLookupError
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.schedulers.background import BackgroundScheduler
 from dotenv import load_dotenv
@@ -15,17 +16,30 @@ from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Session, joinedload
 from pytz import timezone as pytz_timezone
 # Utils
-from ..utils.database import SessionLocal
-from ..utils.socket_manager import sio
+from ..utils.audit_partitions import maintain_audit_partitions
+from ..utils.audit_utils import log_actions
+from ..utils.database import SessionLocal, engine
+from ..utils.leader_election import exclusive, leader_election
+from ..utils.socket_manager import emit_event, emit_ride_status_updated, sio
+from ..utils.socket_pubsub import presence, prune_spilled_messages
+from ..utils.time_utils import SCHEDULER_TIMEZONE, scheduler_now
 
 # Routes
-from ..routes.admin_routes import get_no_show_events_count_per_user
 
 # Services
 
 from ..services.supervisor_dashboard_service import start_ride
 from ..services.user_form import get_ride_needing_feedback
-from ..services.user_notification import create_system_notification, emit_new_notification, get_user_name
+from ..services.user_notification import create_system_notification, create_system_notification_with_db, emit_new_notification, get_user_name
+from ..services.vehicle_availability_index import availability_index
+from ..services.daily_distance_ledger import daily_distance_ledger
+from ..services.usage_rollups import run_refresh_usage_rollups
+from ..services.no_show_service import NO_SHOW_ALERT_THRESHOLD, no_show_counts_per_user
+from ..services.notification_dispatcher import NotificationDispatcher, dedupe_key
+from ..services.deadline_scheduler import (
+    COMPLETE, FEEDBACK, LEASE_EXPIRED, LEASE_WARNING, NO_SHOW, OVERDUE, STALE, UNBLOCK,
+    deadline_scheduler, warm_deadline_scheduler,
+)
 
 # Models
 from ..models.audit_log_model import AuditLog
@@ -40,50 +54,142 @@ from ..models.vehicle_model import Vehicle,VehicleStatus,FreezeReason
 
 load_dotenv() 
 BOOKIT_URL = os.getenv("BOOKIT_FRONTEND_URL", "http://localhost:4200")
+SYSTEM_AUDIT_USER_ID = "00000000-0000-0000-0000-000000000000"
 
-scheduler = BackgroundScheduler(timezone=pytz.timezone("Asia/Jerusalem"))
+scheduler = BackgroundScheduler(
+    timezone=SCHEDULER_TIMEZONE,
+    job_defaults={"coalesce": True},
+)
+local_scheduler = BackgroundScheduler(timezone=SCHEDULER_TIMEZONE)
 from ..services.user_notification import create_system_notification,get_supervisor_id,get_user_name
 import logging
 main_loop = asyncio.get_event_loop()
 logger = logging.getLogger(__name__)
-from sqlalchemy import and_, cast, func, or_, text
+from sqlalchemy import and_, cast, func, insert, or_, text, update
 
 
 
-def schedule_ride_start(ride_id: str, start_datetime: datetime):
-    run_time = start_datetime
-    job_id = f"ride-start-{ride_id}"
+# Per-ride date jobs live in Postgres so a restart or rolling deploy does not
+# drop them; the recurring jobs below are re-added on every start and stay in
+# memory. Until the store is attached at startup, ride jobs use memory too.
+RIDE_JOBSTORE = "rides"
+RIDE_START_GRACE_SECONDS = 2 * 60 * 60
+RIDE_REMINDER_GRACE_SECONDS = 12 * 60 * 60
+_ride_jobstore = "default"
+
+
+def start_ride_jobstore():
+    global _ride_jobstore
+    if _ride_jobstore == RIDE_JOBSTORE:
+        return
+    try:
+        scheduler.add_jobstore(SQLAlchemyJobStore(engine=engine, tablename="apscheduler_jobs"), RIDE_JOBSTORE)
+        _ride_jobstore = RIDE_JOBSTORE
+        print("🗄️ Ride job store attached")
+    except Exception as e:
+        print(f"❌ Failed to attach ride job store, ride jobs stay in memory: {e}")
 
+
+def ride_jobstore() -> str:
+    return _ride_jobstore
+
+
+def _localize(value: datetime) -> datetime:
+    # Ride times are naive; date jobs have always read them in the scheduler timezone
+    if value.tzinfo is None:
+        return SCHEDULER_TIMEZONE.localize(value)
+    return value.astimezone(SCHEDULER_TIMEZONE)
+
+
+def run_ride_start(ride_id: str):
+    future = asyncio.run_coroutine_threadsafe(start_ride_with_new_session(ride_id), main_loop)
     try:
-        scheduler.remove_job(job_id)
-    except JobLookupError:
-        pass
+        future.result(timeout=30)
+    except Exception as e:
+        print(f"Error running ride start for {ride_id}: {e}")
+
 
+def schedule_ride_start(ride_id: str, start_datetime: datetime):
     scheduler.add_job(
-        lambda: asyncio.run(start_ride_with_new_session(ride_id)),
+        run_ride_start,
         'date',
-        run_date=run_time,
-        id=job_id
+        run_date=start_datetime,
+        args=[str(ride_id)],
+        id=f"ride-start-{ride_id}",
+        jobstore=ride_jobstore(),
+        replace_existing=True,
+        misfire_grace_time=RIDE_START_GRACE_SECONDS,
     )
 
-    
+
+def cancel_ride_jobs(ride_id):
+    for job_id in (f"ride-start-{ride_id}", f"ride-reminder-{ride_id}"):
+        try:
+            scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass
+
+
+def rehydrate_ride_jobs():
+    """Schedule start and reminder jobs for every future approved ride that
+    does not already have an up-to-date job."""
+    db = SessionLocal()
+    try:
+        now = datetime.now(scheduler.timezone)
+        rides = (
+            db.query(Ride.id, Ride.start_datetime)
+            .filter(
+                Ride.status == RideStatus.approved,
+                Ride.is_archive == False,
+                Ride.start_datetime > now.replace(tzinfo=None) - timedelta(days=1),
+            )
+            .all()
+        )
+        run_times = {job.id: job.next_run_time for job in scheduler.get_jobs(jobstore=ride_jobstore())}
+
+        added = 0
+        for ride_id, start_datetime in rides:
+            start_at = _localize(start_datetime)
+            if start_at > now and run_times.get(f"ride-start-{ride_id}") != start_at:
+                schedule_ride_start(ride_id, start_datetime)
+                added += 1
+
+            reminder_at = start_at - timedelta(hours=24)
+            reminder_id = f"ride-reminder-{ride_id}"
+            if reminder_at > now and run_times.get(reminder_id) != reminder_at:
+                scheduler.add_job(
+                    "src.services.ride_reminder_service:send_ride_reminder",
+                    'date',
+                    run_date=reminder_at,
+                    args=[str(ride_id)],
+                    id=reminder_id,
+                    jobstore=ride_jobstore(),
+                    replace_existing=True,
+                    misfire_grace_time=RIDE_REMINDER_GRACE_SECONDS,
+                )
+                added += 1
+
+        print(f"🗓️ Ride jobs rehydrated: {len(rides)} rides, {added} jobs (re)scheduled")
+    except Exception as e:
+        print(f"❌ Failed to rehydrate ride jobs: {e}")
+    finally:
+        db.close()
+
 
 async def start_ride_with_new_session(ride_id: str):
     db = SessionLocal()
     try:
         ride = db.query(Ride).filter(Ride.id == ride_id).first()
         if not ride:
-            raise HTTPException(status_code=404, detail="Ride not found")
-        
-        if ride.status==RideStatus.cancelled_due_to_no_show:
+            print(f"Ride {ride_id} not found, skipping start notice")
             return
 
         if ride.status != RideStatus.approved:
-            raise HTTPException(status_code=400, detail="Ride must be approved before starting")
+            return
 
-        await sio.emit("ride_supposed_to_start", {
+        await emit_event("ride_supposed_to_start", {
             "ride_id": str(ride.id)
-        })
+        }, user_id=ride.user_id)
     finally:
         db.close()
 
@@ -127,7 +233,7 @@ async def send_notif_to_inspector():
 def check_and_complete_rides():
     db = SessionLocal()
     try:
-        now = datetime.now(timezone.utc)
+        now = scheduler_now()
         rides_to_complete = db.query(Ride).filter(
             Ride.status == "approved",
             Ride.end_datetime <= now
@@ -137,6 +243,10 @@ def check_and_complete_rides():
             ride.status = "completed"
 
         db.commit()
+        for ride in rides_to_complete:
+            availability_index.remove_ride(ride.id)
+            daily_distance_ledger.sync_ride(ride)
+            deadline_scheduler.remove_ride(ride.id)
     except Exception as e:
         db.rollback()
     finally:
@@ -148,8 +258,6 @@ async def check_inactive_vehicles():
         now = datetime.now(timezone.utc)
         one_week_ago = now - timedelta(days=7)
 
-        all_vehicles = db.query(Vehicle).all()
-
         recent_rides_subq = db.query(
             Ride.vehicle_id,
             func.max(Ride.end_datetime).label("last_ride")
@@ -169,27 +277,20 @@ async def check_inactive_vehicles():
         if not inactive_vehicles:
             return
 
-        admins = db.query(User).filter(User.role == "admin").all()
+        admin_ids = [admin_id for (admin_id,) in db.query(User.employee_id).filter(User.role == "admin").all()]
 
+        dispatcher = NotificationDispatcher(event="vehicle_expiry_notification")
         for vehicle, last_ride in inactive_vehicles:
             last_used_date = last_ride.date() if last_ride else "לא ידוע"
 
-            for admin in admins:
-                exists = db.query(Notification).filter(
-                    Notification.user_id == admin.employee_id,
-                    Notification.vehicle_id == vehicle.id,
-                    Notification.title == "Inactive Vehicle"
-                ).first()
-
-                if exists:
-                    continue
-
-                notif = create_system_notification(
-                    user_id=admin.employee_id,
-                    title="Inactive Vehicle",
-                    message=f"הרכב עם מספר רישוי {vehicle.plate_number} לא היה בשימוש מתאריך {last_used_date}",
-                    vehicle_id=vehicle.id
-                )
+            for admin_id in admin_ids:
+                dispatcher.add(admin_id, {
+                    "title": "Inactive Vehicle",
+                    "message": f"הרכב עם מספר רישוי {vehicle.plate_number} לא היה בשימוש מתאריך {last_used_date}",
+                    "vehicle_id": vehicle.id,
+                    "plate_number": vehicle.plate_number,
+                    "dedupe_key": dedupe_key("inactive_vehicle", vehicle.id, admin_id)
+                })
 
                 # admin_email = get_user_email(admin.employee_id, db)
                 # if admin_email:
@@ -205,17 +306,7 @@ async def check_inactive_vehicles():
                 #         html_content=html_content
                 #     )
 
-                await sio.emit("vehicle_expiry_notification", {
-                    "id": str(notif.id),
-                    "user_id": str(notif.user_id),
-                    "title": notif.title,
-                    "message": notif.message,
-                    "notification_type": notif.notification_type.value,
-                    "sent_at": notif.sent_at.isoformat(),
-                    "vehicle_id": str(vehicle.id),
-                    "plate_number": vehicle.plate_number,
-                    "seen":False
-                }, room=str(admin.employee_id))
+        await dispatcher.send(db)
 
     finally:
         db.close()
@@ -223,7 +314,7 @@ async def check_inactive_vehicles():
 async def check_vehicle_lease_expiry():
     db: Session = SessionLocal()
     try:
-        now = datetime.now(timezone.utc)
+        now = scheduler_now()
         three_months_later = now + timedelta(days=90)
 
         vehicles_expiring = db.query(Vehicle).join(
@@ -300,23 +391,23 @@ async def check_vehicle_lease_expiry():
                         vehicle_id=vehicle.id
                         )
                     
-                    # admin_email = get_user_email(admin.employee_id, db)
-                    # if admin_email:
-                    #     html_content = load_email_template("lease_expired.html", {
-                    #         "SUPERVISOR_NAME": get_user_name(db, admin.employee_id),
-                    #         "VEHICLE_ID": vehicle.id,
-                    #         "VEHICLE": vehicle.vehicle_model,
-                    #         "PLATE": vehicle.plate_number,
-                    #         "PLATE_NUMBER": vehicle.plate_number,
-                    #         "EXPIRY_DATE": vehicle.lease_expiry
-                    #         })
-                    #     await async_send_email(
-                    #         to_email=admin.email,
-                    #         subject="קיים במערכת רכב שתקפו יפוג בקרוב",
-                    #         html_content=html_content
-                    #     )
-                    # else:
-                    #     logger.warning("No supervisor email found — skipping email.")
+                # admin_email = get_user_email(admin.employee_id, db)
+                # if admin_email:
+                #     html_content = load_email_template("lease_expired.html", {
+                #         "SUPERVISOR_NAME": get_user_name(db, admin.employee_id),
+                #         "VEHICLE_ID": vehicle.id,
+                #         "VEHICLE": vehicle.vehicle_model,
+                #         "PLATE": vehicle.plate_number,
+                #         "PLATE_NUMBER": vehicle.plate_number,
+                #         "EXPIRY_DATE": vehicle.lease_expiry
+                #         })
+                #     await async_send_email(
+                #         to_email=admin.email,
+                #         subject="קיים במערכת רכב שתקפו יפוג בקרוב",
+                #         html_content=html_content
+                #     )
+                # else:
+                #     logger.warning("No supervisor email found — skipping email.")
 
 
                     await sio.emit("vehicle_expiry_notification", {
@@ -349,13 +440,13 @@ async def check_expired_vehicle():
     db.close()
 
     for vid in expired_ids:
-        await sio.emit("vehicle_status_updated", {
+        await emit_event("vehicle_status_updated", {
             "id": vid,
             "status": "frozen"
         })
 
 def freeze_expired_vehicles(db: Session):
-    now = datetime.now()
+    now = scheduler_now()
     vehicles = db.query(Vehicle).filter(Vehicle.lease_expiry < now).all()
     print("expired v:",vehicles)
     if not vehicles:
@@ -369,63 +460,86 @@ def freeze_expired_vehicles(db: Session):
     return [str(v.id) for v in vehicles]
 
 async def check_and_cancel_unstarted_rides():
-    db: Session = SessionLocal()
+    # Notifications are emitted after commit; keep them loaded instead of re-selecting each one
+    db: Session = SessionLocal(expire_on_commit=False)
     try:
         now_utc = datetime.now(timezone.utc)
-        two_hours_ago = now_utc - timedelta(hours=2)
-
-        rides = db.query(Ride).filter(
-            Ride.status == RideStatus.approved,
-            Ride.start_datetime <= two_hours_ago,
-            Ride.actual_pickup_time == None
-        ).all()
+        two_hours_ago = scheduler_now() - timedelta(hours=2)
 
-        if not rides:
-            return
-
-        for ride in rides:
-            ride.status = RideStatus.cancelled_due_to_no_show
-            db.add(ride)
-
-            vehicle = None
-            if ride.vehicle_id:
-                vehicle = db.query(Vehicle).filter(Vehicle.id == ride.vehicle_id).first()
-                if vehicle:
-                    vehicle.status = 'available'
-                    db.add(vehicle)
-
-            no_show_event = NoShowEvent(
-                user_id=ride.user_id,
-                ride_id=ride.id,
-                occurred_at=now_utc.replace(tzinfo=None)
-            )
-            db.add(no_show_event)
+        # The scheduler cancels on behalf of the system, not of a single rider
+        db.execute(
+            text("SET session.audit.user_id = :user_id"),
+            {"user_id": SYSTEM_AUDIT_USER_ID}
+        )
 
-            db.execute(
-                text("SET session.audit.user_id = :user_id"),
-                {"user_id": str(ride.user_id)}
+        cancelled = db.execute(
+            update(Ride)
+            .where(
+                Ride.status == RideStatus.approved,
+                Ride.start_datetime <= two_hours_ago,
+                Ride.actual_pickup_time == None
             )
+            .values(status=RideStatus.cancelled_due_to_no_show)
+            .returning(Ride.id, Ride.user_id, Ride.vehicle_id, Ride.stop)
+            .execution_options(synchronize_session=False)
+        ).all()
 
-            db.commit()
+        if not cancelled:
+            db.rollback()
+            return
 
-            db.refresh(ride)
-            if vehicle:
-                db.refresh(vehicle)
+        db.execute(insert(NoShowEvent), [
+            {
+                "user_id": ride.user_id,
+                "ride_id": ride.id,
+                "occurred_at": now_utc.replace(tzinfo=None)
+            }
+            for ride in cancelled
+        ])
+
+        vehicle_ids = {ride.vehicle_id for ride in cancelled if ride.vehicle_id}
+        vehicles = []
+        if vehicle_ids:
+            vehicles = db.execute(
+                update(Vehicle)
+                .where(Vehicle.id.in_(vehicle_ids))
+                .values(status=VehicleStatus.available)
+                .returning(Vehicle.id, Vehicle.status)
+                .execution_options(synchronize_session=False)
+            ).all()
 
-            await sio.emit("ride_status_updated", {
-                "ride_id": str(ride.id),
-                "new_status": ride.status.value
-            })
+        db.commit()
 
-            if vehicle:
-                await sio.emit("vehicle_status_updated", {
-                    "id": str(vehicle.id),
-                    "status": vehicle.status.value
-                })
+        for ride in cancelled:
+            availability_index.remove_ride(ride.id)
+            daily_distance_ledger.remove_ride(ride.id)
+            deadline_scheduler.remove_ride(ride.id)
+
+        print(f"🚫 Cancelled {len(cancelled)} unstarted rides as no-show")
+
+        departments = dict(
+            db.query(User.employee_id, User.department_id)
+            .filter(User.employee_id.in_({ride.user_id for ride in cancelled}))
+            .all()
+        ) if cancelled else {}
+
+        await asyncio.gather(
+            *(emit_ride_status_updated(
+                ride_id=str(ride.id),
+                new_status=RideStatus.cancelled_due_to_no_show.value,
+                department_id=departments.get(ride.user_id),
+                user_id=ride.user_id
+            ) for ride in cancelled),
+            *(emit_event("vehicle_status_updated", {
+                "id": str(vehicle.id),
+                "status": vehicle.status.value
+            }) for vehicle in vehicles)
+        )
 
-            await notify_ride_cancelled_due_to_no_show(ride.id)
+        await notify_rides_cancelled_due_to_no_show(db, cancelled)
 
     except Exception as e:
+        print(f"❌ Failed to cancel unstarted rides: {repr(e)}")
         db.rollback()
     finally:
         db.close()
@@ -433,106 +547,71 @@ async def check_and_cancel_unstarted_rides():
 async def check_and_notify_overdue_rides():
     db: Session = SessionLocal()
     try:
-        now = datetime.now(timezone.utc)
+        now = scheduler_now()
         overdue_rides = db.query(Ride, Vehicle, User).join(
             Vehicle, Ride.vehicle_id == Vehicle.id
         ).join(
             User, Ride.user_id == User.employee_id
         ).filter(
             Ride.status == RideStatus.in_progress,
-            Ride.end_datetime <= datetime.now() - timedelta(hours=2)
+            Ride.end_datetime <= now - timedelta(hours=2)
         ).all()
+        if not overdue_rides:
+            return
+
+        admin_ids = [admin_id for (admin_id,) in db.query(User.employee_id).filter(User.role == "admin").all()]
+
+        dispatcher = NotificationDispatcher()
         for ride, vehicle, user in overdue_rides:
-            ride_end = ride.end_datetime
-            if ride_end.tzinfo is None:
-                ride_end = ride_end.replace(tzinfo=timezone.utc)
-
-            elapsed = (now - ride_end).days
-
-            exists_user_notif = db.query(Notification).filter(
-                Notification.user_id == user.employee_id,
-                Notification.vehicle_id == vehicle.id,
-                Notification.title == "Vehicle Overdue"
-            ).first()
-
-            if not exists_user_notif:
-                user_notif = create_system_notification(
-                    user_id=user.employee_id,
-                    title="Vehicle Overdue",
-                    message=f"הרכב {vehicle.plate_number} לא הוחזר בזמן.",
-                    vehicle_id=vehicle.id,
-                    order_id=ride.id
-                )
+            elapsed = (now - ride.end_datetime).days
+
+            dispatcher.add(user.employee_id, {
+                "title": "Vehicle Overdue",
+                "message": f"הרכב {vehicle.plate_number} לא הוחזר בזמן.",
+                "vehicle_id": vehicle.id,
+                "order_id": ride.id,
+                "plate_number": vehicle.plate_number,
+                "dedupe_key": dedupe_key("vehicle_overdue", vehicle.id, user.employee_id)
+            })
+
+            # html_user = load_email_template("vehicle_overdue_user.html", {
+            #     "USER_NAME": get_user_name(db, user.employee_id),
+            #     "VEHICLE": vehicle.plate_number,
+            #     "END_TIME": ride.end_datetime.strftime("%H:%M %d/%m/%Y"),
+            #     "ELAPSED": str(elapsed).split('.')[0]
+            # })
+
+            # await async_send_email(
+            #     to_email=user.email,
+            #     subject=f"⚠️ החזרת רכב באיחור - {vehicle.plate_number}",
+            #     html_content=html_user
+            # )
+
+            for admin_id in admin_ids:
+                dispatcher.add(admin_id, {
+                    "title": "Overdue Vehicle Alert",
+                    "message": f"הרכב {vehicle.plate_number} לא הוחזר בזמן ע\"י {user.first_name} {user.last_name}.",
+                    "vehicle_id": vehicle.id,
+                    "order_id": ride.id,
+                    "plate_number": vehicle.plate_number,
+                    "dedupe_key": dedupe_key("overdue_vehicle_alert", vehicle.id, admin_id)
+                })
 
-                # html_user = load_email_template("vehicle_overdue_user.html", {
-                #     "USER_NAME": get_user_name(db, user.employee_id),
+                # html_admin = load_email_template("vehicle_overdue_admin.html", {
+                #     "USER_NAME": f"{user.first_name} {user.last_name}",
+                #     "USER_EMAIL": user.email,
                 #     "VEHICLE": vehicle.plate_number,
                 #     "END_TIME": ride.end_datetime.strftime("%H:%M %d/%m/%Y"),
                 #     "ELAPSED": str(elapsed).split('.')[0]
                 # })
 
                 # await async_send_email(
-                #     to_email=user.email,
-                #     subject=f"⚠️ החזרת רכב באיחור - {vehicle.plate_number}",
-                #     html_content=html_user
+                #     to_email=admin.email,
+                #     subject=f"🚨 רכב לא הוחזר בזמן - {vehicle.plate_number}",
+                #     html_content=html_admin
                 # )
 
-                await sio.emit("new_notification", {
-                    "id": str(user_notif.id),
-                    "user_id": str(user_notif.user_id),
-                    "title": user_notif.title,
-                    "message": user_notif.message,
-                    "notification_type": user_notif.notification_type.value,
-                    "sent_at": user_notif.sent_at.isoformat(),
-                    "vehicle_id": str(vehicle.id),
-                    "order_id": str(ride.id),
-                    "plate_number": vehicle.plate_number,
-                    "seen": False
-                }, room=str(user.employee_id))
-
-            admins = db.query(User).filter(User.role == "admin").all()
-            for admin in admins:
-                exists_admin = db.query(Notification).filter(
-                    Notification.user_id == admin.employee_id,
-                    Notification.vehicle_id == vehicle.id,
-                    Notification.title == "Overdue Vehicle Alert"
-                ).first()
-
-                if not exists_admin:
-                    admin_notif = create_system_notification(
-                        user_id=admin.employee_id,
-                        title="Overdue Vehicle Alert",
-                        message=f"הרכב {vehicle.plate_number} לא הוחזר בזמן ע\"י {user.first_name} {user.last_name}.",
-                        vehicle_id=vehicle.id,
-                        order_id=ride.id
-                    )
-
-                    # html_admin = load_email_template("vehicle_overdue_admin.html", {
-                    #     "USER_NAME": f"{user.first_name} {user.last_name}",
-                    #     "USER_EMAIL": user.email,
-                    #     "VEHICLE": vehicle.plate_number,
-                    #     "END_TIME": ride.end_datetime.strftime("%H:%M %d/%m/%Y"),
-                    #     "ELAPSED": str(elapsed).split('.')[0]
-                    # })
-
-                    # await async_send_email(
-                    #     to_email=admin.email,
-                    #     subject=f"🚨 רכב לא הוחזר בזמן - {vehicle.plate_number}",
-                    #     html_content=html_admin
-                    # )
-
-                    await sio.emit("new_notification", {
-                        "id": str(admin_notif.id),
-                        "user_id": str(admin_notif.user_id),
-                        "title": admin_notif.title,
-                        "message": admin_notif.message,
-                        "notification_type": admin_notif.notification_type.value,
-                        "sent_at": admin_notif.sent_at.isoformat(),
-                        "vehicle_id": str(vehicle.id),
-                        "order_id": str(ride.id),
-                        "plate_number": vehicle.plate_number,
-                        "seen": False
-                    }, room=str(admin.employee_id))
+        await dispatcher.send(db)
 
     finally:
         db.close()
@@ -558,7 +637,7 @@ async def delete_old_archived_vehicles():
         if not vehicles_to_delete:
             return
 
-
+        purge_logs = []
         for vehicle in vehicles_to_delete:
            
             notifications_to_delete = db.query(Notification).filter(
@@ -586,21 +665,34 @@ async def delete_old_archived_vehicles():
                     db.delete(usage)
           
 
-            audit_logs_to_delete = db.query(AuditLog).filter(
-                and_(
-                    cast(AuditLog.entity_id, UUID) == vehicle.id,
-                    AuditLog.entity_type == 'Vehicle'
-                )
-            ).all()
-            if audit_logs_to_delete:
-                for log in audit_logs_to_delete:
-                    db.delete(log)
-            
-
-           
+            # Compared as text so every partition can use its
+            # (entity_type, entity_id) index
+            audit_logs_deleted = db.query(AuditLog).filter(
+                AuditLog.entity_type == 'Vehicle',
+                AuditLog.entity_id == str(vehicle.id),
+            ).delete(synchronize_session=False)
+
+            purge_logs.append({
+                "action": "PURGE",
+                "entity_type": "Vehicle",
+                "entity_id": vehicle.id,
+                "change_data": {
+                    "plate_number": vehicle.plate_number,
+                    "archived_at": vehicle.archived_at.isoformat() if vehicle.archived_at else None,
+                    "rides": len(rides_to_delete),
+                    "notifications": len(notifications_to_delete),
+                    "monthly_usage": len(monthly_usage_to_delete),
+                    "audit_logs": audit_logs_deleted,
+                },
+                "changed_by": SYSTEM_AUDIT_USER_ID,
+                "notes": "Archived vehicle removed after 90 days",
+            })
             db.delete(vehicle)
 
+        log_actions(db, purge_logs)
         db.commit()
+        for vehicle in vehicles_to_delete:
+            availability_index.remove_vehicle(vehicle.id)
 
     except Exception as e:
         db.rollback()
@@ -616,11 +708,11 @@ async def notify_ride_needs_feedback(user_id: int):
             return {"needs_feedback": False}
 
 
-        await sio.emit("feedback_needed", {
+        await emit_event("feedback_needed", {
             "showPage": True,
             "ride_id": str(ride.id),
             "message": "הנסיעה הסתיימה, נא למלא את הטופס"
-        })
+        }, user_id=user_id)
 
     finally:
         db.close()
@@ -646,7 +738,7 @@ async def check_and_unblock_expired_users():
     users_to_notify = []  
 
     try:
-        now = datetime.now(timezone.utc)
+        now = scheduler_now()
 
         expired_blocks = db.query(User).filter(
             User.is_blocked == True,
@@ -676,13 +768,14 @@ async def check_and_unblock_expired_users():
 
     for payload in users_to_notify:
         try:
-            await sio.emit(
+            await emit_event(
                 'user_block_status_updated',
                 {
                     "id": payload["id"],
                     "is_blocked": payload["is_blocked"],
                     "block_expires_at": payload["block_expires_at"]
                 },
+                user_id=payload["id"],
             )
 
         except Exception as e:
@@ -730,20 +823,11 @@ def periodic_delete_stale_rides():
         print(f"Stale rides deletion failed: {e}")
 
 
-scheduler.add_job(check_and_complete_rides, 'interval', minutes=5)
-scheduler.add_job(periodic_check_overdue_rides, 'interval', minutes=5)
-scheduler.add_job(periodic_check_unblock_users, 'interval', minutes=1)
-scheduler.add_job(periodic_delete_stale_rides, 'interval', minutes=1)
-
-
-
 async def delete_stale_pending_or_rejected_rides():
  
     db: Session = SessionLocal()
     try:
-        israel_tz = pytz.timezone("Asia/Jerusalem")
-        now_il = datetime.now(israel_tz)
-        two_hours_ago = now_il - timedelta(hours=2)
+        two_hours_ago = scheduler_now() - timedelta(hours=2)
 
         rides_to_delete = db.query(Ride).filter(
             and_(
@@ -779,6 +863,10 @@ async def delete_stale_pending_or_rejected_rides():
             db.delete(ride)
 
         db.commit()
+        for ride in rides_to_delete:
+            availability_index.remove_ride(ride.id)
+            daily_distance_ledger.remove_ride(ride.id)
+            deadline_scheduler.remove_ride(ride.id)
 
     except Exception as e:
         db.rollback()
@@ -816,7 +904,7 @@ async def check_ride_status_and_notify_user():
     try:
         notification_title_prefix = "עדכון סטטוס נסיעה"
         
-        now = datetime.now(timezone.utc)
+        now = scheduler_now()
         twenty_four_hours_later = now + timedelta(hours=24)
 
         rides_to_notify = db.query(Ride).filter(
@@ -828,7 +916,7 @@ async def check_ride_status_and_notify_user():
         if not rides_to_notify:
             return
 
-
+        dispatcher = NotificationDispatcher()
         for ride in rides_to_notify:
             user = db.query(User).filter(User.employee_id == ride.user_id).first()
             if not user:
@@ -851,8 +939,9 @@ async def check_ride_status_and_notify_user():
                 continue 
 
             destination_name = str(ride.stop)
-            if ride.stop:
-                city = db.query(City).filter(City.id == ride.stop).first()
+            city_id = _as_uuid(ride.stop)
+            if city_id:
+                city = db.get(City, city_id)
                 if city:
                     destination_name = city.name
                 
@@ -862,244 +951,172 @@ async def check_ride_status_and_notify_user():
                 if vehicle:
                     plate_number = vehicle.plate_number
 
-            existing_notif = db.query(Notification).filter(
-                Notification.user_id == user.employee_id,
-                Notification.order_id == ride.id, 
-                Notification.title.like(f"{notification_title_prefix}{status_hebrew}")
-            ).first()
-
-            if not existing_notif:
-                notif_message = f" הנסיעה שלך ליעד {destination_name} עדיין לא אושרה"
-                notification = create_system_notification(
-                    user_id=user.employee_id,
-                    title=f"{notification_title_prefix}{status_hebrew}",
-                    message=notif_message,
-                    order_id=ride.id
-                )
+            dispatcher.add(user.employee_id, {
+                "title": f"{notification_title_prefix}{status_hebrew}",
+                "message": f" הנסיעה שלך ליעד {destination_name} עדיין לא אושרה",
+                "order_id": ride.id,
+                "order_status": ride.status.value,
+                "dedupe_key": dedupe_key("ride_status", ride.id, ride.status.value, user.employee_id)
+            })
 
-                await emit_new_notification(
-                    notification=notification,
-                    room=str(user.employee_id),
-                )
+            # if user_email:
+            #     html_content = load_email_template("ride_status_update.html", {
+            #         "USER_NAME": user_name,
+            #         "STATUS_HEBREW": status_hebrew,
+            #         "STATUS_COLOR": status_color,
+            #         "STATUS_MESSAGE": status_message,
+            #         "RIDE_ID": str(ride.id),
+            #         "DESTINATION": destination_name,
+            #         "DATE_TIME": ride.start_datetime.strftime("%Y-%m-%d %H:%M"), 
+            #         "PLATE_NUMBER": plate_number,
+            #         "LINK_TO_RIDE": f"{BOOKIT_URL}/ride/details/{ride.id}" 
+            #     })
+            #     try:
+            #         await async_send_email(
+            #             to_email=user_email,
+            #             subject=subject,
+            #             html_content=html_content
+            #         )
+            #     except Exception as email_e:
+            #         print(f"Error sending email:{repr(email_e)}")
+
+        await dispatcher.send(db)
 
-                # if user_email:
-                #     html_content = load_email_template("ride_status_update.html", {
-                #         "USER_NAME": user_name,
-                #         "STATUS_HEBREW": status_hebrew,
-                #         "STATUS_COLOR": status_color,
-                #         "STATUS_MESSAGE": status_message,
-                #         "RIDE_ID": str(ride.id),
-                #         "DESTINATION": destination_name,
-                #         "DATE_TIME": ride.start_datetime.strftime("%Y-%m-%d %H:%M"), 
-                #         "PLATE_NUMBER": plate_number,
-                #         "LINK_TO_RIDE": f"{BOOKIT_URL}/ride/details/{ride.id}" 
-                #     })
-                #     try:
-                #         await async_send_email(
-                #             to_email=user_email,
-                #             subject=subject,
-                #             html_content=html_content
-                #         )
-                #     except Exception as email_e:
-                #         print(f"Error sending email:{repr(email_e)}")
-               
     except Exception as e:
         print(f"An error occurred: {repr(e)}")
     finally:
         db.close()
 
 
-async def notify_ride_cancelled_due_to_no_show(ride_id: uuid.UUID):
-
-    db: Session = SessionLocal()
+def _as_uuid(value):
     try:
-        
-        ride = db.query(Ride).filter(Ride.id == ride_id).first()
-        if not ride:
-            return
-
-        user = db.query(User).filter(User.employee_id == ride.user_id).first()
-        if not user:
-            return
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
 
-        user_email = user.email
-        user_name = get_user_name(db, user.employee_id) or "משתמש יקר"
 
-        destination_name = str(ride.stop)
-        if ride.stop:
-            city = db.query(City).filter(City.id == ride.stop).first()
-            if city:
-                destination_name = city.name
+async def notify_rides_cancelled_due_to_no_show(db: Session, cancelled_rides):
+    """Notify riders, their supervisors and the admins about no-show cancellations.
 
-        plate_number = "לא הוקצה רכב"
-        if ride.vehicle_id:
-            vehicle = db.query(Vehicle).filter(Vehicle.id == ride.vehicle_id).first()
-            if vehicle:
-                plate_number = vehicle.plate_number
-                
+    `cancelled_rides` are rows with id, user_id and stop. Users, departments,
+    cities and admins are each loaded once for the whole batch.
+    """
+    try:
+        user_ids = {ride.user_id for ride in cancelled_rides}
+        users = {
+            user.employee_id: user
+            for user in db.query(User).filter(User.employee_id.in_(user_ids)).all()
+        }
+
+        department_ids = {user.department_id for user in users.values() if user.department_id}
+        supervisors = dict(
+            db.query(Department.id, Department.supervisor_id)
+            .filter(Department.id.in_(department_ids))
+            .all()
+        ) if department_ids else {}
+
+        city_ids = {_as_uuid(ride.stop) for ride in cancelled_rides} - {None}
+        city_names = dict(
+            db.query(City.id, City.name).filter(City.id.in_(city_ids)).all()
+        ) if city_ids else {}
+
+        admin_ids = [
+            admin_id for (admin_id,) in
+            db.query(User.employee_id).filter(User.role == UserRole.admin).all()
+            if admin_id
+        ]
+
+        notifications = []
+        for ride in cancelled_rides:
+            user = users.get(ride.user_id)
+            if not user:
+                continue
 
-        notif_message = f"הנסיעה שלך ליעד {destination_name} בוטלה עקב אי-הגעה."
-        notification = create_system_notification(
-            user_id=user.employee_id,
-            title="עדכון: הנסיעה בוטלה עקב אי-הגעה",
-            message=notif_message,
-            order_id=ride.id
-        )
-        await emit_new_notification(
-            notification=notification
-        )
-        if(user.role != UserRole.supervisor):
+            user_name = user.username or "משתמש יקר"
+            destination_name = city_names.get(_as_uuid(ride.stop), str(ride.stop))
 
-            supervisor_id=get_supervisor_id(user_id=user.employee_id,db=db)
-            if supervisor_id:
-                user_name_safe = user_name or "משתמש לא ידוע"
-                destination_safe = destination_name or "יעד לא ידוע"
+            notifications.append(create_system_notification_with_db(
+                db,
+                user_id=user.employee_id,
+                title="עדכון: הנסיעה בוטלה עקב אי-הגעה",
+                message=f"הנסיעה שלך ליעד {destination_name} בוטלה עקב אי-הגעה.",
+                order_id=ride.id
+            ))
 
-                supervisor_notification = create_system_notification(
+            supervisor_id = supervisors.get(user.department_id)
+            if user.role != UserRole.supervisor and supervisor_id:
+                notifications.append(create_system_notification_with_db(
+                    db,
                     user_id=supervisor_id,
                     title="הודעה: הנסיעה בוטלה עקב אי-הגעה",
-                    message=f"הנסיעה של {user_name_safe} ליעד {destination_safe} בוטלה עקב אי-הגעה.",
+                    message=f"הנסיעה של {user_name} ליעד {destination_name or 'יעד לא ידוע'} בוטלה עקב אי-הגעה.",
                     order_id=ride.id
-                )
+                ))
 
-                await emit_new_notification(notification=supervisor_notification)
+            for admin_id in admin_ids:
+                notifications.append(create_system_notification_with_db(
+                    db,
+                    user_id=admin_id,
+                    title="הודעה: הנסיעה בוטלה עקב אי-הגעה",
+                    message=f"הנסיעה של {user_name} ליעד {destination_name} בוטלה עקב אי-הגעה.",
+                    order_id=ride.id
+                ))
 
-        admins = db.query(User).filter(User.role == "admin").all()
-        for admin in admins:
-            admin_id = admin.employee_id
-            if not admin_id:
-                continue
-            admin_notification = create_system_notification(
-                user_id=admin_id,
-                title=f"הודעה: הנסיעה בוטלה עקב אי-הגעה",
-                message=f"הנסיעה של {user_name} ליעד {destination_name} בוטלה עקב אי-הגעה.",
-                order_id=ride.id
-            )
-            await emit_new_notification(
-                notification=admin_notification
-            )
+        if not notifications:
+            return
+
+        db.commit()
 
-        # if user_email:
-        #     html_content_user = load_email_template("ride_cancelled_no_show.html", {
-        #         "USER_NAME": user_name,
-        #         "DESTINATION": destination_name,
-        #         "DATE_TIME": ride.start_datetime.strftime("%Y-%m-%d %H:%M"),
-        #         "PLATE_NUMBER": plate_number,
-        #         "LINK_TO_RIDE": f"{BOOKIT_URL}/ride/details/{ride.id}"
-        #     })
-
-        #     await async_send_email(
-        #         to_email=user_email,
-        #         subject=f"❌ עדכון: הנסיעה שלך בוטלה עקב אי-הגעה",
-        #         html_content=html_content_user
-        #     )
-       
+        await asyncio.gather(*(
+            emit_new_notification(notification=notification)
+            for notification in notifications
+        ))
 
-        
-        admin_users = db.query(User).filter(User.role == "admin").all()
-
-        if admin_users:
-            for admin_user in admin_users:
-                admin_email = admin_user.email
-                supervisor_name = get_user_name(db, admin_user.employee_id) or "מנהל מחלקה יקר" 
-
-                # if admin_email: # Check if the admin user actually has an email
-                #     try:
-                #         html_content_admin = load_email_template("ride_cancelled_no_show_admin.html", {
-                #             "SUPERVISOR_NAME": supervisor_name, 
-                #             "USER_NAME": user_name,
-                #             "DESTINATION": destination_name,
-                #             "DATE_TIME": ride.start_datetime.strftime("%Y-%m-%d %H:%M"),
-                #             "PLATE_NUMBER": plate_number,
-                #             "LINK_TO_RIDE": f"{BOOKIT_URL}/ride/details/{ride.id}"
-                #         })
-                #         await async_send_email(
-                #             to_email=admin_email,
-                #             subject=f"🚨 הודעה: הנסיעה של {user_name} בוטלה עקב אי-הגעה",
-                #             html_content=html_content_admin
-                #         )
-                #     except Exception as email_err:
-                #         print(f"ERROR: Failed to send admin email:{repr(email_err)}")
-        # try:
-        #     if supervisor_id:
-        #         supervisor = db.query(User).filter(User.employee_id == supervisor_id).first()
-        #         if supervisor and supervisor.email:
-        #             supervisor_email = supervisor.email
-        #             supervisor_name = get_user_name(db, supervisor_id) or "מנהל מחלקה יקר"
-
-        #             html_content_supervisor = load_email_template("ride_cancelled_no_show_admin.html", {
-        #                 "SUPERVISOR_NAME": supervisor_name,
-        #                 "USER_NAME": user_name,
-        #                 "DESTINATION": destination_name,
-        #                 "DATE_TIME": ride.start_datetime.strftime("%Y-%m-%d %H:%M"),
-        #                 "PLATE_NUMBER": plate_number,
-        #                 "LINK_TO_RIDE": f"{BOOKIT_URL}/ride/details/{ride.id}"
-        #             })
-
-        #             await async_send_email(
-        #                 to_email=supervisor_email,
-        #                 subject=f"🚨 הודעה: הנסיעה של {user_name} בוטלה עקב אי-הגעה",
-        #                 html_content=html_content_supervisor
-
-        #             )
-
-        # except Exception as e:
-        #     print(f"ERROR: Failed to send email: {repr(e)}")    
     except Exception as e:
+        db.rollback()
         print(f"Error notifying: {repr(e)}")
-      
-    finally:
-        db.commit()
-        db.close()
 
 
 async def check_and_notify_admin_about_no_shows():
     db: Session = SessionLocal()
     try:
-        data = get_no_show_events_count_per_user(db)
-        for user_info in data["users"]:
-            if user_info["no_show_count"] >= 3:
-                title = f"המשתמש {user_info['name']} פספס {user_info['no_show_count']} נסיעות"
-
-                existing = db.query(Notification).filter(
-                    Notification.title == title,
-                    Notification.relevant_user_id == user_info["employee_id"]
-                ).first()
+        repeat_offenders = no_show_counts_per_user(db, min_count=NO_SHOW_ALERT_THRESHOLD)
+        if not repeat_offenders:
+            return
 
-                if not existing:
-                    admins = db.query(User).filter(User.role == "admin").all()
-                    for admin in admins:
-                        admin_id = admin.employee_id
-                        if not admin_id:
-                            continue
-
-                        notif = create_system_notification(
-                            user_id=admin_id,
-                            title=title,
-                            message=f"המשתמש {user_info['name']} פספס {user_info['no_show_count']} נסיעות.",
-                            relevant_user_id=user_info["employee_id"]
-                        )
-                        await emit_new_notification(notification=notif)
-
-                    # for admin in admins:
-                    #     admin_email = admin.email
-                    #     supervisor_name = get_user_name(db, admin.employee_id) or "מנהל מחלקה יקר"
-                    #     if admin_email:
-                    #         try:
-                    #             html_content_admin = load_email_template("users_passed_3_no_show.html", {
-                    #                 "SUPERVISOR_NAME": supervisor_name,
-                    #                 "USER_NAME": user_info["name"],
-                    #                 "NO_SHOW_COUNT": user_info["no_show_count"],
-                    #             })
-                    #             await async_send_email(
-                    #                 to_email=admin_email,
-                    #                 subject=f"🚨 משתמש עם 3 או יותר אי התייצבויות: {user_info['name']}",
-                    #                 html_content=html_content_admin
-                    #             )
-                    #         except Exception as email_err:
-                    #             print(f"ERROR: Failed to send 3+ no-show email")
-                        
-                    db.commit()
+        admin_ids = [admin_id for (admin_id,) in db.query(User.employee_id).filter(User.role == "admin").all()]
+
+        dispatcher = NotificationDispatcher()
+        for user_info in repeat_offenders:
+            title = f"המשתמש {user_info['username']} פספס {user_info['no_show_count']} נסיעות"
+
+            for admin_id in admin_ids:
+                dispatcher.add(admin_id, {
+                    "title": title,
+                    "message": f"המשתמש {user_info['username']} פספס {user_info['no_show_count']} נסיעות.",
+                    "relevant_user_id": user_info["employee_id"],
+                    "dedupe_key": dedupe_key("no_show_alert", user_info["employee_id"], user_info["no_show_count"], admin_id)
+                })
+
+            # for admin in admins:
+            #     admin_email = admin.email
+            #     supervisor_name = get_user_name(db, admin.employee_id) or "מנהל מחלקה יקר"
+            #     if admin_email:
+            #         try:
+            #             html_content_admin = load_email_template("users_passed_3_no_show.html", {
+            #                 "SUPERVISOR_NAME": supervisor_name,
+            #                 "USER_NAME": user_info["name"],
+            #                 "NO_SHOW_COUNT": user_info["no_show_count"],
+            #             })
+            #             await async_send_email(
+            #                 to_email=admin_email,
+            #                 subject=f"🚨 משתמש עם 3 או יותר אי התייצבויות: {user_info['name']}",
+            #                 html_content=html_content_admin
+            #             )
+            #         except Exception as email_err:
+            #             print(f"ERROR: Failed to send 3+ no-show email")
+
+        await dispatcher.send(db)
 
     except Exception as e:
         print(f"Error: {e}")
@@ -1133,12 +1150,11 @@ async def check_and_notify_admin_about_no_shows():
 
 
 
-@scheduler.scheduled_job('interval', minutes=1)
 def periodic_check():
     db = SessionLocal()
     try:
         user_ids = db.query(Ride.user_id).filter(
-            Ride.end_datetime <= datetime.now(timezone.utc),
+            Ride.end_datetime <= scheduler_now(),
             Ride.feedback_submitted == False,
             Ride.status == RideStatus.in_progress
         ).distinct().all()
@@ -1152,12 +1168,20 @@ def periodic_check():
         db.close()
 
 
-def periodic_check_vehicle():
+def periodic_check_expired_vehicles():
     future = asyncio.run_coroutine_threadsafe(check_expired_vehicle(), main_loop)
-    future = asyncio.run_coroutine_threadsafe(check_inactive_vehicles(), main_loop)
-    future = asyncio.run_coroutine_threadsafe(check_vehicle_lease_expiry(), main_loop)
     future.result(timeout=5)
 
+
+def periodic_check_lease_expiry():
+    future = asyncio.run_coroutine_threadsafe(check_vehicle_lease_expiry(), main_loop)
+    future.result(timeout=30)
+
+
+def periodic_check_inactive_vehicles():
+    future = asyncio.run_coroutine_threadsafe(check_inactive_vehicles(), main_loop)
+    future.result(timeout=30)
+
 def periodic_check_ride_status():
     future_ride_status = asyncio.run_coroutine_threadsafe(check_ride_status_and_notify_user(), main_loop)
     try:
@@ -1183,21 +1207,11 @@ def periodic_check_inspector_notif():
 
   
 
-async def delete_audit_logs():
-    db: Session = SessionLocal()
+def run_audit_partition_maintenance():
     try:
-        deleted_count = db.query(AuditLog).delete()  # deletes all rows
-        db.commit()
-        print(f"[{datetime.now()}] Deleted {deleted_count} audit log rows")
+        maintain_audit_partitions()
     except Exception as e:
-        db.rollback()
-        print(f"Error deleting audit logs: {e}")
-    finally:
-        db.close()
-
-def run_delete_audit_logs():
-    future = asyncio.run_coroutine_threadsafe(delete_audit_logs(), main_loop)
-    future.result(timeout=10)
+        print(f"Error maintaining audit log partitions: {e}")
 
 
 def periodic_delete_archived_vehicles():
@@ -1209,26 +1223,75 @@ def periodic_delete_archived_vehicles():
 
 
 
-scheduler.add_job(periodic_check_vehicle, 'interval', minutes=1)
+# Ride, block and lease deadlines run from the deadline scheduler at the
+# moment they are due instead of polling every few minutes
+deadline_scheduler.register(COMPLETE, exclusive(check_and_complete_rides))
+deadline_scheduler.register(NO_SHOW, exclusive(periodic_check_unstarted_rides))
+deadline_scheduler.register(STALE, exclusive(periodic_delete_stale_rides))
+deadline_scheduler.register(OVERDUE, exclusive(periodic_check_overdue_rides))
+deadline_scheduler.register(FEEDBACK, exclusive(periodic_check))
+deadline_scheduler.register(UNBLOCK, exclusive(periodic_check_unblock_users))
+deadline_scheduler.register(LEASE_WARNING, exclusive(periodic_check_lease_expiry))
+deadline_scheduler.register(LEASE_EXPIRED, exclusive(periodic_check_expired_vehicles))
 
 scheduler.add_job(
-    periodic_check_inspector_notif,
+    exclusive(periodic_check_inspector_notif),
     trigger='cron',
     hour=6,
     minute=0
 )
 
-scheduler.add_job(periodic_check_no_show_users, 'interval', minutes=15)
-scheduler.add_job(periodic_check_ride_status, 'interval', minutes=15)
-scheduler.add_job(periodic_delete_archived_vehicles, 'interval',  days=30)
-scheduler.add_job(periodic_check_unstarted_rides, 'interval', minutes=1)
-scheduler.add_job(run_delete_audit_logs, 'interval', weeks=1)  
+# "Not used for a week" only changes day by day
+scheduler.add_job(
+    exclusive(periodic_check_inactive_vehicles),
+    trigger='cron',
+    hour=6,
+    minute=5
+)
+
+scheduler.add_job(exclusive(periodic_check_no_show_users), 'interval', minutes=15)
+scheduler.add_job(exclusive(periodic_check_ride_status), 'interval', minutes=15)
+scheduler.add_job(exclusive(periodic_delete_archived_vehicles), 'interval',  days=30)
+# Creates next months' audit partitions and drops the ones past retention
+scheduler.add_job(exclusive(run_audit_partition_maintenance), 'cron', hour=3, minute=30)  
+# Rollups are refreshed when rides mark keys dirty (refresh_usage_rollups_on_leader);
+# this only catches notifications lost while the listener reconnected
+scheduler.add_job(exclusive(run_refresh_usage_rollups), 'interval', minutes=30)
+# Other workers' writes reach the leader's deadline queue through the ride
+# change listener; this rebuild is only a backstop and prunes fired deadlines
+scheduler.add_job(warm_deadline_scheduler, 'interval', hours=6)
+scheduler.add_job(exclusive(presence.prune, "prune_socket_presence"), 'interval', minutes=5)
+scheduler.add_job(exclusive(prune_spilled_messages), 'interval', minutes=5)
+
+# The availability index and the daily distance ledger follow other workers'
+# writes through the ride change listener, which also resyncs them after
+# every reconnect; the ledger keeps at most MAX_CACHED_DAYS days
+local_scheduler.add_job(presence.heartbeat, 'interval', seconds=10)
+
 
+# Only the elected leader runs the shared jobs; the other workers keep the
+# scheduler paused so they can still add ride jobs to the shared job store
+scheduler.start(paused=True)
+local_scheduler.start()
 
-scheduler.start()
 
-def start_scheduler():
-    pass    
+def start_leader_jobs():
+    scheduler.resume()
+    deadline_scheduler.start()
+    warm_deadline_scheduler()
+    rehydrate_ride_jobs()
+
+
+def stop_leader_jobs():
+    scheduler.pause()
+    deadline_scheduler.stop()
+
+
+def refresh_usage_rollups_on_leader(_payloads=None):
+    # Every worker hears the dirty-keys NOTIFY; only the leader refreshes
+    if leader_election.is_leader:
+        run_refresh_usage_rollups()
+
 
 async def check_expired_government_licenses():
     db: Session = SessionLocal()
@@ -1256,8 +1319,9 @@ async def check_expired_government_licenses():
         db.commit()
         print("Committed license updates to DB")
 
-        admins = db.query(User).filter(User.role == "admin").all()
+        admin_ids = [admin_id for (admin_id,) in db.query(User.employee_id).filter(User.role == "admin").all()]
 
+        dispatcher = NotificationDispatcher(event="license_expiry_notification")
         for user in users_with_expired_license:
             full_name = f"{user.first_name} {user.last_name}"
             expiry = user.license_expiry_date.strftime("%d/%m/%Y") if user.license_expiry_date else "לא הוזן"
@@ -1267,129 +1331,86 @@ async def check_expired_government_licenses():
             print(f"License expiry: {expiry}")
 
             if user.email and "@" in user.email and "." in user.email:
-                try:
-                    # שלח מייל למשתמש עצמו
-                    # user_html_content = f"""
-                    # <!DOCTYPE html>
-                    # <html>
-                    # <head>
-                    #     <meta charset="UTF-8">
-                    #     <title>רישיון ממשלתי פג תוקף</title>
-                    # </head>
-                    # <body>
-                    #     <div style="direction: rtl; font-family: Arial, sans-serif;">
-                    #         <h2>שלום {user.first_name},</h2>
-                    #         <p>רישיון הממשלתי שלך פג תוקף בתאריך: <strong>{expiry}</strong>.</p>
-                    #         <p>אנא עדכן את המידע בהקדם.</p>
-                    #         <br/>
-                    #         <p>תודה,<br/>צוות התמיכה</p>
-                    #     </div>
-                    # </body>
-                    # </html>
-                    # """
-
-                    # print(f"Sending email to user: {user.email}")
-                    # await async_send_email(
-                    #     to_email=user.email,
-                    #     subject="רישיון ממשלתי פג תוקף",
-                    #     html_content=user_html_content
-                    # )
-                    # print(f"✅ Email sent successfully to user {user.employee_id}")
-
-                    # שלח התראה למשתמש
-                    user_notif = create_system_notification(
-                        user_id=user.employee_id,
-                        title="רישיון ממשלתי פג תוקף",
-                        message=f"הרישיון הממשלתי שלך פג תוקף (תוקף עד {expiry}). אנא חדש את הרישיון במהרה.",
-                        relevant_user_id=user.employee_id
-                    )
-
-                    await sio.emit("license_expiry_notification", {
-                        "id": str(user_notif.id),
-                        "user_id": str(user_notif.user_id),
-                        "title": user_notif.title,
-                        "message": user_notif.message,
-                        "notification_type": user_notif.notification_type.value,
-                        "sent_at": user_notif.sent_at.isoformat(),
-                        "relevant_user_id": str(user.employee_id)
-                    }, room=str(user.employee_id))
-                    
-                    print(f" Socket notification sent to user {user.employee_id}")
+                # שלח מייל למשתמש עצמו
+                # user_html_content = f"""
+                # <!DOCTYPE html>
+                # <html>
+                # <head>
+                #     <meta charset="UTF-8">
+                #     <title>רישיון ממשלתי פג תוקף</title>
+                # </head>
+                # <body>
+                #     <div style="direction: rtl; font-family: Arial, sans-serif;">
+                #         <h2>שלום {user.first_name},</h2>
+                #         <p>רישיון הממשלתי שלך פג תוקף בתאריך: <strong>{expiry}</strong>.</p>
+                #         <p>אנא עדכן את המידע בהקדם.</p>
+                #         <br/>
+                #         <p>תודה,<br/>צוות התמיכה</p>
+                #     </div>
+                # </body>
+                # </html>
+                # """
+
+                # print(f"Sending email to user: {user.email}")
+                # await async_send_email(
+                #     to_email=user.email,
+                #     subject="רישיון ממשלתי פג תוקף",
+                #     html_content=user_html_content
+                # )
+                # print(f"✅ Email sent successfully to user {user.employee_id}")
 
-                except Exception as e:
-                    print(f" Error sending email to user {user.employee_id}: {str(e)}")
+                # שלח התראה למשתמש
+                dispatcher.add(user.employee_id, {
+                    "title": "רישיון ממשלתי פג תוקף",
+                    "message": f"הרישיון הממשלתי שלך פג תוקף (תוקף עד {expiry}). אנא חדש את הרישיון במהרה.",
+                    "relevant_user_id": user.employee_id
+                })
             else:
                 print(f" Invalid email for user {user.employee_id}: {user.email}")
 
-            for admin in admins:
-                try:
-                    exists = db.query(Notification).filter(
-                        Notification.user_id == admin.employee_id,
-                        Notification.title == "רישיון ממשלתי לא בתוקף",
-                        Notification.relevant_user_id == user.employee_id
-                    ).first()
-                    
-
-                    if exists:
-                        print(f"Notification already exists for admin {admin.employee_id} and user {user.employee_id}")
-                        continue
-
-                    notif = create_system_notification(
-                        user_id=admin.employee_id,
-                        title="רישיון ממשלתי לא בתוקף",
-                        message=f"למשתמש {full_name} אין רישיון ממשלתי בתוקף (תוקף עד {expiry}).",
-                        relevant_user_id=user.employee_id
-                    )
-
-                    # admin_email = get_user_email(admin.employee_id, db)
-                    # print(f"Admin email: {admin_email}")
-                    
-                    # if admin_email and "@" in admin_email and "." in admin_email:
-                    #     admin_html_content = f"""
-                    #     <!DOCTYPE html>
-                    #     <html>
-                    #     <head>
-                    #         <meta charset="UTF-8">
-                    #         <title>רישיון ממשלתי לא בתוקף</title>
-                    #     </head>
-                    #     <body>
-                    #         <div style="direction: rtl; font-family: Arial, sans-serif;">
-                    #             <h2>שלום {get_user_name(db, admin.employee_id)},</h2>
-                    #             <p>למשתמש <strong>{full_name}</strong> פג תוקף הרישיון הממשלתי בתאריך: <strong>{expiry}</strong>.</p>
-                    #             <p>מזהה משתמש: {user.employee_id}</p>
-                    #             <p>אנא בדק ועקוב אחר עדכון הרישיון.</p>
-                    #             <br/>
-                    #             <p>בברכה,<br/>מערכת ניהול רישיונות</p>
-                    #         </div>
-                    #     </body>
-                    #     </html>
-                    #     """
-
-                    #     print(f"Sending email to admin: {admin_email}")
-                    #     await async_send_email(
-                    #         to_email=admin_email,
-                    #         subject=f"רישיון ממשלתי לא בתוקף - {full_name}",
-                    #         html_content=admin_html_content
-                    #     )
-                    #     print(f"✅ Email sent successfully to admin {admin.employee_id}")
-                    # else:
-                    #     print(f"⚠️ Invalid admin email: {admin_email}")
+            for admin_id in admin_ids:
+                dispatcher.add(admin_id, {
+                    "title": "רישיון ממשלתי לא בתוקף",
+                    "message": f"למשתמש {full_name} אין רישיון ממשלתי בתוקף (תוקף עד {expiry}).",
+                    "relevant_user_id": user.employee_id,
+                    "dedupe_key": dedupe_key("license_invalid", user.employee_id, admin_id)
+                })
 
-                    await sio.emit("license_expiry_notification", {
-                        "id": str(notif.id),
-                        "user_id": str(notif.user_id),
-                        "title": notif.title,
-                        "message": notif.message,
-                        "notification_type": notif.notification_type.value,
-                        "sent_at": notif.sent_at.isoformat(),
-                        "relevant_user_id": str(user.employee_id)
-                    }, room=str(admin.employee_id))
+                # admin_email = get_user_email(admin.employee_id, db)
+                # print(f"Admin email: {admin_email}")
                     
-                    print(f"Socket notification sent to admin {admin.employee_id}")
+                # if admin_email and "@" in admin_email and "." in admin_email:
+                #     admin_html_content = f"""
+                #     <!DOCTYPE html>
+                #     <html>
+                #     <head>
+                #         <meta charset="UTF-8">
+                #         <title>רישיון ממשלתי לא בתוקף</title>
+                #     </head>
+                #     <body>
+                #         <div style="direction: rtl; font-family: Arial, sans-serif;">
+                #             <h2>שלום {get_user_name(db, admin.employee_id)},</h2>
+                #             <p>למשתמש <strong>{full_name}</strong> פג תוקף הרישיון הממשלתי בתאריך: <strong>{expiry}</strong>.</p>
+                #             <p>מזהה משתמש: {user.employee_id}</p>
+                #             <p>אנא בדק ועקוב אחר עדכון הרישיון.</p>
+                #             <br/>
+                #             <p>בברכה,<br/>מערכת ניהול רישיונות</p>
+                #         </div>
+                #     </body>
+                #     </html>
+                #     """
+
+                #     print(f"Sending email to admin: {admin_email}")
+                #     await async_send_email(
+                #         to_email=admin_email,
+                #         subject=f"רישיון ממשלתי לא בתוקף - {full_name}",
+                #         html_content=admin_html_content
+                #     )
+                #     print(f"✅ Email sent successfully to admin {admin.employee_id}")
+                # else:
+                #     print(f"⚠️ Invalid admin email: {admin_email}")
 
-                except Exception as e:
-                    print(f"Error processing admin {admin.employee_id}: {str(e)}")
-                    continue
+        await dispatcher.send(db)
 
     except Exception as e:
         db.rollback()
@@ -0,0 +1,358 @@
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..utils.database import engine
+from ..utils.leader_election import advisory_key
+from ..utils.table_versions import NOTIFIED_TABLES
+
+SCHEMA_UPGRADES_LOCK_NAME = "vehicle-desk:schema-upgrades"
+
+# There are no migrations in this project, so additive schema changes that
+# the models rely on are listed here and applied once at startup. Each entry
+# is (name, statements); applied names are recorded in schema_upgrades.
+SCHEMA_UPGRADES = [
+    (
+        "notifications_dedupe_key",
+        [
+            "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS dedupe_key TEXT",
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_notifications_dedupe_key
+            ON notifications (dedupe_key) WHERE dedupe_key IS NOT NULL
+            """,
+            # Give notifications sent before the column existed the key they
+            # would get today, so the jobs don't send them a second time
+            """
+            UPDATE notifications AS n SET dedupe_key = k.dedupe_key
+            FROM (
+                SELECT DISTINCT ON (dedupe_key) id, dedupe_key
+                FROM (
+                    SELECT id, sent_at, CASE
+                        WHEN title = 'Inactive Vehicle' AND vehicle_id IS NOT NULL
+                            THEN 'inactive_vehicle:' || vehicle_id || ':' || user_id
+                        WHEN title = 'Vehicle Overdue' AND vehicle_id IS NOT NULL
+                            THEN 'vehicle_overdue:' || vehicle_id || ':' || user_id
+                        WHEN title = 'Overdue Vehicle Alert' AND vehicle_id IS NOT NULL
+                            THEN 'overdue_vehicle_alert:' || vehicle_id || ':' || user_id
+                        WHEN title = 'Vehicle Odometer Update' AND vehicle_id IS NOT NULL
+                            THEN 'odometer:' || vehicle_id || ':' || user_id
+                        WHEN title = 'רישיון ממשלתי לא בתוקף' AND relevant_user_id IS NOT NULL
+                            THEN 'license_invalid:' || relevant_user_id || ':' || user_id
+                        WHEN title = 'עדכון סטטוס נסיעהממתין לאישור' AND order_id IS NOT NULL
+                            THEN 'ride_status:' || order_id || ':pending:' || user_id
+                        WHEN title = 'עדכון סטטוס נסיעהנדחתה' AND order_id IS NOT NULL
+                            THEN 'ride_status:' || order_id || ':rejected:' || user_id
+                        WHEN title LIKE 'המשתמש % פספס % נסיעות' AND relevant_user_id IS NOT NULL
+                            THEN 'no_show_alert:' || relevant_user_id || ':'
+                                || substring(title from 'פספס ([0-9]+) נסיעות') || ':' || user_id
+                    END AS dedupe_key
+                    FROM notifications
+                    WHERE dedupe_key IS NULL
+                ) AS candidates
+                WHERE dedupe_key IS NOT NULL
+                ORDER BY dedupe_key, sent_at
+            ) AS k
+            WHERE n.id = k.id
+              AND NOT EXISTS (SELECT 1 FROM notifications e WHERE e.dedupe_key = k.dedupe_key)
+            """,
+        ],
+    ),
+    (
+        "socketio_pubsub",
+        [
+            # Socket.IO messages too large for a NOTIFY payload
+            """
+            CREATE TABLE IF NOT EXISTS socketio_messages (
+                id BIGSERIAL PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS socket_hosts (
+                host_id TEXT PRIMARY KEY,
+                last_seen TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS socket_presence (
+                sid TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                host_id TEXT NOT NULL,
+                connected_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_socket_presence_user_id ON socket_presence (user_id)",
+        ],
+    ),
+    (
+        "audit_logs_keyset_indexes",
+        [
+            # Keyset pagination of the audit log, newest first
+            "CREATE INDEX IF NOT EXISTS ix_audit_logs_created_at_id ON audit_logs (created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_audit_logs_entity ON audit_logs (entity_type, entity_id)",
+        ],
+    ),
+    (
+        "audit_logs_partitioned",
+        [
+            # Rebuild audit_logs as a table partitioned by month of created_at,
+            # so retention can drop whole months (see utils/audit_partitions.py)
+            """
+            DO $$
+            DECLARE
+                id_seq text;
+                trigger_def record;
+                month date;
+                last_month date := (date_trunc('month', now()) + interval '2 months')::date;
+            BEGIN
+                -- Anyone else rebuilding the table holds this until they
+                -- commit, so the check below sees their result
+                LOCK TABLE audit_logs IN ACCESS EXCLUSIVE MODE;
+                IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'audit_logs'::regclass) THEN
+                    RETURN;
+                END IF;
+
+                id_seq := pg_get_serial_sequence('audit_logs', 'id');
+
+                ALTER TABLE audit_logs RENAME TO audit_logs_legacy;
+                IF id_seq IS NOT NULL THEN
+                    EXECUTE format('ALTER SEQUENCE %s OWNED BY NONE', id_seq);
+                END IF;
+
+                CREATE TABLE audit_logs (LIKE audit_logs_legacy INCLUDING DEFAULTS)
+                    PARTITION BY RANGE (created_at);
+                ALTER TABLE audit_logs ALTER COLUMN created_at SET DEFAULT (now() AT TIME ZONE 'utc');
+                ALTER TABLE audit_logs ADD PRIMARY KEY (id, created_at);
+                CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT;
+
+                UPDATE audit_logs_legacy SET created_at = inspected_at WHERE created_at IS NULL;
+                SELECT date_trunc('month', COALESCE(min(created_at), now()))::date
+                    INTO month FROM audit_logs_legacy;
+                WHILE month <= last_month LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF audit_logs FOR VALUES FROM (%L) TO (%L)',
+                        'audit_logs_' || to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date
+                    );
+                    month := (month + interval '1 month')::date;
+                END LOOP;
+
+                INSERT INTO audit_logs SELECT * FROM audit_logs_legacy;
+
+                -- Triggers on the old table (e.g. NOTIFY) move over after the
+                -- copy so they don't fire for existing rows
+                FOR trigger_def IN
+                    SELECT pg_get_triggerdef(oid) AS def FROM pg_trigger
+                    WHERE tgrelid = 'audit_logs_legacy'::regclass AND NOT tgisinternal
+                LOOP
+                    EXECUTE replace(trigger_def.def, 'audit_logs_legacy', 'audit_logs');
+                END LOOP;
+
+                DROP TABLE audit_logs_legacy;
+                IF id_seq IS NOT NULL THEN
+                    EXECUTE format('ALTER SEQUENCE %s OWNED BY audit_logs.id', id_seq);
+                END IF;
+            END $$
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_audit_logs_created_at_id ON audit_logs (created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_audit_logs_entity ON audit_logs (entity_type, entity_id)",
+        ],
+    ),
+    (
+        "usage_rollups",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS monthly_department_usage (
+                id UUID PRIMARY KEY,
+                department_id UUID REFERENCES departments (id) ON DELETE CASCADE,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                total_rides INTEGER DEFAULT 0,
+                total_km DOUBLE PRECISION DEFAULT 0,
+                usage_hours DOUBLE PRECISION DEFAULT 0,
+                vehicles_used INTEGER DEFAULT 0,
+                CONSTRAINT unique_monthly_department_usage UNIQUE (department_id, year, month)
+            )
+            """,
+            # (vehicle, month) keys whose rollup rows are out of date
+            """
+            CREATE TABLE IF NOT EXISTS usage_rollup_dirty (
+                vehicle_id UUID NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                PRIMARY KEY (vehicle_id, year, month)
+            )
+            """,
+            """
+            CREATE OR REPLACE FUNCTION mark_usage_rollup_dirty() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'UPDATE'
+                   AND (OLD.status, OLD.vehicle_id, OLD.user_id, OLD.start_datetime,
+                        OLD.end_datetime, OLD.actual_distance_km)
+                       IS NOT DISTINCT FROM
+                       (NEW.status, NEW.vehicle_id, NEW.user_id, NEW.start_datetime,
+                        NEW.end_datetime, NEW.actual_distance_km) THEN
+                    RETURN NULL;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status::text = 'completed'
+                   AND OLD.vehicle_id IS NOT NULL THEN
+                    INSERT INTO usage_rollup_dirty (vehicle_id, year, month)
+                    VALUES (OLD.vehicle_id, extract(year FROM OLD.start_datetime), extract(month FROM OLD.start_datetime))
+                    ON CONFLICT DO NOTHING;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status::text = 'completed'
+                   AND NEW.vehicle_id IS NOT NULL THEN
+                    INSERT INTO usage_rollup_dirty (vehicle_id, year, month)
+                    VALUES (NEW.vehicle_id, extract(year FROM NEW.start_datetime), extract(month FROM NEW.start_datetime))
+                    ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS rides_usage_rollup ON rides",
+            """
+            CREATE TRIGGER rides_usage_rollup
+            AFTER INSERT OR UPDATE OR DELETE ON rides
+            FOR EACH ROW EXECUTE FUNCTION mark_usage_rollup_dirty()
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_rides_completed_vehicle_start
+            ON rides (vehicle_id, start_datetime) WHERE status = 'completed'
+            """,
+            # Rows written by the old per-form increments are rebuilt, and
+            # completed rides they missed are added, on the first refresh
+            """
+            INSERT INTO usage_rollup_dirty (vehicle_id, year, month)
+            SELECT DISTINCT vehicle_id, extract(year FROM start_datetime), extract(month FROM start_datetime)
+            FROM rides WHERE status = 'completed' AND vehicle_id IS NOT NULL
+            UNION
+            SELECT vehicle_id, year, month FROM monthly_vehicle_usage
+            ON CONFLICT DO NOTHING
+            """,
+        ],
+    ),
+    (
+        "no_show_events_user_index",
+        [
+            # Per-user no-show counts, optionally within a date range
+            "CREATE INDEX IF NOT EXISTS ix_no_show_events_user_occurred_at ON no_show_events (user_id, occurred_at)",
+        ],
+    ),
+    (
+        "rides_change_notify",
+        [
+            # Tells every worker which rides to reload into its availability
+            # index and distance ledger (see utils/ride_change_listener.py)
+            """
+            CREATE OR REPLACE FUNCTION notify_ride_change() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    PERFORM pg_notify('ride_changes', OLD.id::text);
+                    RETURN NULL;
+                END IF;
+                IF TG_OP = 'UPDATE'
+                   AND (OLD.status, OLD.vehicle_id, OLD.start_datetime, OLD.end_datetime,
+                        OLD."isArchive", OLD.actual_distance_km)
+                       IS NOT DISTINCT FROM
+                       (NEW.status, NEW.vehicle_id, NEW.start_datetime, NEW.end_datetime,
+                        NEW."isArchive", NEW.actual_distance_km) THEN
+                    RETURN NULL;
+                END IF;
+                PERFORM pg_notify('ride_changes', NEW.id::text);
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS rides_change_notify ON rides",
+            """
+            CREATE TRIGGER rides_change_notify
+            AFTER INSERT OR UPDATE OR DELETE ON rides
+            FOR EACH ROW EXECUTE FUNCTION notify_ride_change()
+            """,
+        ],
+    ),
+    (
+        "usage_rollup_dirty_notify",
+        [
+            # Wakes the leader to refresh the rollups (see
+            # services/usage_rollups.py) instead of polling the dirty table.
+            # A statement whose ON CONFLICT inserted no rows notifies too; its
+            # keys are already dirty and waiting for a refresh, so the extra
+            # wakeup costs at most one empty DELETE
+            """
+            CREATE OR REPLACE FUNCTION notify_usage_rollup_dirty() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('usage_rollup_dirty', '');
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS usage_rollup_dirty_notify ON usage_rollup_dirty",
+            """
+            CREATE TRIGGER usage_rollup_dirty_notify
+            AFTER INSERT ON usage_rollup_dirty
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_usage_rollup_dirty()
+            """,
+        ],
+    ),
+    (
+        "table_changes_notify",
+        [
+            # Bumps the table's version in every worker (see
+            # utils/table_versions.py); a statement that matched no rows
+            # notifies too, which only costs a cache recompute
+            """
+            CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('table_changes', TG_TABLE_NAME);
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql
+            """,
+            *[
+                statement
+                for table in NOTIFIED_TABLES
+                for statement in (
+                    f"DROP TRIGGER IF EXISTS {table}_table_changes_notify ON {table}",
+                    f"""
+                    CREATE TRIGGER {table}_table_changes_notify
+                    AFTER INSERT OR UPDATE OR DELETE ON {table}
+                    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change()
+                    """,
+                )
+            ],
+        ],
+    ),
+]
+
+
+def _apply_pending_upgrades():
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_upgrades (
+                name TEXT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """))
+        applied = set(conn.execute(text("SELECT name FROM schema_upgrades")).scalars())
+
+    for name, statements in SCHEMA_UPGRADES:
+        if name in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                for statement in statements:
+                    conn.execute(text(statement))
+                conn.execute(text("INSERT INTO schema_upgrades (name) VALUES (:name)"), {"name": name})
+            print(f"🛠️ Applied schema upgrade {name}")
+        except SQLAlchemyError as e:
+            print(f"❌ Schema upgrade {name} failed: {e}")
+
+
+def apply_schema_upgrades():
+    # Every worker calls this at startup; the first one applies the upgrades
+    # while the others wait here and then find them recorded
+    key = advisory_key(SCHEMA_UPGRADES_LOCK_NAME)
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key})
+        try:
+            _apply_pending_upgrades()
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
@@ -0,0 +1,256 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import socketio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Emits to the same rooms within this window go out as one frame; 0 disables
+# buffering and every emit is sent right away
+FLUSH_INTERVAL_MS = float(os.getenv("SOCKETIO_FLUSH_MS", "50"))
+# A frame never carries more events than this, and a buffer holding this
+# many events is flushed without waiting for the window to end
+MAX_BATCH_SIZE = int(os.getenv("SOCKETIO_MAX_BATCH", "100"))
+
+# Frames with more than one event are sent as this event, carrying a list of
+# [event, data] pairs in the order they were emitted
+BATCH_EVENT = "batch"
+
+
+class BufferMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.buffered = 0
+            self.bypassed = 0
+            self.frames = 0
+            self.batched_frames = 0
+            self.flushes = 0
+            self.max_queue_depth = 0
+            self.total_wait_ms = 0.0
+            self.max_wait_ms = 0.0
+            self.total_flush_ms = 0.0
+            self.max_flush_ms = 0.0
+            self.emit_errors = 0
+
+    def record_buffered(self, depth: int):
+        with self._lock:
+            self.buffered += 1
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def record_frame(self, size: int, wait_ms: float, failed: bool = False):
+        with self._lock:
+            self.frames += 1
+            if size > 1:
+                self.batched_frames += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            if failed:
+                self.emit_errors += 1
+
+    def record_flush(self, duration_ms: float):
+        with self._lock:
+            self.flushes += 1
+            self.total_flush_ms += duration_ms
+            self.max_flush_ms = max(self.max_flush_ms, duration_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "buffered_events": self.buffered,
+                "bypassed_events": self.bypassed,
+                "frames": self.frames,
+                "batched_frames": self.batched_frames,
+                "avg_events_per_frame": round(self.buffered / self.frames, 3) if self.frames else 0.0,
+                "max_queue_depth": self.max_queue_depth,
+                # time an event spent in the buffer before its frame was emitted
+                "avg_flush_latency_ms": round(self.total_wait_ms / self.frames, 3) if self.frames else 0.0,
+                "max_flush_latency_ms": round(self.max_wait_ms, 3),
+                # time spent emitting the frames of one flush
+                "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+                "max_flush_ms": round(self.max_flush_ms, 3),
+                "emit_errors": self.emit_errors,
+            }
+
+
+# (rooms, event, data, enqueued_at)
+BufferedEvent = Tuple[Tuple[str, ...], str, object, float]
+
+
+def build_frames(events: List[BufferedEvent], max_batch: int) -> List[Tuple[Tuple[str, ...], List[BufferedEvent]]]:
+    """Group runs of consecutive events for the same rooms into frames.
+
+    A socket may sit in several rooms (e.g. its user room and role_admin),
+    and which ones is not known here, so an event only joins the frame
+    started last; any other room set in between closes it. Frames are
+    emitted in order, so every socket receives its events in emit order.
+    """
+    frames: List[Tuple[Tuple[str, ...], List[BufferedEvent]]] = []
+
+    for item in events:
+        rooms = item[0]
+        if not frames or frames[-1][0] != rooms or len(frames[-1][1]) >= max_batch:
+            frames.append((rooms, []))
+        frames[-1][1].append(item)
+    return frames
+
+
+class SocketEventBuffer:
+    """Collects room-targeted emits for a short window and sends them as
+    one frame per room set.
+
+    All buffering happens on the event loop the first emit came from (the
+    server's loop); emits made from another loop, e.g. a scheduler thread,
+    are handed over to it.
+    """
+
+    def __init__(self, flush_interval_ms: float = FLUSH_INTERVAL_MS, max_batch: int = MAX_BATCH_SIZE):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.metrics = BufferMetrics()
+        self._queue: Deque[BufferedEvent] = deque()
+        self._server: Optional[socketio.AsyncServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._has_events: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.flush_interval > 0
+
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def attach(self, server: socketio.AsyncServer):
+        self._server = server
+
+    def _bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._queue.clear()
+        self._has_events = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+
+    def enqueue(self, event: str, data, rooms):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._loop is not None and self._loop.is_running() and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._append, event, data, rooms, time.perf_counter())
+                return
+            self._bind_loop(loop)
+        self._append(event, data, rooms, time.perf_counter())
+
+    def _append(self, event: str, data, rooms, enqueued_at: float):
+        if isinstance(rooms, str):
+            rooms = (rooms,)
+        key = tuple(sorted({str(room) for room in rooms}))
+        self._queue.append((key, event, data, enqueued_at))
+        depth = len(self._queue)
+        self.metrics.record_buffered(depth)
+        self._has_events.set()
+        if depth >= self.max_batch:
+            self._full.set()
+
+    async def _run(self):
+        while True:
+            await self._has_events.wait()
+            if not self._full.is_set():
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
+
+    async def flush(self):
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            self._has_events.clear()
+            self._full.clear()
+            if not self._queue:
+                return
+            events = list(self._queue)
+            self._queue.clear()
+
+            started = time.perf_counter()
+            for rooms, items in build_frames(events, self.max_batch):
+                await self._emit_frame(rooms, items)
+            self.metrics.record_flush((time.perf_counter() - started) * 1000)
+
+    async def _emit_frame(self, rooms: Tuple[str, ...], items: List[BufferedEvent]):
+        wait_ms = (time.perf_counter() - items[0][3]) * 1000
+        room = list(rooms) if len(rooms) > 1 else rooms[0]
+        try:
+            if len(items) == 1:
+                await self._server.emit_now(items[0][1], items[0][2], room=room)
+            else:
+                await self._server.emit_now(BATCH_EVENT, [[event, data] for _, event, data, _ in items], room=room)
+            self.metrics.record_frame(len(items), wait_ms)
+        except Exception as e:
+            self.metrics.record_frame(len(items), wait_ms, failed=True)
+            print(f"❌ Failed to emit buffered socket frame to {room}: {e}")
+
+    async def close(self):
+        if self._task is not None and self._loop is asyncio.get_running_loop():
+            await self.flush()
+            self._task.cancel()
+        self._task = None
+        self._loop = None
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "max_batch_size": self.max_batch,
+            "queue_depth": self.depth(),
+            **self.metrics.snapshot(),
+        }
+
+
+class BufferedAsyncServer(socketio.AsyncServer):
+    """AsyncServer whose room-targeted emits go through a SocketEventBuffer.
+
+    Broadcasts, emits with a callback or skip_sid and other namespaces are
+    sent directly.
+    """
+
+    def __init__(self, *args, event_buffer: Optional[SocketEventBuffer] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.event_buffer = event_buffer or SocketEventBuffer()
+        self.event_buffer.attach(self)
+
+    async def emit_now(self, event, data=None, to=None, room=None, skip_sid=None, namespace=None,
+                       callback=None, ignore_queue=False):
+        return await super().emit(event, data=data, to=to, room=room, skip_sid=skip_sid, namespace=namespace,
+                                  callback=callback, ignore_queue=ignore_queue)
+
+    async def emit(self, event, data=None, to=None, room=None, skip_sid=None, namespace=None,
+                   callback=None, ignore_queue=False):
+        rooms = to or room
+        if (
+            not self.event_buffer.enabled
+            or not rooms
+            or skip_sid is not None
+            or callback is not None
+            or ignore_queue
+            or (namespace or "/") != "/"
+        ):
+            self.event_buffer.metrics.record_bypass()
+            return await self.emit_now(event, data=data, to=to, room=room, skip_sid=skip_sid, namespace=namespace,
+                                       callback=callback, ignore_queue=ignore_queue)
+        self.event_buffer.enqueue(event, data, rooms)
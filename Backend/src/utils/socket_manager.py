@@ -1,8 +1,99 @@
 import socketio
 from ..utils.auth import token_check_socket
+from ..utils.socket_buffer import BufferedAsyncServer
+from ..utils.socket_pubsub import create_client_manager, presence
 
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
-user_rooms = {}
+# The client manager relays emits to sockets connected to other workers;
+# room emits are coalesced into one frame per room set every few ms
+sio = BufferedAsyncServer(async_mode="asgi", cors_allowed_origins="*", client_manager=create_client_manager())
+
+
+# Rooms
+def user_room(user_id) -> str:
+    return str(user_id)
+
+
+def department_room(department_id) -> str:
+    return f"department_{department_id}"
+
+
+def department_supervisors_room(department_id) -> str:
+    return f"department_{department_id}_supervisors"
+
+
+def role_room(role) -> str:
+    return f"role_{getattr(role, 'value', role)}"
+
+
+# Audiences
+USER = "user"                                  # the user(s) the event is about
+DEPARTMENT_SUPERVISORS = "department_supervisors"
+ADMINS = "admins"
+INSPECTORS = "inspectors"
+
+# Every event sent through emit_event declares who listens to it
+EVENT_AUDIENCES = {
+    "new_notification": (USER,),
+    "notification_seen": (USER,),
+    "notifications_marked_seen": (USER,),
+    "ride_supposed_to_start": (USER,),
+    "feedback_needed": (USER,),
+    "reservationCanceledDueToVehicleFreeze": (USER,),
+    "new_ride_request": (USER, DEPARTMENT_SUPERVISORS),
+    "order_updated": (USER, DEPARTMENT_SUPERVISORS),
+    "order_deleted": (USER, DEPARTMENT_SUPERVISORS, ADMINS),
+    "ride_status_updated": (USER, DEPARTMENT_SUPERVISORS, ADMINS),
+    "user_block_status_updated": (USER, ADMINS),
+    "user_license_updated": (USER, ADMINS),
+    "vehicle_status_updated": (ADMINS,),
+    "vehicle_mileage_updated": (ADMINS,),
+    "new_inspection": (ADMINS, INSPECTORS),
+    "audit_log_updated": (ADMINS,),
+    "upload_progress": (USER,),
+}
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [v for v in value if v]
+    return [value]
+
+
+def audience_rooms(event: str, user_id=None, department_id=None) -> list:
+    audiences = EVENT_AUDIENCES.get(event)
+    if audiences is None:
+        raise ValueError(f"No audience declared for socket event '{event}'")
+
+    rooms = []
+    if USER in audiences:
+        rooms.extend(user_room(u) for u in _as_list(user_id))
+    if DEPARTMENT_SUPERVISORS in audiences:
+        rooms.extend(department_supervisors_room(d) for d in _as_list(department_id) if str(d) != 'None')
+    if ADMINS in audiences:
+        rooms.append(role_room("admin"))
+    if INSPECTORS in audiences:
+        rooms.append(role_room("inspector"))
+    return list(dict.fromkeys(rooms))
+
+
+async def emit_event(event: str, data, user_id=None, department_id=None):
+    """Emit to the rooms declared for the event; user_id and department_id
+    may be single ids or lists. Sockets in several rooms get it once."""
+    rooms = audience_rooms(event, user_id=user_id, department_id=department_id)
+    if rooms:
+        await sio.emit(event, data, room=rooms)
+
+
+async def _enter_rooms(sid, user_id, role, department_id):
+    await sio.enter_room(sid, user_room(user_id))
+    if role:
+        await sio.enter_room(sid, role_room(role))
+    if department_id and department_id != 'None':
+        await sio.enter_room(sid, department_room(department_id))
+        if role == "supervisor":
+            await sio.enter_room(sid, department_supervisors_room(department_id))
 
 @sio.event
 async def connect(sid, environ, auth=None):
@@ -27,12 +118,8 @@ async def connect(sid, environ, auth=None):
         'department_id': department_id
     })
     
-    await sio.enter_room(sid, user_id)
-    user_rooms[user_id] = sid
-
-    if department_id and department_id != 'None':
-        department_room = f"department_{department_id}"
-        await sio.enter_room(sid, department_room)
+    await _enter_rooms(sid, user_id, role, department_id)
+    await presence.add(user_id, sid)
     return True
 
 @sio.event
@@ -43,56 +130,36 @@ async def join(sid, data):
     
     user_id = data.get('user_id')
     if user_id and str(user_id) == session.get('user_id'):
-        await sio.enter_room(sid, str(user_id))
-        user_rooms[str(user_id)] = sid
-
-        department_id = session.get('department_id')
-        if department_id and department_id != 'None':
-            department_room = f"department_{department_id}"
-            await sio.enter_room(sid, department_room)
+        await _enter_rooms(sid, str(user_id), session.get('role'), session.get('department_id'))
+        await presence.add(str(user_id), sid)
 
 @sio.event
 async def disconnect(sid):
     session = await sio.get_session(sid)
     if session and 'user_id' in session:
-        user_id = session['user_id']
-        if str(user_id) in user_rooms and user_rooms[str(user_id)] == sid:
-            del user_rooms[str(user_id)]
-            return
-        else:
-            return
-
-
-async def emit_new_ride_request(ride_data: dict):
-    """Emit new ride request to department supervisors"""
-    department_id = ride_data.get('department_id')
-    if department_id:
-        department_room = f"department_{department_id}"
-        await sio.emit('new_ride_request', ride_data, room=department_room)
-
-async def emit_order_updated(ride_id: str, ride_data: dict):
-    """Emit order update to relevant department"""
-    department_id = ride_data.get('department_id')
-    if department_id:
-        department_room = f"department_{department_id}"
-        await sio.emit('order_updated', {
-            'ride_id': ride_id, 
-            **ride_data
-        }, room=department_room)
-
-async def emit_order_deleted(ride_id: str, department_id: str):
-    """Emit order deletion to relevant department"""
-    if department_id:
-        department_room = f"department_{department_id}"
-        await sio.emit('order_deleted', {
-            'ride_id': ride_id
-        }, room=department_room)
-
-async def emit_ride_status_updated(ride_id: str, new_status: str, department_id: str):
-    """Emit ride status update to relevant department"""
-    if department_id:
-        department_room = f"department_{department_id}"
-        await sio.emit('ride_status_updated', {
-            'ride_id': ride_id,
-            'new_status': new_status
-        }, room=department_room)
\ No newline at end of file
+        await presence.remove(str(session['user_id']), sid)
+
+
+async def emit_new_ride_request(ride_data: dict, user_id=None):
+    """Emit new ride request to department supervisors and the rider"""
+    await emit_event('new_ride_request', ride_data, user_id=user_id, department_id=ride_data.get('department_id'))
+
+async def emit_order_updated(ride_id: str, ride_data: dict, user_id=None):
+    """Emit order update to department supervisors and the rider"""
+    await emit_event('order_updated', {
+        'ride_id': ride_id,
+        **ride_data
+    }, user_id=user_id, department_id=ride_data.get('department_id'))
+
+async def emit_order_deleted(ride_id: str, department_id: str, user_id=None):
+    """Emit order deletion to department supervisors, admins and the rider"""
+    await emit_event('order_deleted', {
+        'ride_id': ride_id
+    }, user_id=user_id, department_id=department_id)
+
+async def emit_ride_status_updated(ride_id: str, new_status: str, department_id: str = None, user_id=None):
+    """Emit ride status update to department supervisors, admins and the rider"""
+    await emit_event('ride_status_updated', {
+        'ride_id': ride_id,
+        'new_status': new_status
+    }, user_id=user_id, department_id=department_id)
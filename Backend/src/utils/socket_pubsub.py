@@ -0,0 +1,344 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
+
+import psycopg2
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from dotenv import load_dotenv
+from engineio import json
+from sqlalchemy import text
+
+from ..utils.database import AsyncSessionLocal, engine
+
+load_dotenv()
+
+# Unset: single process, no message queue.
+# "redis://host:6379/0": python-socketio's Redis manager (needs the redis package).
+# "postgres": LISTEN/NOTIFY on DATABASE_URL, no extra service required.
+MESSAGE_QUEUE_URL = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+CHANNEL = os.getenv("SOCKETIO_CHANNEL", "vehicle_desk_socketio")
+
+# NOTIFY payloads are limited to 8000 bytes; larger messages are stored in
+# socketio_messages and only their id is sent
+NOTIFY_PAYLOAD_LIMIT = 7900
+SPILLED_PREFIX = "ref:"
+
+# A worker whose heartbeat is older than this is considered gone
+PRESENCE_TTL_SECONDS = 30
+
+
+def _room_kind(room) -> str:
+    if room is None:
+        return "broadcast"
+    if not isinstance(room, str):
+        return "multi"
+    if room.startswith("department_"):
+        return "department"
+    if room.startswith("role_"):
+        return "role"
+    return "user"
+
+
+class FanoutMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.emits = 0
+            self.by_event: Dict[str, int] = defaultdict(int)
+            self.by_room_kind: Dict[str, int] = defaultdict(int)
+            self.published = 0
+            self.spilled = 0
+            self.publish_errors = 0
+            self.received = 0
+            self.total_latency_ms = 0.0
+            self.max_latency_ms = 0.0
+
+    def record_emit(self, event: str, room):
+        with self._lock:
+            self.emits += 1
+            self.by_event[event] += 1
+            self.by_room_kind[_room_kind(room)] += 1
+
+    def record_publish(self, spilled: bool = False, failed: bool = False):
+        with self._lock:
+            if failed:
+                self.publish_errors += 1
+                return
+            self.published += 1
+            if spilled:
+                self.spilled += 1
+
+    def record_receive(self, latency_ms: float):
+        with self._lock:
+            self.received += 1
+            self.total_latency_ms += latency_ms
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "emits": self.emits,
+                "by_event": dict(self.by_event),
+                "by_room_kind": dict(self.by_room_kind),
+                "published": self.published,
+                "spilled": self.spilled,
+                "publish_errors": self.publish_errors,
+                "received_from_other_workers": self.received,
+                "avg_delivery_latency_ms": round(self.total_latency_ms / self.received, 3) if self.received else 0.0,
+                "max_delivery_latency_ms": round(self.max_latency_ms, 3),
+            }
+
+
+fanout_metrics = FanoutMetrics()
+
+
+class FanoutMetricsMixin:
+    """Counts emits and measures how long messages take to reach other workers."""
+
+    async def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        fanout_metrics.record_emit(event, to or room)
+        return await super().emit(
+            event, data, namespace=namespace, room=room, skip_sid=skip_sid, callback=callback, to=to, **kwargs
+        )
+
+    async def _publish(self, data):
+        data["sent_at"] = time.time()
+        return await super()._publish(data)
+
+    async def _handle_emit(self, message):
+        sent_at = message.get("sent_at")
+        if sent_at and message.get("host_id") != self.host_id:
+            fanout_metrics.record_receive((time.time() - sent_at) * 1000)
+        return await super()._handle_emit(message)
+
+
+class MeteredManager(FanoutMetricsMixin, socketio.AsyncManager):
+    pass
+
+
+class MeteredRedisManager(FanoutMetricsMixin, socketio.AsyncRedisManager):
+    async def _publish(self, data):
+        try:
+            result = await super()._publish(data)
+            fanout_metrics.record_publish()
+            return result
+        except Exception:
+            fanout_metrics.record_publish(failed=True)
+            raise
+
+
+class PostgresPubSubManager(FanoutMetricsMixin, AsyncPubSubManager):
+    """Socket.IO client manager that relays messages between workers with
+    Postgres LISTEN/NOTIFY.
+
+    Publishing goes through one psycopg2 connection on a single thread, so
+    it works from any event loop and keeps the order of emits.
+    """
+
+    name = "postgres"
+
+    def __init__(self, url: Optional[str] = None, channel: str = CHANNEL, write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.url = url or os.environ["DATABASE_URL"]
+        self._publish_conn = None
+        self._publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="socketio-publish")
+
+    def _publish_connection(self):
+        if self._publish_conn is None or self._publish_conn.closed:
+            self._publish_conn = psycopg2.connect(self.url)
+            self._publish_conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return self._publish_conn
+
+    def _publish_sync(self, payload: str):
+        spilled = len(payload.encode("utf-8")) > NOTIFY_PAYLOAD_LIMIT
+        for attempt in (1, 2):
+            try:
+                with self._publish_connection().cursor() as cur:
+                    notify_payload = payload
+                    if spilled:
+                        cur.execute("INSERT INTO socketio_messages (payload) VALUES (%s) RETURNING id", (payload,))
+                        notify_payload = f"{SPILLED_PREFIX}{cur.fetchone()[0]}"
+                    cur.execute("SELECT pg_notify(%s, %s)", (self.channel, notify_payload))
+                fanout_metrics.record_publish(spilled=spilled)
+                return
+            except psycopg2.Error as e:
+                self._publish_conn = None
+                if attempt == 2:
+                    fanout_metrics.record_publish(failed=True)
+                    print(f"❌ Failed to publish socket message: {e}")
+
+    async def _publish(self, data):
+        data["sent_at"] = time.time()
+        payload = json.dumps(data, default=str)
+        await asyncio.get_running_loop().run_in_executor(self._publisher, self._publish_sync, payload)
+
+    async def _listen(self):
+        import asyncpg
+
+        while True:
+            conn = None
+            try:
+                queue: asyncio.Queue = asyncio.Queue()
+                conn = await asyncpg.connect(self.url)
+                await conn.add_listener(self.channel, lambda *args: queue.put_nowait(args[-1]))
+                while True:
+                    payload = await queue.get()
+                    if payload.startswith(SPILLED_PREFIX):
+                        payload = await conn.fetchval(
+                            "SELECT payload FROM socketio_messages WHERE id = $1",
+                            int(payload[len(SPILLED_PREFIX):]),
+                        )
+                        if payload is None:
+                            continue
+                    yield payload
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Socket message listener failed, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                if conn is not None:
+                    try:
+                        await conn.close()
+                    except Exception:
+                        pass
+
+
+def create_client_manager():
+    if MESSAGE_QUEUE_URL.startswith(("redis://", "rediss://")):
+        try:
+            return MeteredRedisManager(MESSAGE_QUEUE_URL, channel=CHANNEL)
+        except RuntimeError as e:
+            print(f"❌ Redis message queue unavailable, falling back to Postgres: {e}")
+            return PostgresPubSubManager()
+    if MESSAGE_QUEUE_URL.startswith("postgres"):
+        url = MESSAGE_QUEUE_URL if "://" in MESSAGE_QUEUE_URL else None
+        return PostgresPubSubManager(url)
+    return MeteredManager()
+
+
+def prune_spilled_messages():
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM socketio_messages WHERE created_at < now() - interval '5 minutes'"))
+
+
+class PresenceRegistry:
+    """Which users have a socket open, shared by all workers.
+
+    Each worker keeps its own sockets in memory and mirrors them to
+    socket_presence under its host id. A worker refreshes its row in
+    socket_hosts on a heartbeat; rows of workers that stopped beating are
+    ignored and later pruned.
+    """
+
+    def __init__(self):
+        self.host_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._local: Dict[str, Set[str]] = defaultdict(set)
+
+    async def _execute(self, statement: str, params: dict):
+        if AsyncSessionLocal is None:
+            return None
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(text(statement), params)
+                await db.commit()
+                return result
+        except Exception as e:
+            print(f"❌ Presence registry update failed: {e}")
+            return None
+
+    async def add(self, user_id: str, sid: str):
+        with self._lock:
+            if sid in self._local[user_id]:
+                return
+            self._local[user_id].add(sid)
+        await self._execute(
+            """
+            INSERT INTO socket_presence (sid, user_id, host_id)
+            VALUES (:sid, :user_id, :host_id)
+            ON CONFLICT (sid) DO UPDATE SET user_id = EXCLUDED.user_id, host_id = EXCLUDED.host_id
+            """,
+            {"sid": sid, "user_id": user_id, "host_id": self.host_id},
+        )
+
+    async def remove(self, user_id: str, sid: str):
+        with self._lock:
+            sids = self._local.get(user_id)
+            if not sids or sid not in sids:
+                return
+            sids.discard(sid)
+            if not sids:
+                del self._local[user_id]
+        await self._execute("DELETE FROM socket_presence WHERE sid = :sid", {"sid": sid})
+
+    def local_user_ids(self) -> Set[str]:
+        with self._lock:
+            return set(self._local)
+
+    async def online_user_ids(self) -> Set[str]:
+        result = await self._execute(
+            """
+            SELECT DISTINCT p.user_id
+            FROM socket_presence p
+            JOIN socket_hosts h ON h.host_id = p.host_id
+            WHERE h.last_seen > now() - make_interval(secs => :ttl)
+            """,
+            {"ttl": PRESENCE_TTL_SECONDS},
+        )
+        if result is None:
+            return self.local_user_ids()
+        return {row[0] for row in result}
+
+    async def is_online(self, user_id: str) -> bool:
+        if user_id in self.local_user_ids():
+            return True
+        return user_id in await self.online_user_ids()
+
+    def heartbeat(self):
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("""
+                        INSERT INTO socket_hosts (host_id, last_seen) VALUES (:host_id, now())
+                        ON CONFLICT (host_id) DO UPDATE SET last_seen = now()
+                    """),
+                    {"host_id": self.host_id},
+                )
+        except Exception as e:
+            print(f"❌ Presence heartbeat failed: {e}")
+
+    def prune(self):
+        # Workers that died without cleaning up leave rows behind
+        with engine.begin() as conn:
+            conn.execute(
+                text("""
+                    DELETE FROM socket_hosts
+                    WHERE last_seen < now() - make_interval(secs => :ttl * 4)
+                """),
+                {"ttl": PRESENCE_TTL_SECONDS},
+            )
+            conn.execute(text("""
+                DELETE FROM socket_presence p
+                WHERE NOT EXISTS (SELECT 1 FROM socket_hosts h WHERE h.host_id = p.host_id)
+            """))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "host_id": self.host_id,
+                "local_users": len(self._local),
+                "local_sockets": sum(len(sids) for sids in self._local.values()),
+            }
+
+
+presence = PresenceRegistry()
@@ -0,0 +1,159 @@
+import asyncio
+import codecs
+import csv
+import os
+import threading
+from dataclasses import dataclass
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator, List, Optional
+
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Rows handed to the caller at a time; each batch is one commit
+CHUNK_ROWS = int(os.getenv("SPREADSHEET_CHUNK_ROWS", "1000"))
+# Batches read ahead of the caller, which bounds the memory in use
+READ_AHEAD_BATCHES = 2
+
+SUPPORTED_EXTENSIONS = (".xlsx", ".csv")
+
+_DONE = object()
+
+
+class SpreadsheetError(ValueError):
+    """The file cannot be ingested; the message is shown to the user."""
+
+
+@dataclass
+class RowBatch:
+    # Sheet row of each row in frame (the header is row 1)
+    row_numbers: List[int]
+    frame: pd.DataFrame
+
+    @property
+    def first_row_number(self) -> int:
+        return self.row_numbers[0]
+
+
+def _open_rows(file: BinaryIO, filename: str) -> Iterator[tuple]:
+    name = filename.lower()
+    if name.endswith(".csv"):
+        # utf-8-sig drops the BOM Excel puts at the start of CSV exports
+        text = codecs.getreader("utf-8-sig")(file)
+        for row in csv.reader(text):
+            yield tuple(row)
+        return
+    if not name.endswith(".xlsx"):
+        raise SpreadsheetError("יש להעלות קובץ בפורמט ‎.xlsx או ‎.csv בלבד")
+
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except Exception as e:
+        raise SpreadsheetError(f"לא ניתן לקרוא את קובץ האקסל: {e}")
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _columns(header: tuple) -> List[Optional[str]]:
+    # Unnamed columns are dropped, like pandas' "Unnamed: n" columns were
+    return [str(cell).strip() if cell is not None and str(cell).strip() else None for cell in header]
+
+
+def _is_blank(row: tuple) -> bool:
+    return all(cell is None or (isinstance(cell, str) and not cell.strip()) for cell in row)
+
+
+def _frame(columns: List[Optional[str]], rows: List[tuple]) -> pd.DataFrame:
+    kept = [index for index, name in enumerate(columns) if name]
+    data = {
+        columns[index]: [row[index] if index < len(row) else None for row in rows]
+        for index in kept
+    }
+    frame = pd.DataFrame(data, dtype=object)
+    # CSV cells are strings; empty ones count as missing like in a sheet
+    return frame.where(frame != "", None)
+
+
+def read_row_batches(
+    file: BinaryIO,
+    filename: str,
+    required_columns: Iterable[str] = (),
+    chunk_rows: int = CHUNK_ROWS,
+) -> Iterator[RowBatch]:
+    """Read a .xlsx or .csv upload a batch at a time.
+
+    Workbooks are opened in openpyxl's read-only mode, so neither format
+    is loaded whole. Fully blank rows are skipped.
+    """
+    rows = _open_rows(file, filename)
+    header = next(rows, None)
+    if header is None:
+        raise SpreadsheetError("הקובץ ריק")
+
+    columns = _columns(header)
+    missing_columns = set(required_columns) - set(filter(None, columns))
+    if missing_columns:
+        raise SpreadsheetError(f"חסרות עמודות חובה בקובץ: {', '.join(sorted(missing_columns))}.")
+
+    batch: List[tuple] = []
+    row_numbers: List[int] = []
+    for row_number, row in enumerate(rows, start=2):
+        if _is_blank(row):
+            continue
+        batch.append(row)
+        row_numbers.append(row_number)
+        if len(batch) >= chunk_rows:
+            yield RowBatch(row_numbers, _frame(columns, batch))
+            batch, row_numbers = [], []
+    if batch:
+        yield RowBatch(row_numbers, _frame(columns, batch))
+
+
+async def iter_row_batches(
+    file: BinaryIO,
+    filename: str,
+    required_columns: Iterable[str] = (),
+    chunk_rows: int = CHUNK_ROWS,
+) -> AsyncIterator[RowBatch]:
+    """read_row_batches on a worker thread, consumed from the event loop.
+
+    The reader runs at most READ_AHEAD_BATCHES ahead; errors raised while
+    reading (including SpreadsheetError) are raised here.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=READ_AHEAD_BATCHES)
+    stopped = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for batch in read_row_batches(file, filename, required_columns, chunk_rows):
+                if stopped.is_set():
+                    return
+                put(batch)
+            put(_DONE)
+        except Exception as e:
+            if not stopped.is_set():
+                put(e)
+
+    loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Let a reader waiting on the full queue finish and see the stop
+        stopped.set()
+        while not queue.empty():
+            queue.get_nowait()
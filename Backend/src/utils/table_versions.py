@@ -0,0 +1,93 @@
+import threading
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Tables written in the current transaction, published once it commits
+_WRITTEN_KEY = "table_versions_written_tables"
+
+# The table_changes_notify triggers (see schema_upgrades) NOTIFY this channel
+# with the table name after any statement that writes one of these tables,
+# whichever worker, job or client made it
+TABLE_CHANGES_CHANNEL = "table_changes"
+NOTIFIED_TABLES = ("rides", "vehicles", "no_show_events", "users", "departments")
+
+
+class TableVersions:
+    """Per-table counters bumped after every commit that wrote the table.
+
+    In-process caches remember the versions of the tables they were built
+    from and compare them on read, so a write never has to know which
+    caches depend on it. Only ORM flushes and ORM update/delete statements
+    on this process are seen directly; writes to NOTIFIED_TABLES made
+    anywhere else arrive through bump_notified_tables.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self.bumps = 0
+
+    def get(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def get_many(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+    def bump(self, tables: Iterable[str]):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+                self.bumps += 1
+
+
+table_versions = TableVersions()
+
+
+def bump_notified_tables(tables: Iterable[str]):
+    """on_notify callback for TABLE_CHANGES_CHANNEL."""
+    table_versions.bump(set(tables) & set(NOTIFIED_TABLES))
+
+
+def bump_all_notified_tables():
+    # Notifications sent while the listener was disconnected are lost
+    table_versions.bump(NOTIFIED_TABLES)
+
+
+def _remember_tables(session: Session, tables: Iterable[str]):
+    session.info.setdefault(_WRITTEN_KEY, set()).update(tables)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_tables(session, flush_context):
+    tables = {
+        obj.__table__.name
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if hasattr(obj, "__table__")
+    }
+    if tables:
+        _remember_tables(session, tables)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_write_tables(orm_execute_state):
+    # query(...).update() / .delete() and update()/delete() statements
+    # bypass the flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _remember_tables(orm_execute_state.session, {table.name})
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed_tables(session):
+    tables = session.info.pop(_WRITTEN_KEY, None)
+    if tables:
+        table_versions.bump(tables)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_tables(session):
+    session.info.pop(_WRITTEN_KEY, None)
@@ -10,3 +10,20 @@ def is_time_in_blocked_window(start_datetime: datetime) -> bool:
     blocked_end = time(13, 0)
     
     return blocked_start <= local_time <= blocked_end
+
+
+# Ride, block and lease timestamps are stored without a timezone and hold
+# wall-clock time in this zone; the schedulers run in it as well
+SCHEDULER_TIMEZONE = pytz.timezone("Asia/Jerusalem")
+
+
+def scheduler_now() -> datetime:
+    """Current wall-clock time in SCHEDULER_TIMEZONE, without tzinfo."""
+    return datetime.now(SCHEDULER_TIMEZONE).replace(tzinfo=None)
+
+
+def to_scheduler_time(value: datetime) -> datetime:
+    """Naive wall-clock time in SCHEDULER_TIMEZONE; naive values are already that."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(SCHEDULER_TIMEZONE).replace(tzinfo=None)
+    return value
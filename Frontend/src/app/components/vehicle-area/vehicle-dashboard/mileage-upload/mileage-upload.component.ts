@@ -1,6 +1,9 @@
 import { Component, Input } from '@angular/core';
 import { CommonModule } from '@angular/common';
 import { VehicleService } from '../../../../services/vehicle.service';
+import { SocketService } from '../../../../services/socket.service';
+import { Subscription } from 'rxjs';
+import { filter } from 'rxjs/operators';
 
 @Component({
   selector: 'app-mileage-upload',
@@ -17,8 +20,13 @@ export class MileageUploadComponent {
   uploadSuccess = false;
   uploadError: string | null = null;
   uploadSummary: { vehiclesUpdated: number; warnings: string[] } | null = null;
+  uploadProgress: { rows: number; updated: number; errors: number } | null = null;
+  private progressSub?: Subscription;
 
-  constructor(private vehicleService: VehicleService) {}
+  constructor(
+    private vehicleService: VehicleService,
+    private socketService: SocketService
+  ) {}
 
   onFileSelected(event: Event) {
   this.resetUploadState();
@@ -43,8 +51,8 @@ onChooseFileClick(fileInput: HTMLInputElement): void {
 }
 
 const fileName = this.selectedFile.name.toLowerCase();
-if (!fileName.endsWith('.xlsx')) {
-  this.uploadError = 'יש להעלות קובץ אקסל בפורמט ‎.xlsx בלבד';
+if (!fileName.endsWith('.xlsx') && !fileName.endsWith('.csv')) {
+  this.uploadError = 'יש להעלות קובץ בפורמט ‎.xlsx או ‎.csv בלבד';
   return;
 }
 
@@ -59,8 +67,21 @@ if (this.selectedFile.size > maxMB * 1024 * 1024) {
     this.uploadError = null;
     this.uploadSuccess = false;
     this.uploadSummary = null;
-
-    this.vehicleService.uploadMileageReport(this.selectedFile).subscribe({
+    this.uploadProgress = null;
+
+    const uploadId = crypto.randomUUID();
+    this.progressSub?.unsubscribe();
+    this.progressSub = this.socketService.uploadProgress$
+      .pipe(filter((progress: any) => progress?.upload_id === uploadId))
+      .subscribe((progress: any) => {
+        this.uploadProgress = {
+          rows: progress.rows,
+          updated: progress.updated,
+          errors: progress.errors,
+        };
+      });
+
+    this.vehicleService.uploadMileageReport(this.selectedFile, uploadId).subscribe({
       next: (response: any) => {
   this.uploadSuccess = true;
 
@@ -82,6 +103,8 @@ if (this.selectedFile.size > maxMB * 1024 * 1024) {
       complete: () => {
         this.isLoading = false;
         this.selectedFile = null;
+        this.uploadProgress = null;
+        this.progressSub?.unsubscribe();
       },
     });
   }
@@ -90,6 +113,7 @@ if (this.selectedFile.size > maxMB * 1024 * 1024) {
   this.uploadError = null;
   this.uploadSuccess = false;
   this.uploadSummary = null;
+  this.uploadProgress = null;
   this.isLoading = false;
 }
 
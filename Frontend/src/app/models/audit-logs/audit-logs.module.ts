@@ -9,6 +9,23 @@ export interface AuditLogs {
   changed_by: string;
 }
 
+export interface AuditLogsPage {
+  items: AuditLogs[];
+  next_cursor: string | null;
+}
+
+export interface AuditLogsPageQuery {
+  limit?: number;
+  cursor?: string | null;
+  fromDate?: string;
+  toDate?: string;
+  problematicOnly?: boolean;
+  entityType?: string;
+  action?: string;
+  changedBy?: string;
+  q?: string;
+}
+
 export interface UpdateChangeData {
   new: Record<string, any>;
   old: Record<string, any>;
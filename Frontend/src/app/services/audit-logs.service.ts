@@ -1,13 +1,18 @@
 import { Injectable } from '@angular/core';
 import { HttpClient, HttpHeaders, HttpParams } from '@angular/common/http';
 import { Observable } from 'rxjs';
-import { AuditLogs } from '../models/audit-logs/audit-logs.module';
+import {
+  AuditLogs,
+  AuditLogsPage,
+  AuditLogsPageQuery,
+} from '../models/audit-logs/audit-logs.module';
 import { environment } from '../../environments/environment';
 @Injectable({
   providedIn: 'root',
 })
 export class AuditLogsService {
   private apiUrl = environment.allAuditLogsUrl;
+  private pageUrl = environment.auditLogsPageUrl;
   private departmentsUrl = environment.departmentsUrl;
   private usersUrl = environment.usersUrl;
 
@@ -31,6 +36,27 @@ export class AuditLogsService {
     return this.http.get<AuditLogs[]>(this.apiUrl, { headers, params });
   }
 
+  // Newest first; pass the returned next_cursor back to load the next page
+  getAuditLogsPage(query: AuditLogsPageQuery = {}): Observable<AuditLogsPage> {
+    const token = localStorage.getItem('token');
+    const headers = new HttpHeaders({
+      Authorization: `Bearer ${token}`,
+    });
+
+    let params = new HttpParams();
+    if (query.limit) params = params.set('limit', query.limit.toString());
+    if (query.cursor) params = params.set('cursor', query.cursor);
+    if (query.fromDate) params = params.set('from_date', query.fromDate);
+    if (query.toDate) params = params.set('to_date', query.toDate);
+    if (query.entityType) params = params.set('entity_type', query.entityType);
+    if (query.action) params = params.set('action', query.action);
+    if (query.changedBy) params = params.set('changed_by', query.changedBy);
+    if (query.q) params = params.set('q', query.q);
+
+    params = params.set('problematicOnly', (query.problematicOnly ?? false).toString());
+    return this.http.get<AuditLogsPage>(this.pageUrl, { headers, params });
+  }
+
   getDepartments(): Observable<any[]> {
     return this.http.get<any[]>(this.departmentsUrl);
   }
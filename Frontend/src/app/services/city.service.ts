@@ -24,4 +24,9 @@ export class CityService {
     const url = `${this.apiUrl}/cityname`;
     return this.http.get<CityDropdown>(url, { params: { id } });
   }
+
+  searchCities(q: string, limit = 10) {
+    const url = `${this.apiUrl}/cities/search`;
+    return this.http.get<CityDropdown[]>(url, { params: { q, limit } });
+  }
 }
@@ -40,6 +40,7 @@ export class SocketService {
   );
 
   public vehicleMileageUpdated$ = new BehaviorSubject<any>(null);
+  public uploadProgress$ = new Subject<any>();
 
   private readonly SOCKET_URL = environment.socketUrl;
 
@@ -115,6 +116,14 @@ export class SocketService {
   private listenToEvents(): void {
     if (!this.socket) return;
 
+    // The server coalesces events sent to the same rooms into one frame of
+    // [event, data] pairs; hand each one to its regular listener, in order
+    this.socket.on('batch', (frames: [string, any][]) => {
+      for (const [event, data] of frames) {
+        this.socket?.listeners(event).forEach((listener: (...args: any[]) => void) => listener(data));
+      }
+    });
+
     this.socket.on('order_updated', (data: any) => {
       this.orderUpdated$.next(data);
     });
@@ -135,7 +144,7 @@ export class SocketService {
       this.deleteRequests$.next(data);
     });
 
-    this.socket.on('new_notification', (data: any) => {
+    const onNotification = (data: any) => {
       const userId = localStorage.getItem('employee_id');
 
       if (
@@ -145,12 +154,23 @@ export class SocketService {
       ) {
         this.notifications$.next(data);
       }
+    };
+
+    this.socket.on('new_notification', onNotification);
+
+    // The server groups several notifications for the same room into one event
+    this.socket.on('new_notification_batch', (batch: any[]) => {
+      batch.forEach(onNotification);
     });
 
     this.socket.on('vehicle_expiry_notification', (data: any) => {
       this.vehicleExpiry$.next(data);
     });
 
+    this.socket.on('vehicle_expiry_notification_batch', (batch: any[]) => {
+      batch.forEach((data) => this.vehicleExpiry$.next(data));
+    });
+
     this.socket.on('new_odometer_notification', (data: any) => {
       this.odometerNotif$.next(data);
     });
@@ -193,6 +213,9 @@ export class SocketService {
     this.socket.on('audit_log_updated', (data: any) => {
       this.auditLogs$.next(data);
     });
+    this.socket.on('upload_progress', (data: any) => {
+      this.uploadProgress$.next(data);
+    });
 
     this.socket.on('new_vehicle_created', (data: any) => {
       this.newVehicle$.next(data);
@@ -223,9 +223,12 @@ export class VehicleService {
   //   return this.http.delete(`${this.apiUrl}/vehicles/${vehicleId}/permanent`);
   // }
 
-  uploadMileageReport(file: File): Observable<any> {
+  uploadMileageReport(file: File, uploadId?: string): Observable<any> {
     const formData = new FormData();
     formData.append('file', file);
+    if (uploadId) {
+      formData.append('upload_id', uploadId);
+    }
 
     return this.http.post(
       `${this.apiUrl}/admin/vehicles/mileage/upload`,
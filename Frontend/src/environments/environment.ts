@@ -23,6 +23,7 @@ export const environment = {
   latestRequirementURL: 'http://localhost:8000/api/latest-requirement',
   addReqConfirmationURL: 'http://localhost:8000/api/confirm-requirements',
   allAuditLogsUrl: 'http://localhost:8000/api/all-audit-logs',
+  auditLogsPageUrl: 'http://localhost:8000/api/audit-logs',
   departmentsUrl: 'http://localhost:8000/api/departments',
   usersUrl: 'http://localhost:8000/api/users',
   getRequirementsUrl: 'http://localhost:8000/api/get-requirements',